@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError, as_completed
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from app.jobs import run_detection
+from ml.cost_io import CHUNK_ROWS
+from ml.detect import DetectConfig
+
+DONE, FAILED, TIMEOUT = "done", "failed", "timeout"
+
+def save_uploads(uploads: List[Tuple[str, IO[bytes]]], work_dir: str) -> Dict[str, str]:
+    # one tenant per uploaded file, named after the file without its extension
+    tenants: Dict[str, str] = {}
+    for i, (filename, upload) in enumerate(uploads):
+        tenant = os.path.splitext(os.path.basename(filename or ""))[0] or f"tenant-{i}"
+        if tenant in tenants:
+            raise ValueError(f"Duplicate tenant file name: {tenant}")
+        tenants[tenant] = os.path.join(work_dir, f"tenant-{i}.csv")
+        upload.seek(0)
+        with open(tenants[tenant], "wb") as out:
+            shutil.copyfileobj(upload, out, 1 << 20)
+    return tenants
+
+def split_by_tenant(upload: IO[bytes], column: str, work_dir: str,
+                    chunksize: int = CHUNK_ROWS) -> Dict[str, str]:
+    # stream one CSV with a tenant column into a CSV per tenant; parsing and validation of the
+    # cost columns is left to the workers so a bad tenant only fails itself
+    tenants: Dict[str, str] = {}
+    upload.seek(0)
+    with pd.read_csv(upload, chunksize=chunksize, dtype=str, keep_default_na=False) as reader:
+        for chunk in reader:
+            cols = {c.lower().strip(): c for c in chunk.columns}
+            if column.lower() not in cols:
+                raise ValueError(f"CSV has no tenant column '{column}'.")
+            key = cols[column.lower()]
+            for tenant, rows in chunk.groupby(key, sort=False):
+                path = tenants.get(tenant)
+                if path is None:
+                    path = tenants[tenant] = os.path.join(work_dir, f"tenant-{len(tenants)}.csv")
+                rows.drop(columns=[key]).to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+    return tenants
+
+class BatchRunner:
+    # fans tenants out over a worker pool and yields each tenant's result as soon as it finishes;
+    # tenants still running when the batch deadline passes are reported as timed out
+    def __init__(self, max_workers: Optional[int] = None, executor: str = "process",
+                 timeout: Optional[float] = None,
+                 runner: Callable[..., Dict[str, Any]] = run_detection):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = executor
+        self.timeout = timeout
+        self.runner = runner
+        self._pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "BatchRunner":
+        return cls(
+            max_workers=int(os.environ.get("BATCH_WORKERS", "0")) or None,
+            executor=os.environ.get("BATCH_EXECUTOR", "process"),
+            timeout=float(os.environ.get("BATCH_TIMEOUT_SECONDS", "0")) or None,
+        )
+
+    def pool(self) -> Executor:
+        # created on first batch so idle API workers do not hold a pool of processes
+        with self._lock:
+            if self._pool is None:
+                if self.executor == "process":
+                    self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+                else:
+                    self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="batch-tenant")
+            return self._pool
+
+    def run(self, tenants: Dict[str, str], cfg: DetectConfig = DetectConfig(),
+            work_dir: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        # yields one line per tenant in completion order, then a batch summary; removes work_dir
+        started = time.time()
+        futures = {}
+        counts = {DONE: 0, FAILED: 0, TIMEOUT: 0}
+        try:
+            for tenant, path in tenants.items():
+                futures[self.pool().submit(self.runner, path, cfg)] = tenant
+            pending = set(futures)
+            try:
+                for future in as_completed(futures, timeout=self.timeout):
+                    pending.discard(future)
+                    tenant = futures[future]
+                    line: Dict[str, Any] = {"tenant": tenant, "seconds": round(time.time() - started, 3)}
+                    error = future.exception()
+                    if error is not None:
+                        line.update(status=FAILED, error=str(error))
+                        if isinstance(error, BrokenExecutor):
+                            # a worker died (e.g. OOM-killed); start a fresh pool for the next batch
+                            self.shutdown()
+                    else:
+                        line.update(status=DONE, result=future.result())
+                    counts[line["status"]] += 1
+                    yield line
+            except TimeoutError:
+                for future in pending:
+                    future.cancel()
+                    counts[TIMEOUT] += 1
+                    yield {"tenant": futures[future], "status": TIMEOUT,
+                           "error": f"Not finished after {self.timeout:g}s."}
+            yield {"batch": {"tenants": len(tenants), **counts, "seconds": round(time.time() - started, 3)}}
+        finally:
+            for future in futures:
+                future.cancel()
+            if work_dir is not None:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import IO, Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+def content_digest(upload: IO[bytes], chunk_size: int = 1 << 20) -> str:
+    # hash of the upload bytes, read in chunks and rewound afterwards
+    h = hashlib.sha256()
+    upload.seek(0)
+    for chunk in iter(lambda: upload.read(chunk_size), b""):
+        h.update(chunk)
+    upload.seek(0)
+    return h.hexdigest()
+
+def result_key(digest: str, cfg: Any, *extra: Any) -> str:
+    params = json.dumps([asdict(cfg), *extra], sort_keys=True, default=str)
+    return hashlib.sha256(f"{digest}|{params}".encode("utf-8")).hexdigest()
+
+def entry_size(value: Any) -> int:
+    return int(value.memory_usage(deep=True).sum()) if isinstance(value, pd.DataFrame) else int(value.nbytes)
+
+class ResultCache:
+    # LRU over scored frames, bounded by total frame memory, entries expire after ttl seconds
+    def __init__(self, max_bytes: int = 512 << 20, ttl: Optional[float] = 900.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _drop(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.time() - entry[2] > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, scored: Any, size: Optional[int] = None) -> Any:
+        # DataFrames are sized by pandas; compact frames (CostFrame) report their own nbytes;
+        # composite entries pass their size
+        if size is None:
+            size = entry_size(scored)
+        if size > self.max_bytes:
+            return scored
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (scored, size, time.time())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return scored
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import IO, Any, Callable, Dict, Optional
+
+from app.serialize import detect_body
+from ml.cost_io import read_cost_frame
+from ml.detect import DetectConfig, detect_spikes, explain_anomalies
+from ml.model import ModelStore
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+class JobQueueFull(Exception):
+    pass
+
+_STORE: Optional[ModelStore] = None
+
+def run_detection(path: str, cfg: DetectConfig = DetectConfig()) -> Dict[str, Any]:
+    # read_cost_frame -> detect_spikes -> explain_anomalies, in a pool worker
+    global _STORE
+    if _STORE is None:
+        _STORE = ModelStore.from_env()
+    scored = detect_spikes(read_cost_frame(path), cfg, store=_STORE)
+    return detect_body(scored, explanation=explain_anomalies(scored))
+
+@dataclass
+class Job:
+    id: str
+    path: str
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    future: Optional[Future] = None
+
+    def to_dict(self, with_result: bool = True) -> Dict[str, Any]:
+        out = {"job_id": self.id, "status": self.status, "created_at": self.created_at, "finished_at": self.finished_at}
+        if self.error is not None:
+            out["error"] = self.error
+        if with_result and self.result is not None:
+            out["result"] = self.result
+        return out
+
+class JobManager:
+    # bounded pool + bounded backlog; finished jobs are kept (LRU) so results can be fetched
+    def __init__(self, max_workers: int = 2, max_pending: int = 16, keep_finished: int = 256,
+                 executor: str = "process", runner: Callable[[str], Dict[str, Any]] = run_detection,
+                 work_dir: Optional[str] = None):
+        self.max_pending = max_pending
+        self.keep_finished = keep_finished
+        self.runner = runner
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix="cost-spike-jobs-")
+        self.max_workers = max_workers
+        self.executor = executor
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool: Optional[Executor] = None
+
+    def pool(self) -> Executor:
+        # created on first submit: nothing is started at import, so a pre-forking server
+        # (gunicorn --preload) never shares pool pipes or threads between its workers
+        with self._lock:
+            if self._pool is None:
+                if self.executor == "process":
+                    self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+                else:
+                    self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="detect-job")
+            return self._pool
+
+    @classmethod
+    def from_env(cls) -> "JobManager":
+        return cls(
+            max_workers=int(os.environ.get("JOB_WORKERS", "2")),
+            max_pending=int(os.environ.get("JOB_MAX_PENDING", "16")),
+            executor=os.environ.get("JOB_EXECUTOR", "process"),
+        )
+
+    def active(self) -> int:
+        return sum(1 for j in self._jobs.values() if j.status in (QUEUED, RUNNING))
+
+    def submit(self, upload: IO[bytes]) -> Job:
+        with self._lock:
+            if self.active() >= self.max_pending:
+                raise JobQueueFull(f"{self.max_pending} jobs already queued or running.")
+            job = Job(id=uuid.uuid4().hex, path="")
+            job.path = os.path.join(self.work_dir, f"{job.id}.csv")
+            self._jobs[job.id] = job
+        try:
+            with open(job.path, "wb") as out:
+                shutil.copyfileobj(upload, out, 1 << 20)
+        except Exception:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise
+        job.future = self.pool().submit(self.runner, job.path)
+        job.future.add_done_callback(lambda f, job=job: self._finish(job, f))
+        return job
+
+    def _finish(self, job: Job, future: Future) -> None:
+        with self._lock:
+            if job.status != CANCELLED:
+                if future.cancelled():
+                    job.status = CANCELLED
+                elif future.exception() is not None:
+                    job.status, job.error = FAILED, str(future.exception())
+                else:
+                    job.status, job.result = DONE, future.result()
+            job.finished_at = job.finished_at or time.time()
+            if os.path.exists(job.path):
+                os.remove(job.path)
+            finished = [k for k, j in self._jobs.items() if j.finished_at is not None]
+            for k in finished[: max(0, len(finished) - self.keep_finished)]:
+                del self._jobs[k]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status == QUEUED and job.future is not None and job.future.running():
+                job.status = RUNNING
+            return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished_at is not None:
+                return job
+            # a queued job never starts; a running one finishes in the pool but its result is dropped
+            job.status = CANCELLED
+            job.finished_at = time.time()
+        if job.future is not None:
+            job.future.cancel()
+        return job
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
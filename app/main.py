@@ -1,55 +1,411 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import json
+import os
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Any, List, Literal, Optional, Tuple, Union
+
+from fastapi import FastAPI, UploadFile, File, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+import numpy as np
 import pandas as pd
 
-from app.schemas import DetectResponse, AnomalyPoint
-from ml.cost_io import load_cost_csv
-from ml.detect import detect_spikes, explain_anomalies
+from app.batch import BatchRunner, save_uploads, split_by_tenant
+from app.cache import ResultCache, content_digest, entry_size, result_key
+from app.jobs import JobManager, JobQueueFull
+from app import warmup
+from app.schemas import DetectResponse, ModelInfo
+from app.serialize import (
+    ARROW, COLUMNAR, MEDIA_TYPES, NDJSON,
+    arrow_bytes, columnar_body, detect_body, iter_ndjson, negotiate,
+)
+from ml.cost_io import COST_DTYPE, read_cost_frame
+from ml.cube import CostCube
+from ml.frame import CostFrame
+from ml import instrument
+from ml.detect import DetectConfig, detect_spikes, explain_anomalies, fit
+from ml.forecast import ForecastConfig, forecast_body, forecast_costs
+from ml.model import ModelStore
+from ml.rank import Ranking, query, rank_anomalies
+from ml.rollup import DEFAULT_HIERARCHY, build_rollup, detect_rollup, rollup_body
+from ml.shard import SHARD_POOL, SHARD_TIMEOUT_SECONDS, detect_spikes_sharded
+from ml.store import CostStore, detect_range
+from ml.stream import StreamingDetector, state_lock
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup.warm_up_in_background(MODEL_STORE)
+    yield
+    JOBS.shutdown()
+    BATCH.shutdown()
+    SHARD_POOL.shutdown()
+
+Method = Literal["iforest", "mad", "ewma"]
+SortBy = Literal["impact", "anomaly_score", "cost", "date"]
+ForecastMethod = Literal["holt", "seasonal_naive"]
+# scored results are CostFrames, except sharded runs which come back as DataFrames
+Scored = Union[pd.DataFrame, CostFrame]
+
+app = FastAPI(title="Cloud Cost Spike Detector", version="1.0.0", lifespan=lifespan)
+
+# loaded once per worker process; artifacts are shared between workers through the directory
+MODEL_STORE = ModelStore.from_env()
+DETECT_WORKERS = int(os.environ.get("DETECT_WORKERS", "0")) or None
+# SHARD_TIMEOUT_SECONDS=0 waits for every shard
+SHARD_TIMEOUT = float(os.environ.get("SHARD_TIMEOUT_SECONDS", str(SHARD_TIMEOUT_SECONDS))) or None
+JOBS = JobManager.from_env()
+BATCH = BatchRunner.from_env()
+# daily cost history loaded once via POST /store/costs (COST_STORE_PATH)
+STORE = CostStore.from_env()
+RESULTS = ResultCache(
+    max_bytes=int(os.environ.get("RESULT_CACHE_MB", "512")) << 20,
+    ttl=float(os.environ.get("RESULT_CACHE_TTL_SECONDS", "900")),
+)
+# parsed uploads registered via POST /datasets, keyed by content hash
+DATASETS = ResultCache(
+    max_bytes=int(os.environ.get("DATASET_CACHE_MB", "512")) << 20,
+    ttl=float(os.environ.get("DATASET_CACHE_TTL_SECONDS", "3600")),
+)
+# Server-Timing on every response, or only when the request sends "X-Server-Timing: 1"
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") == "1"
+# kept outside MODEL_CACHE_DIR, whose *.joblib files are all loaded as models
+STREAM_STATE_PATH = os.environ.get(
+    "STREAM_STATE_PATH", os.path.join(tempfile.gettempdir(), "cost-spike-stream-state.joblib"),
+)
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    if not instrument.ENABLED or not (SERVER_TIMING or request.headers.get("x-server-timing") == "1"):
+        return await call_next(request)
+    timings = instrument.collect_timings()
+    response = await call_next(request)
+    if timings:
+        response.headers["Server-Timing"] = instrument.server_timing(timings)
+    return response
+
+def _read_costs(file: UploadFile, cost_dtype: Any = COST_DTYPE) -> CostFrame:
+    # the multipart body is already spooled to a temp file; parse it in bounded chunks
+    file.file.seek(0)
+    return read_cost_frame(file.file, cost_dtype=cost_dtype)
+
+def _score(df: CostFrame, model_key: Optional[str], shard_by: Optional[str] = None,
+           cfg: DetectConfig = DetectConfig()) -> Scored:
+    if cfg.method != "iforest":
+        # statistical detectors have no model to look up and nothing to shard
+        return detect_spikes(df, cfg)
+    if shard_by is not None:
+        return detect_spikes_sharded(df.to_frame(), max_workers=DETECT_WORKERS, by=shard_by, shard_timeout=SHARD_TIMEOUT)
+    if model_key is None:
+        return detect_spikes(df, store=MODEL_STORE)
+    model = MODEL_STORE.get(model_key)
+    if model is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired model: {model_key}")
+    return detect_spikes(df, model=model)
+
+def _dataset(dataset_id: str) -> CostFrame:
+    df = DATASETS.get(dataset_id)
+    if df is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired dataset: {dataset_id}")
+    return df
+
+def _scored_upload(file: Optional[UploadFile], dataset_id: Optional[str],
+                   model_key: Optional[str], shard_by: Optional[str],
+                   method: str = "iforest") -> Tuple[Scored, Ranking]:
+    # /detect, /detect/summary and /detect/full share one scored frame and its anomaly
+    # ranking per (content, config); both live in one cache entry so they evict together
+    if file is None and dataset_id is None:
+        raise HTTPException(status_code=422, detail="Send a CSV file or a dataset_id.")
+    digest = dataset_id if file is None else content_digest(file.file)
+    cfg = DetectConfig(method=method)
+    key = result_key(digest, cfg, model_key, shard_by)
+    cached = RESULTS.get(key)
+    if cached is not None:
+        return cached
+    df = _dataset(dataset_id) if file is None else _read_costs(file)
+    scored = _score(df, model_key, shard_by, cfg)
+    ranking = rank_anomalies(scored)
+    # a sharded run with shards past the deadline is partial: serve it, never cache it
+    if not scored.attrs.get("unscored_services"):
+        RESULTS.put(key, (scored, ranking), size=entry_size(scored) + ranking.nbytes)
+    return scored, ranking
 
-app = FastAPI(title="Cloud Cost Spike Detector", version="1.0.0")
+def _summary(scored: Scored, ranking: Optional[Ranking] = None) -> dict:
+    return {
+        "total_rows": int(len(scored)),
+        "total_anomalies": int(scored["anomaly"].sum()),
+        "explanation": explain_anomalies(scored, ranking),
+    }
+
+def _respond(scored: Scored, accept: Optional[str], ranking: Optional[Ranking] = None,
+             **params: Any) -> Response:
+    # params are the anomaly query (top_k, sort_by, services, start, end, cursor); without any,
+    # every anomaly is returned in (service, date) order as before
+    media = negotiate(accept)
+    if media is None:
+        raise HTTPException(status_code=406, detail=f"Supported media types: {', '.join(MEDIA_TYPES)}")
+    headers = {"X-Total-Rows": str(len(scored)), "X-Total-Anomalies": str(int(scored["anomaly"].sum()))}
+    rows, extra = None, {}
+    params = {k: v for k, v in params.items() if v is not None}
+    if params:
+        rows, matched, next_cursor = query(ranking if ranking is not None else rank_anomalies(scored), **params)
+        extra = {"total_matched": matched, "next_cursor": next_cursor}
+        headers["X-Total-Matched"] = str(matched)
+        if next_cursor is not None:
+            headers["X-Next-Cursor"] = next_cursor
+    if media == NDJSON:
+        return StreamingResponse(iter_ndjson(scored, rows), media_type=NDJSON, headers=headers)
+    if media == COLUMNAR:
+        return JSONResponse(columnar_body(scored, rows, **extra), media_type=COLUMNAR, headers=headers)
+    if media == ARROW:
+        try:
+            return Response(arrow_bytes(scored, rows), media_type=ARROW, headers=headers)
+        except ImportError:
+            raise HTTPException(status_code=406, detail="Arrow output requires pyarrow on the server.")
+    return JSONResponse(detect_body(scored, rows, **extra), headers=headers)
+
+def _forecast(cf: CostFrame, method: str, horizon: int, budget: Optional[float],
+              services: Optional[List[str]], end: Optional[str], top_k: Optional[int]) -> dict:
+    # one batched forecast over the day x service cube; `end` forecasts as of an earlier day
+    cube = CostCube.from_frame(cf).slice(end=end, services=services)
+    if cube.empty:
+        raise HTTPException(status_code=404, detail="No cost history matches the services and end date.")
+    return forecast_body(forecast_costs(cube, ForecastConfig(method=method, horizon=horizon)), budget, top_k)
 
 @app.get("/health")
+@app.get("/health/live")
 def health():
+    # liveness: the process is up and serving; says nothing about warm-up
     return {"status": "ok"}
 
+@app.get("/health/ready")
+def ready():
+    state = warmup.readiness()
+    return JSONResponse(state, status_code=200 if state["status"] == warmup.READY else 503)
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(instrument.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/model/fit", response_model=ModelInfo)
+def model_fit(file: UploadFile = File(...)):
+    try:
+        df = _read_costs(file)
+        model = MODEL_STORE.put(fit(df, DetectConfig()))
+        return ModelInfo(model_key=model.key, n_train=model.n_train, fitted_at=model.fitted_at)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/detect", response_model=DetectResponse)
-async def detect(file: UploadFile = File(...)):
-    try:
-        raw = await file.read()
-        df = pd.read_csv(pd.io.common.BytesIO(raw))
-        df = load_cost_csv(df)
-        scored = detect_spikes(df)
-        anomalies = scored[scored["anomaly"]].copy()
-
-        points = []
-        for _, r in anomalies.iterrows():
-            points.append(AnomalyPoint(
-                date=r["date"].date().isoformat(),
-                service=r["service"],
-                cost=float(r["cost"]),
-                anomaly_score=float(r["anomaly_score"]),
-                cost_pct_change=float(r.get("cost_pct_change", 0.0)),
-                cost_rolling_mean_7=float(r.get("cost_rolling_mean_7")) if pd.notna(r.get("cost_rolling_mean_7")) else None,
-            ))
-        return DetectResponse(
-            anomalies=points,
-            total_rows=int(len(scored)),
-            total_anomalies=int(len(points)),
-        )
+def detect(file: Optional[UploadFile] = File(None), dataset_id: Optional[str] = None,
+           model_key: Optional[str] = None, shard_by: Optional[Literal["service", "group"]] = None,
+           method: Method = "iforest", top_k: Optional[int] = Query(None, ge=1), sort_by: Optional[SortBy] = None,
+           services: Optional[List[str]] = Query(None), start: Optional[str] = None, end: Optional[str] = None,
+           cursor: Optional[str] = None, accept: Optional[str] = Header(None)):
+    # top_k/sort_by/services/start/end/cursor select a page of anomalies, ranked server-side;
+    # pass the returned next_cursor (same sort_by and filters) for the following page
+    try:
+        scored, ranking = _scored_upload(file, dataset_id, model_key, shard_by, method)
+        return _respond(scored, accept, ranking, top_k=top_k, sort_by=sort_by, services=services,
+                        start=start, end=end, cursor=cursor)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/detect/summary")
-async def detect_summary(file: UploadFile = File(...)):
-    try:
-        raw = await file.read()
-        df = pd.read_csv(pd.io.common.BytesIO(raw))
-        df = load_cost_csv(df)
-        scored = detect_spikes(df)
-        expl = explain_anomalies(scored)
-        return {
-            "total_rows": int(len(scored)),
-            "total_anomalies": int(scored["anomaly"].sum()),
-            "explanation": expl,
-        }
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+def detect_summary(file: Optional[UploadFile] = File(None), dataset_id: Optional[str] = None,
+                   model_key: Optional[str] = None, shard_by: Optional[Literal["service", "group"]] = None,
+                   method: Method = "iforest"):
+    try:
+        return _summary(*_scored_upload(file, dataset_id, model_key, shard_by, method))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/detect/full")
+def detect_full(file: Optional[UploadFile] = File(None), dataset_id: Optional[str] = None,
+                model_key: Optional[str] = None, shard_by: Optional[Literal["service", "group"]] = None,
+                method: Method = "iforest"):
+    try:
+        scored, ranking = _scored_upload(file, dataset_id, model_key, shard_by, method)
+        return JSONResponse(detect_body(scored, explanation=explain_anomalies(scored, ranking)))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/forecast")
+def forecast(file: Optional[UploadFile] = File(None), dataset_id: Optional[str] = None,
+             method: ForecastMethod = "holt", horizon: int = Query(30, ge=1, le=366),
+             budget: Optional[float] = Query(None, gt=0), services: Optional[List[str]] = Query(None),
+             end: Optional[str] = None, top_k: Optional[int] = Query(None, ge=1)):
+    # per-service month-end and next-`horizon`-day forecasts; `budget` (monthly) adds budget risk
+    if file is None and dataset_id is None:
+        raise HTTPException(status_code=422, detail="Send a CSV file or a dataset_id.")
+    try:
+        df = _dataset(dataset_id) if file is None else _read_costs(file)
+        return _forecast(df, method, horizon, budget, services, end, top_k)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/rollup/detect")
+def rollup_detect(file: UploadFile = File(...), hierarchy: str = ",".join(DEFAULT_HIERARCHY),
+                  method: Method = "iforest", top_k: Optional[int] = Query(100, ge=1),
+                  sort_by: SortBy = "impact", cursor: Optional[str] = None):
+    # CUR-style line items with extra label columns: every level of `hierarchy` (plus the total)
+    # is aggregated in one pass, scored in one batch, and parent spikes name their driving child
+    try:
+        file.file.seek(0)
+        rollup = build_rollup(file.file, hierarchy)
+        scored = detect_rollup(rollup, DetectConfig(method=method), store=MODEL_STORE)
+        rows, matched, next_cursor = query(rank_anomalies(scored), top_k=top_k, sort_by=sort_by, cursor=cursor)
+        return JSONResponse(rollup_body(scored, rollup, rows, total_matched=matched, next_cursor=next_cursor))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/datasets")
+def create_dataset(file: UploadFile = File(...)):
+    # register an upload once; detect endpoints can then be called with ?dataset_id=. The dense
+    # cube is days x services, often larger than the upload: fetch it from /datasets/{id}/cube
+    try:
+        digest = content_digest(file.file)
+        df = DATASETS.get(digest)
+        if df is None:
+            df = DATASETS.put(digest, _read_costs(file))
+        return {"dataset_id": digest, "rows": int(len(df)), "services": int(len(df.services))}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/datasets/{dataset_id}/cube")
+def dataset_cube(dataset_id: str):
+    return CostCube.from_frame(_dataset(dataset_id)).to_dict()
+
+@app.get("/cache/stats")
+def cache_stats():
+    return RESULTS.stats()
+
+@app.post("/stream/bootstrap", response_model=ModelInfo)
+def stream_bootstrap(file: UploadFile = File(...)):
+    try:
+        df = _read_costs(file).to_frame()
+        det = StreamingDetector.bootstrap(df, DetectConfig(), store=MODEL_STORE)
+        with state_lock(STREAM_STATE_PATH):
+            det.save(STREAM_STATE_PATH)
+        return ModelInfo(model_key=det.model.key, n_train=det.model.n_train, fitted_at=det.model.fitted_at)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/stream/ingest", response_model=DetectResponse)
+def stream_ingest(file: UploadFile = File(...), accept: Optional[str] = Header(None)):
+    try:
+        df = _read_costs(file).to_frame()
+        with state_lock(STREAM_STATE_PATH):
+            det = StreamingDetector.load(STREAM_STATE_PATH, MODEL_STORE)
+            if det is None:
+                raise HTTPException(status_code=409, detail="No streaming state; call /stream/bootstrap first.")
+            scored = det.ingest(df)
+            det.save(STREAM_STATE_PATH)
+        return _respond(scored, accept)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/jobs", status_code=202)
+def create_job(file: UploadFile = File(...)):
+    file.file.seek(0)
+    try:
+        job = JOBS.submit(file.file)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return job.to_dict(with_result=False)
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job.to_dict()
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = JOBS.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job.to_dict(with_result=False)
+
+@app.post("/batch/detect")
+def batch_detect(files: Optional[List[UploadFile]] = File(None), tenant_column: Optional[str] = None,
+                 method: Method = "iforest"):
+    # one tenant per uploaded file, or one file split on ?tenant_column=; NDJSON lines are
+    # written as tenants finish, followed by a {"batch": {...}} summary line
+    if not files or (tenant_column is not None and len(files) != 1):
+        raise HTTPException(status_code=422, detail="Send tenant CSV files, or one file with ?tenant_column=.")
+    work_dir = tempfile.mkdtemp(prefix="cost-spike-batch-")
+    try:
+        if tenant_column is None:
+            tenants = save_uploads([(f.filename, f.file) for f in files], work_dir)
+        else:
+            tenants = split_by_tenant(files[0].file, tenant_column, work_dir)
+    except Exception as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    lines = (json.dumps(line) + "\n" for line in BATCH.run(tenants, DetectConfig(method=method), work_dir))
+    return StreamingResponse(lines, media_type=NDJSON, headers={"X-Total-Tenants": str(len(tenants))})
+
+@app.post("/store/costs")
+def store_costs(file: UploadFile = File(...), replace: bool = False):
+    # append-only by default: (date, service) days already stored are skipped, not overwritten
+    try:
+        # parsed and summed in float64: the store keeps exact cents, reads downcast for scoring
+        loaded = STORE.load(_read_costs(file, np.float64), replace=replace)
+        return {**loaded, "store": STORE.stats()}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/store/stats")
+def store_stats():
+    return STORE.stats()
+
+def _stored_scored(start: Optional[str], end: Optional[str], services: Optional[List[str]], method: str) -> CostFrame:
+    scored = detect_range(STORE, start, end, services, DetectConfig(method=method), models=MODEL_STORE)
+    if len(scored) == 0:
+        raise HTTPException(status_code=404, detail="No stored costs match the range and services.")
+    return scored
+
+@app.get("/store/detect", response_model=DetectResponse)
+def store_detect(start: Optional[str] = None, end: Optional[str] = None, services: Optional[List[str]] = Query(None),
+                 method: Method = "iforest", top_k: Optional[int] = Query(None, ge=1),
+                 sort_by: Optional[SortBy] = None, cursor: Optional[str] = None,
+                 accept: Optional[str] = Header(None)):
+    # start/end/services already bound the read; top_k, sort_by and cursor page the anomalies
+    try:
+        return _respond(_stored_scored(start, end, services, method), accept, top_k=top_k, sort_by=sort_by, cursor=cursor)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/store/detect/summary")
+def store_detect_summary(start: Optional[str] = None, end: Optional[str] = None,
+                         services: Optional[List[str]] = Query(None), method: Method = "iforest"):
+    try:
+        return _summary(_stored_scored(start, end, services, method))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/store/forecast")
+def store_forecast(end: Optional[str] = None, services: Optional[List[str]] = Query(None),
+                   method: ForecastMethod = "holt", horizon: int = Query(30, ge=1, le=366),
+                   budget: Optional[float] = Query(None, gt=0), top_k: Optional[int] = Query(None, ge=1)):
+    try:
+        return _forecast(STORE.read(None, end, services), method, horizon, budget, None, None, top_k)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
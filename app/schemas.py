@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import List, Optional
 
 class AnomalyPoint(BaseModel):
@@ -8,8 +8,20 @@ class AnomalyPoint(BaseModel):
     anomaly_score: float
     cost_pct_change: float
     cost_rolling_mean_7: Optional[float] = None
+    estimated_impact: Optional[float] = None
 
 class DetectResponse(BaseModel):
     anomalies: List[AnomalyPoint]
     total_rows: int
-    total_anomalies: int
\ No newline at end of file
+    total_anomalies: int
+    unscored_services: List[str] = []
+    # set when the request filters or pages (top_k, sort_by, services, start, end, cursor)
+    total_matched: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+class ModelInfo(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+
+    model_key: str
+    n_train: int
+    fitted_at: float
@@ -0,0 +1,113 @@
+import json
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from ml.frame import CostFrame
+from ml.instrument import span
+from ml.rank import estimated_impact
+
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+COLUMNAR = "application/vnd.costspike.columnar+json"
+ARROW = "application/vnd.apache.arrow.stream"
+MEDIA_TYPES = (JSON, NDJSON, COLUMNAR, ARROW)
+
+ANOMALY_FIELDS = ["date", "service", "cost", "anomaly_score", "cost_pct_change", "cost_rolling_mean_7", "estimated_impact"]
+NDJSON_BATCH_ROWS = 10_000
+
+def negotiate(accept: Optional[str]) -> Optional[str]:
+    # first acceptable media type in client order; q-values are not ranked
+    if not accept:
+        return JSON
+    for part in accept.split(","):
+        media = part.split(";")[0].strip().lower()
+        if media in MEDIA_TYPES:
+            return media
+        if media in ("*/*", "application/*"):
+            return JSON
+    return None
+
+def _floats(s: Union[pd.Series, np.ndarray]) -> List[Any]:
+    # NaN/inf -> None, matching how the pydantic response serialized them
+    a = np.asarray(s)
+    if a.dtype == np.float32:
+        # float32 costs go through their shortest repr so 12.1 is not sent as 12.100000381...
+        a = a.astype(str)
+    a = a.astype(np.float64)
+    out = a.astype(object)
+    out[~np.isfinite(a)] = None
+    return out.tolist()
+
+def anomaly_columns(scored: Union[pd.DataFrame, CostFrame], rows: Optional[np.ndarray] = None) -> Dict[str, List[Any]]:
+    with span("serialize"):
+        return _anomaly_columns(scored, rows)
+
+def _anomaly_rows(scored: Union[pd.DataFrame, CostFrame], rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+    # responses only carry anomaly rows (or the queried page of them, `rows` being positions
+    # in output order), so a CostFrame is decoded for those rows alone
+    if rows is None:
+        rows = np.asarray(scored["anomaly"])
+    if isinstance(scored, CostFrame):
+        anomalies = scored.to_frame(rows)
+    else:
+        anomalies = scored.iloc[rows] if rows.dtype != bool else scored[rows]
+    return anomalies.assign(estimated_impact=estimated_impact(anomalies["cost"], anomalies["cost_rolling_mean_7"]))
+
+def _anomaly_columns(scored: Union[pd.DataFrame, CostFrame], rows: Optional[np.ndarray] = None) -> Dict[str, List[Any]]:
+    anomalies = _anomaly_rows(scored, rows)
+    return {
+        "date": anomalies["date"].dt.strftime("%Y-%m-%d").tolist(),
+        "service": anomalies["service"].astype(str).tolist(),
+        "cost": _floats(anomalies["cost"]),
+        "anomaly_score": _floats(anomalies["anomaly_score"]),
+        "cost_pct_change": _floats(anomalies["cost_pct_change"]),
+        "cost_rolling_mean_7": _floats(anomalies["cost_rolling_mean_7"]),
+        "estimated_impact": _floats(anomalies["estimated_impact"]),
+    }
+
+def _records(cols: Dict[str, List[Any]], start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+    keys = list(cols)
+    return [dict(zip(keys, row)) for row in zip(*(cols[k][start:stop] for k in keys))]
+
+def _total_anomalies(scored: Union[pd.DataFrame, CostFrame]) -> int:
+    return int(np.asarray(scored["anomaly"]).sum())
+
+def detect_body(scored: Union[pd.DataFrame, CostFrame], rows: Optional[np.ndarray] = None, **extra: Any) -> Dict[str, Any]:
+    cols = anomaly_columns(scored, rows)
+    return {
+        "anomalies": _records(cols),
+        "total_rows": int(len(scored)),
+        "total_anomalies": _total_anomalies(scored),
+        "unscored_services": scored.attrs.get("unscored_services", []),
+        **extra,
+    }
+
+def columnar_body(scored: Union[pd.DataFrame, CostFrame], rows: Optional[np.ndarray] = None, **extra: Any) -> Dict[str, Any]:
+    cols = anomaly_columns(scored, rows)
+    return {
+        "columns": cols,
+        "total_rows": int(len(scored)),
+        "total_anomalies": _total_anomalies(scored),
+        "unscored_services": scored.attrs.get("unscored_services", []),
+        **extra,
+    }
+
+def iter_ndjson(scored: Union[pd.DataFrame, CostFrame], rows: Optional[np.ndarray] = None,
+                batch_rows: int = NDJSON_BATCH_ROWS) -> Iterator[bytes]:
+    cols = anomaly_columns(scored, rows)
+    n = len(cols["date"])
+    for start in range(0, n, batch_rows):
+        lines = (json.dumps(r, separators=(",", ":")) for r in _records(cols, start, start + batch_rows))
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+def arrow_bytes(scored: Union[pd.DataFrame, CostFrame], rows: Optional[np.ndarray] = None) -> bytes:
+    import pyarrow as pa  # optional; only needed for Arrow responses
+
+    anomalies = _anomaly_rows(scored, rows)[ANOMALY_FIELDS]
+    table = pa.Table.from_pandas(anomalies.astype({"service": str}), preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
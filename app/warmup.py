@@ -0,0 +1,56 @@
+import gc
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from ml.model import ModelStore
+
+# WARMUP=0 skips the warm-up pass (the process reports ready immediately);
+# PRELOAD_MODELS caps how many persisted models are loaded into memory up front
+WARMUP = os.environ.get("WARMUP", "1") != "0"
+PRELOAD_MODELS = int(os.environ.get("PRELOAD_MODELS", "16"))
+
+STARTING, READY, FAILED = "starting", "ready", "failed"
+
+_state: Dict[str, Any] = {"status": STARTING if WARMUP else READY, "seconds": None, "models": 0, "error": None}
+_lock = threading.Lock()
+
+def warm_up(models: Optional[ModelStore] = None, preload_models: int = PRELOAD_MODELS) -> Dict[str, Any]:
+    # import the deferred libraries and run a tiny synthetic detection per method, so the first
+    # real request pays neither; runs once per process (a pre-fork master warms its workers)
+    with _lock:
+        if _state["seconds"] is not None:
+            return dict(_state)
+        t0 = time.perf_counter()
+        try:
+            from ml.detect import DetectConfig, detect_spikes
+            from ml.frame import CostFrame
+            from ml.synth import generate_costs
+
+            sample = CostFrame.from_frame(generate_costs(n_services=3, n_days=30, seed=0))
+            for method in ("iforest", "mad", "ewma"):
+                detect_spikes(sample, DetectConfig(method=method, n_estimators=10))
+            loaded = models.preload(preload_models) if models is not None else 0
+            _state.update(status=READY, models=loaded)
+        except Exception as e:
+            _state.update(status=FAILED, error=str(e))
+        _state["seconds"] = round(time.perf_counter() - t0, 3)
+        return dict(_state)
+
+def warm_up_in_background(models: Optional[ModelStore] = None) -> Optional[threading.Thread]:
+    # liveness is answered immediately; readiness flips once the warm-up thread finishes
+    if not WARMUP or _state["seconds"] is not None:
+        return None
+    thread = threading.Thread(target=warm_up, args=(models,), name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+def freeze() -> None:
+    # called in a pre-fork master after warm-up: moves everything loaded so far out of the
+    # collector's reach so workers do not dirty (and copy) those pages during gc passes
+    gc.collect()
+    gc.freeze()
+
+def readiness() -> Dict[str, Any]:
+    return dict(_state)
@@ -0,0 +1,226 @@
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from ml.backtest import ReplayConfig, run_backtest
+from ml.cost_io import read_cost_frame
+from ml.detect import DetectConfig, explain_anomalies, fit, score
+from ml.features import add_features
+from ml.synth import generate_costs
+
+# the pipeline imports scikit-learn on first fit; stage timings measure work, not imports
+# (cold start has its own entry, see run_startup)
+import sklearn.ensemble  # noqa: E402,F401
+
+# name -> (services, days); xlarge is ~2M rows, huge ~10M (fits on a sample, see max_train_rows)
+SIZES: Dict[str, Tuple[int, int]] = {
+    "tiny": (10, 30),
+    "small": (50, 90),
+    "medium": (500, 365),
+    "large": (2000, 365),
+    "xlarge": (5500, 365),
+    "huge": (27500, 365),
+}
+API_MAX_ROWS = 200_000
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+# allowed drift against the stored baseline before a run fails
+TIME_TOLERANCE = 2.0
+# and by more than this many seconds: millisecond stages swing by multiples with scheduler noise
+TIME_SLACK_SECONDS = 0.05
+MEMORY_TOLERANCE = 1.5
+QUALITY_TOLERANCE = 0.05
+
+def measure(fn: Callable[[], Any], memory: bool = True) -> Tuple[Any, float, float]:
+    # timed and traced in separate runs: tracemalloc slows allocation-heavy code severalfold
+    t0 = time.perf_counter()
+    out = fn()
+    seconds = time.perf_counter() - t0
+    if not memory:
+        return out, seconds, 0.0
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return out, seconds, peak / 1e6
+
+def _api_detect(csv_bytes: bytes) -> Dict[str, Any]:
+    from fastapi.testclient import TestClient
+    import app.main as main
+    from app.cache import ResultCache
+    from ml.model import ModelStore
+
+    # measure a cold request every time: no result reuse, no model reuse
+    saved = main.RESULTS, main.MODEL_STORE
+    main.RESULTS, main.MODEL_STORE = ResultCache(max_bytes=0), ModelStore(path=None, ttl=0)
+    try:
+        r = TestClient(main.app).post("/detect", files={"file": ("costs.csv", csv_bytes, "text/csv")})
+    finally:
+        main.RESULTS, main.MODEL_STORE = saved
+    r.raise_for_status()
+    return r.json()
+
+def run_size(name: str, seed: int = 0, cfg: DetectConfig = DetectConfig(), memory: bool = True) -> Dict[str, Any]:
+    n_services, n_days = SIZES[name]
+    labeled = generate_costs(n_services, n_days, seed=seed)
+    csv_bytes = labeled.drop(columns=["is_spike"]).to_csv(index=False).encode("utf-8")
+    stages: Dict[str, Dict[str, float]] = {}
+
+    def stage(label: str, fn: Callable[[], Any]) -> Any:
+        out, seconds, peak_mb = measure(fn, memory)
+        stages[label] = {"seconds": round(seconds, 4), "peak_mb": round(peak_mb, 2)}
+        return out
+
+    df = stage("parse", lambda: read_cost_frame(io.BytesIO(csv_bytes)))
+    stage("features", lambda: add_features(df))
+    model = stage("fit", lambda: fit(df, cfg))
+    scored = stage("score", lambda: score(df, model))
+    stage("explain", lambda: explain_anomalies(scored))
+    if len(df) <= API_MAX_ROWS:
+        stage("api_detect", lambda: _api_detect(csv_bytes))
+
+    # read_cost_frame sorts by (service, date), as does the generator, so labels line up
+    truth = labeled["is_spike"].to_numpy()
+    flagged = np.asarray(scored["anomaly"])
+    tp = int((truth & flagged).sum())
+    return {
+        "rows": int(len(df)),
+        "stages": stages,
+        "precision": round(tp / max(int(flagged.sum()), 1), 4),
+        "recall": round(tp / max(int(truth.sum()), 1), 4),
+    }
+
+# contamination grid plus the statistical detectors, replayed with weekly refits
+BACKTEST_CONFIGS = [DetectConfig(contamination=c) for c in (0.01, 0.02, 0.05, 0.1)] + [
+    DetectConfig(method="mad"), DetectConfig(method="ewma"),
+]
+
+def run_replay(name: str, seed: int = 0) -> Dict[str, Any]:
+    # time-only (the replay holds per-config flags for every row; tracemalloc would dominate);
+    # quality is the best recall over the configs
+    n_services, n_days = SIZES[name]
+    labeled = generate_costs(n_services, n_days, seed=seed)
+    # one refit thread, so the timing does not depend on the machine's core count
+    bt = run_backtest(labeled, BACKTEST_CONFIGS, ReplayConfig(), workers=1)
+    summary = bt.summary()
+    return {
+        "rows": int(len(labeled)),
+        "refits": bt.refits,
+        "stages": {"backtest": {"seconds": round(bt.seconds, 4), "peak_mb": 0.0}},
+        "recall": round(float(summary["recall"].max()), 4),
+    }
+
+# run in a fresh interpreter each time: seconds from interpreter start to the first /detect
+# response, with WARMUP=0 (first request pays imports and warm-up) and after the warm-up
+_STARTUP_SCRIPT = """
+import io, sys, time
+t0 = time.perf_counter()
+import app.main as main
+imported = time.perf_counter() - t0
+from fastapi.testclient import TestClient
+from app import warmup
+csv = b"date,service,cost\\n" + b"".join(b"2025-01-%02d,EC2,%d\\n" % (d, 10 + d % 3) for d in range(1, 29))
+with TestClient(main.app) as client:
+    while client.get("/health/ready").status_code != 200:
+        time.sleep(0.01)
+    t1 = time.perf_counter()
+    assert client.post("/detect", files={"file": ("c.csv", io.BytesIO(csv), "text/csv")}).status_code == 200
+    t2 = time.perf_counter()
+print(imported, t2 - t1, t2 - t0)
+"""
+
+def run_startup(repeat: int = 3) -> Dict[str, Any]:
+    # best of `repeat` fresh processes; model and result caches are disabled
+    import subprocess
+
+    env = {**os.environ, "MODEL_CACHE_DIR": "", "RESULT_CACHE_MB": "0"}
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    best: Dict[str, float] = {}
+    for warm in ("0", "1"):
+        for _ in range(repeat):
+            out = subprocess.run(
+                [sys.executable, "-c", _STARTUP_SCRIPT], env={**env, "WARMUP": warm},
+                cwd=root, capture_output=True, text=True, check=True,
+            )
+            imported, first, total = (float(v) for v in out.stdout.split())
+            runs = {"import": imported, f"first_response_{'warm' if warm == '1' else 'cold'}": first}
+            if warm == "0":
+                runs["time_to_first_response"] = total
+            for label, seconds in runs.items():
+                best[label] = min(best.get(label, seconds), seconds)
+    return {"stages": {label: {"seconds": round(v, 4), "peak_mb": 0.0} for label, v in best.items()}}
+
+def check(results: Dict[str, Any], baselines: Dict[str, Any], timing: bool = True) -> List[str]:
+    # timing=False keeps only the quality gates (shared CI runners are not the baseline machine)
+    failures = []
+    for name, got in results.items():
+        base = baselines.get(name)
+        if base is None:
+            continue
+        for label, m in got["stages"].items():
+            b = base["stages"].get(label)
+            if b is None or not timing:
+                continue
+            if m["seconds"] > max(b["seconds"] * TIME_TOLERANCE, b["seconds"] + TIME_SLACK_SECONDS):
+                failures.append(f"{name}/{label}: {m['seconds']:.3f}s > {TIME_TOLERANCE}x baseline {b['seconds']:.3f}s")
+            if m["peak_mb"] and m["peak_mb"] > b["peak_mb"] * MEMORY_TOLERANCE:
+                failures.append(f"{name}/{label}: {m['peak_mb']:.1f}MB > {MEMORY_TOLERANCE}x baseline {b['peak_mb']:.1f}MB")
+        for metric in ("precision", "recall"):
+            if metric in got and metric in base and got[metric] < base[metric] - QUALITY_TOLERANCE:
+                failures.append(f"{name}/{metric}: {got[metric]:.3f} < baseline {base[metric]:.3f} - {QUALITY_TOLERANCE}")
+    return failures
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pipeline benchmarks on synthetic billing data.")
+    parser.add_argument("--sizes", default="small,medium", help=f"comma-separated: {', '.join(SIZES)}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baselines", default=BASELINE_PATH)
+    parser.add_argument("--update", action="store_true", help="write results as the new baselines")
+    parser.add_argument("--out", help="also write results JSON here")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--startup", action="store_true", help="also measure API import time and first response")
+    parser.add_argument("--backtest", metavar="SIZE", help="also time a multi-config replay of this size")
+    parser.add_argument("--no-timing", action="store_true",
+                        help="gate on precision/recall only, not on time and memory")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in filter(None, (n.strip() for n in args.sizes.split(","))):
+        results[name] = run_size(name, seed=args.seed, memory=not args.no_memory)
+        print(f"{name}: {json.dumps(results[name])}", flush=True)
+    if args.startup:
+        results["startup"] = run_startup()
+        print(f"startup: {json.dumps(results['startup'])}", flush=True)
+    if args.backtest:
+        results["backtest"] = run_replay(args.backtest, seed=args.seed)
+        print(f"backtest: {json.dumps(results['backtest'])}", flush=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+    if args.update:
+        baselines.update(results)
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        return 0
+
+    failures = check(results, baselines, timing=not args.no_timing)
+    for line in failures:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
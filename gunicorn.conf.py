@@ -0,0 +1,22 @@
+# Pre-fork serving: gunicorn -c gunicorn.conf.py app.main:app
+# The master imports the app once (preload_app), warms it up and freezes the heap before
+# forking, so workers share libraries, warm code paths and preloaded models copy-on-write.
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+# one worker by default: uploaded datasets (/datasets) and the job registry (/jobs) live in
+# process memory, so a follow-up request that reaches another worker gets a 404. Raise
+# WEB_CONCURRENCY only with sticky routing or when those endpoints are not used
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.environ.get("WORKER_TIMEOUT", "120"))
+
+def when_ready(server):
+    # runs in the master after the app is loaded and before any worker is forked
+    from app import warmup
+    from app.main import MODEL_STORE
+
+    state = warmup.warm_up(MODEL_STORE)
+    server.log.info("warm-up %s in %ss, %s models preloaded", state["status"], state["seconds"], state["models"])
+    warmup.freeze()
@@ -0,0 +1,202 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .detect import DetectConfig, spike_like
+from .features import add_features, feature_matrix
+from .frame import CostFrame
+from .instrument import span
+from .model import fit_model, sample_rows
+from .stats import score_statistical
+
+# replay defaults: weekly refits after two weeks of history; a spike first flagged more than
+# MAX_LATENCY_DAYS after it happened counts as missed
+REFIT_EVERY = 7
+MIN_HISTORY_DAYS = 14
+MAX_LATENCY_DAYS = 7
+# refits of one backtest run on up to BACKTEST_WORKERS threads (tree building and traversal
+# release the GIL)
+BACKTEST_WORKERS = int(os.environ.get("BACKTEST_WORKERS", "0")) or os.cpu_count() or 1
+
+@dataclass
+class ReplayConfig:
+    # day r of the replay sees the data through r. An IsolationForest refit on day r trains on
+    # all rows through r and scores days r .. r + refit_every - 1; refit_every=1 reproduces
+    # detect_spikes run on every prefix
+    refit_every: int = REFIT_EVERY
+    min_history: int = MIN_HISTORY_DAYS
+    max_latency: int = MAX_LATENCY_DAYS
+
+    def __post_init__(self):
+        if self.refit_every < 1 or self.min_history < 1:
+            raise ValueError("refit_every and min_history must be at least 1.")
+        if self.max_latency < 0:
+            raise ValueError("max_latency must be non-negative.")
+
+@dataclass
+class Backtest:
+    configs: List[DetectConfig]
+    replay: ReplayConfig
+    frame: CostFrame          # input with features
+    start: int                # first replayed day, days since 1970-01-01
+    anomaly: np.ndarray       # (c, n) bool per config; False before start
+    score: np.ndarray         # (c, n) float32 anomaly_score; NaN before start
+    refits: int = 0           # forests fitted; configs that differ only in contamination share them
+    seconds: float = 0.0
+    truth: Optional[np.ndarray] = None  # (n,) bool labeled spikes, e.g. synth is_spike
+
+    @property
+    def days(self) -> pd.DatetimeIndex:
+        end = int(self.frame.day.max()) if len(self.frame) else self.start - 1
+        return pd.DatetimeIndex(np.arange(self.start, end + 1).astype("datetime64[D]"), name="date")
+
+    def daily_alerts(self) -> pd.DataFrame:
+        # alerts raised per replayed day (rows) and config (columns, by position in configs)
+        n = len(self.days)
+        counts = [np.bincount(self.frame.day[a] - self.start, minlength=n) for a in self.anomaly]
+        return pd.DataFrame(np.array(counts, dtype=np.int64).reshape(len(counts), n).T, index=self.days)
+
+    def alerts(self, i: int) -> pd.DataFrame:
+        rows = np.flatnonzero(self.anomaly[i])
+        cf = self.frame
+        return pd.DataFrame({
+            "date": cf.day[rows].astype("datetime64[D]").astype("datetime64[ns]"),
+            "service": cf.services[cf.codes[rows]],
+            "cost": cf.cost[rows],
+            "anomaly_score": self.score[i, rows],
+        })
+
+    def latency(self, i: int) -> np.ndarray:
+        # per labeled spike in the replayed range: days until its service was first flagged at
+        # or after it, -1 when that took longer than max_latency (or never happened)
+        if self.truth is None:
+            raise ValueError("Latency needs labeled spikes (truth).")
+        cf = self.frame
+        spikes = np.flatnonzero(self.truth & (cf.day >= self.start))
+        flagged = np.flatnonzero(self.anomaly[i])
+        if not len(flagged):
+            return np.full(len(spikes), -1, dtype=np.int64)
+        # rows are in (service, day) order, so the next flagged row is the service's next flag
+        nxt = flagged[np.minimum(np.searchsorted(flagged, spikes), len(flagged) - 1)]
+        gap = cf.day[nxt].astype(np.int64) - cf.day[spikes]
+        hit = (nxt >= spikes) & (cf.codes[nxt] == cf.codes[spikes]) & (gap <= self.replay.max_latency)
+        return np.where(hit, gap, -1)
+
+    def summary(self) -> pd.DataFrame:
+        # one row per config: alert volume and, with labels, recall / precision / latency
+        n_days = max(len(self.days), 1)
+        out: List[Dict[str, Any]] = []
+        for i, cfg in enumerate(self.configs):
+            alerts = int(self.anomaly[i].sum())
+            row: Dict[str, Any] = {
+                "method": cfg.method, "contamination": cfg.contamination, "z_threshold": cfg.z_threshold,
+                "alerts": alerts, "alerts_per_day": alerts / n_days,
+            }
+            if self.truth is not None:
+                lat = self.latency(i)
+                found = lat[lat >= 0]
+                row.update(
+                    spikes=len(lat), detected=len(found),
+                    recall=len(found) / max(len(lat), 1),
+                    precision=int((self.anomaly[i] & self.truth).sum()) / max(alerts, 1),
+                    mean_latency=float(found.mean()) if len(found) else float("nan"),
+                    median_latency=float(np.median(found)) if len(found) else float("nan"),
+                )
+            out.append(row)
+        return pd.DataFrame(out)
+
+def _share_key(cfg: DetectConfig) -> Tuple[Any, ...]:
+    # configs with the same key are scored together: one forest (contamination only moves its
+    # threshold) or one z-score series (z_threshold only moves the cut)
+    if cfg.method == "iforest":
+        return ("iforest", cfg.n_estimators, cfg.random_state, cfg.max_train_rows)
+    return (cfg.method, cfg.ewma_alpha if cfg.method == "ewma" else None)
+
+def _as_frame(df: Union[pd.DataFrame, CostFrame], truth: Optional[np.ndarray]) -> Tuple[CostFrame, Optional[np.ndarray]]:
+    if isinstance(df, CostFrame):
+        return df, None if truth is None else np.asarray(truth, dtype=bool)
+    if truth is None and "is_spike" in df.columns:
+        truth = df["is_spike"].to_numpy()
+    cf = CostFrame.from_frame(df)
+    if truth is not None:
+        # the same (service, day) order from_frame sorts the rows into
+        codes = pd.factorize(df["service"].astype(str), sort=True)[0]
+        day = df["date"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+        truth = np.asarray(truth, dtype=bool)[np.lexsort((day, codes))]
+    return cf, truth
+
+def run_backtest(df: Union[pd.DataFrame, CostFrame], configs: Sequence[DetectConfig] = (DetectConfig(),),
+                 replay: ReplayConfig = ReplayConfig(), truth: Optional[np.ndarray] = None,
+                 workers: int = BACKTEST_WORKERS) -> Backtest:
+    # replays the timeline once for every config. Features and the statistical detectors only
+    # look back, so one pass over the full frame gives each row exactly what a replay of its
+    # prefix would; only the forests depend on the day, and they are fitted once per refit day
+    # per group of configs that share one (see _share_key), not once per day and config
+    t0 = time.perf_counter()
+    configs = list(configs)
+    if not configs:
+        raise ValueError("At least one config is required.")
+    cf, truth = _as_frame(df, truth)
+    if not len(cf):
+        raise ValueError("No cost rows to replay.")
+    start = int(cf.day.min()) + replay.min_history
+    last = int(cf.day.max())
+    if start > last:
+        raise ValueError(f"Need more than {replay.min_history} days of history to replay.")
+
+    with span("backtest"):
+        work = add_features(cf)
+        day = work.day
+        anomaly = np.zeros((len(configs), len(work)), dtype=bool)
+        score = np.full((len(configs), len(work)), np.nan, dtype=np.float32)
+        groups: Dict[Tuple[Any, ...], List[int]] = {}
+        for i, cfg in enumerate(configs):
+            groups.setdefault(_share_key(cfg), []).append(i)
+
+        replayed = day >= start
+        tasks = []
+        refit_days = np.arange(start, last + 1, replay.refit_every)
+        X = None
+        for members in groups.values():
+            cfg = configs[members[0]]
+            if cfg.method != "iforest":
+                with span("score"):
+                    _, z = score_statistical(work, cfg.method, cfg.z_threshold, cfg.ewma_alpha)
+                for i in members:
+                    anomaly[i] = z > configs[i].z_threshold
+                    score[i, replayed] = z[replayed]
+                continue
+            if X is None:
+                X = feature_matrix(work, np.float32)
+                # rows by day: each refit scores one contiguous run of this order
+                by_day = np.argsort(day, kind="stable")
+                bounds = np.searchsorted(day[by_day], np.r_[refit_days, last + 1])
+            tasks += [(members, r, by_day[bounds[j]:bounds[j + 1]]) for j, r in enumerate(refit_days)]
+
+        def refit(task) -> None:
+            members, r, rows = task
+            cfg = configs[members[0]]
+            train = np.flatnonzero(day <= r)
+            if cfg.max_train_rows is not None and len(train) > cfg.max_train_rows:
+                train = train[sample_rows(work.codes[train], cfg.max_train_rows, cfg.random_state)]
+            # fitted with contamination="auto", then each config's offset is the same
+            # percentile of the training scores IsolationForest.fit would have taken
+            forest = fit_model(X[train], replace(cfg, contamination="auto", max_train_rows=None)).forest
+            offsets = np.percentile(forest.score_samples(X[train]), [100.0 * configs[i].contamination for i in members])
+            s = forest.score_samples(X[rows])
+            for i, offset in zip(members, offsets):
+                anomaly[i, rows] = s - offset < 0
+                score[i, rows] = offset - s
+
+        if tasks:
+            with ThreadPoolExecutor(max(1, min(workers, len(tasks))), thread_name_prefix="backtest") as pool:
+                list(pool.map(refit, tasks))
+        anomaly &= spike_like(work) & replayed
+
+    return Backtest(configs, replay, work, start, anomaly, score, refits=len(tasks),
+                    seconds=time.perf_counter() - t0, truth=truth)
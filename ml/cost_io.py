@@ -1,21 +1,114 @@
+import time
+from typing import IO, Any, Iterator, List, Sequence, Union
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
+
+from .frame import CostFrame
+from .instrument import ROWS_IN, count, observe, span
 
 REQUIRED_COLS = {"date", "service", "cost"}
+CHUNK_ROWS = 200_000
+COST_DTYPE = np.float32
+MAX_REPORTED_ROWS = 10
+# value used for an empty or missing extra dimension (account, region, tag, ...)
+MISSING_DIMENSION = "(none)"
 
-def load_cost_csv(df: pd.DataFrame) -> pd.DataFrame:
-    cols = {c.lower().strip(): c for c in df.columns}
+def _column_map(columns) -> dict:
+    cols = {c.lower().strip(): c for c in columns}
     if "date" not in cols or "service" not in cols or "cost" not in cols:
         raise ValueError("CSV must contain columns: date, service, cost (case-insensitive).")
+    return cols
+
+def _bad_rows(mask: pd.Series, offset: int) -> str:
+    # 1-based data row numbers (header excluded), across chunks
+    rows = np.flatnonzero(mask.to_numpy()) + offset + 1
+    shown = ", ".join(str(r) for r in rows[:MAX_REPORTED_ROWS])
+    more = f" and {len(rows) - MAX_REPORTED_ROWS} more" if len(rows) > MAX_REPORTED_ROWS else ""
+    return f" (rows {shown}{more})"
 
-    df = df.rename(columns={cols["date"]: "date", cols["service"]: "service", cols["cost"]: "cost"}).copy()
+def _coerce(df: pd.DataFrame, offset: int = 0, dimensions: Sequence[str] = ()) -> pd.DataFrame:
+    # dimensions: extra label columns to keep (matched case-insensitively, renamed to lower case)
+    cols = _column_map(df.columns)
+    missing = [d for d in dimensions if d not in cols]
+    if missing:
+        raise ValueError(f"CSV has no column(s): {', '.join(missing)}.")
+    df = df.rename(columns={cols["date"]: "date", cols["service"]: "service", cols["cost"]: "cost",
+                            **{cols[d]: d for d in dimensions}}).copy()
+    for d in dimensions:
+        df[d] = df[d].fillna("").astype(str).str.strip().replace("", MISSING_DIMENSION)
 
     df["date"] = pd.to_datetime(df["date"], errors="coerce")
     if df["date"].isna().any():
-        raise ValueError("Some 'date' values could not be parsed.")
+        raise ValueError("Some 'date' values could not be parsed" + _bad_rows(df["date"].isna(), offset) + ".")
 
     df["service"] = df["service"].astype(str).str.strip()
     df["cost"] = pd.to_numeric(df["cost"], errors="coerce")
     if df["cost"].isna().any():
-        raise ValueError("Some 'cost' values could not be parsed as numbers.")
+        raise ValueError("Some 'cost' values could not be parsed as numbers" + _bad_rows(df["cost"].isna(), offset) + ".")
+    return df
+
+def load_cost_csv(df: pd.DataFrame) -> pd.DataFrame:
+    with span("validate"):
+        df = _coerce(df)
+        return df.sort_values(["service", "date"]).reset_index(drop=True)
+
+def _read_chunks(source: Union[str, IO], chunksize: int, dimensions: Sequence[str] = ()) -> Iterator[pd.DataFrame]:
+    # parse + validate chunk by chunk, recording parse/validate time and input rows
+    offset = 0
+    seen = False  # a chunk got through the column check, even if it had no rows
+    parse_s = validate_s = 0.0
+    keep = REQUIRED_COLS | set(dimensions)
+    reader = pd.read_csv(
+        source,
+        chunksize=chunksize,
+        usecols=lambda c: c.lower().strip() in keep,
+        dtype=str,
+    )
+    with reader:
+        chunks = iter(reader)
+        while True:
+            t0 = time.perf_counter()
+            chunk = next(chunks, None)
+            t1 = time.perf_counter()
+            parse_s += t1 - t0
+            if chunk is None:
+                break
+            chunk = _coerce(chunk, offset, dimensions)
+            seen = True
+            validate_s += time.perf_counter() - t1
+            offset += len(chunk)
+            yield chunk
+    observe("csv_parse", parse_s)
+    observe("validate", validate_s)
+    count(ROWS_IN, offset)
+    if offset == 0:
+        if seen:
+            raise ValueError("CSV has no data rows.")
+        raise ValueError("CSV must contain columns: date, service, cost (case-insensitive).")
+
+def _compact_chunks(source: Union[str, IO], chunksize: int, unit: str, cost_dtype: Any = COST_DTYPE):
+    # only the compact columns are kept between chunks
+    dates: List[np.ndarray] = []
+    services: List[pd.Categorical] = []
+    costs: List[np.ndarray] = []
+    for chunk in _read_chunks(source, chunksize):
+        dates.append(chunk["date"].to_numpy(dtype=f"datetime64[{unit}]"))
+        services.append(pd.Categorical(chunk["service"]))
+        costs.append(chunk["cost"].to_numpy(dtype=cost_dtype))
+    return np.concatenate(dates), union_categoricals(services, sort_categories=True), np.concatenate(costs)
+
+def read_cost_csv(source: Union[str, IO], chunksize: int = CHUNK_ROWS) -> pd.DataFrame:
+    dates, service, cost = _compact_chunks(source, chunksize, "ns")
+    df = pd.DataFrame({"date": dates, "service": service, "cost": cost})
+    return df.sort_values(["service", "date"]).reset_index(drop=True)
+
+def read_cost_frame(source: Union[str, IO], chunksize: int = CHUNK_ROWS,
+                    cost_dtype: Any = COST_DTYPE) -> CostFrame:
+    # same parsing and validation as read_cost_csv, straight into a CostFrame (dates floored to days)
+    dates, service, cost = _compact_chunks(source, chunksize, "D", cost_dtype)
+    return CostFrame.from_arrays(dates.astype(np.int64), service.codes, np.asarray(service.categories, dtype=object),
+                                 cost, cost_dtype=cost_dtype)
 
-    return df.sort_values(["service", "date"]).reset_index(drop=True)
\ No newline at end of file
+def load_cost_frame(df: pd.DataFrame) -> CostFrame:
+    return CostFrame.from_frame(load_cost_csv(df))
@@ -0,0 +1,96 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .frame import CostFrame
+
+@dataclass
+class CostCube:
+    # day x service cost totals and row counts over a dense daily range; days with no
+    # rows for the selected services are skipped by daily()/to_frame(), like a groupby would
+    days: pd.DatetimeIndex
+    services: pd.Index
+    values: np.ndarray
+    counts: np.ndarray
+
+    @classmethod
+    def from_costs(cls, df: pd.DataFrame) -> "CostCube":
+        if df.empty:
+            return cls(pd.DatetimeIndex([]), pd.Index([], dtype=object), np.zeros((0, 0)), np.zeros((0, 0), dtype=np.int64))
+        day = df["date"].dt.normalize().to_numpy(dtype="datetime64[D]")
+        first, last = day.min(), day.max()
+        d = (day - first).astype(np.int64)
+        s, services = pd.factorize(df["service"].astype(str), sort=True)
+        n_days = int((last - first).astype(np.int64)) + 1
+        cell = d * len(services) + s
+        size = n_days * len(services)
+        weights = df["cost"].to_numpy(dtype=np.float64)
+        return cls(
+            days=pd.date_range(pd.Timestamp(first), periods=n_days, freq="D"),
+            services=pd.Index(services),
+            values=np.bincount(cell, weights=weights, minlength=size).reshape(n_days, len(services)),
+            counts=np.bincount(cell, minlength=size).reshape(n_days, len(services)),
+        )
+
+    @classmethod
+    def from_frame(cls, cf: CostFrame) -> "CostCube":
+        # service codes and day ordinals are already integers: two bincounts, no factorize
+        if len(cf) == 0:
+            return cls(pd.DatetimeIndex([]), pd.Index([], dtype=object), np.zeros((0, 0)), np.zeros((0, 0), dtype=np.int64))
+        first, last = int(cf.day.min()), int(cf.day.max())
+        n_days, k = last - first + 1, len(cf.services)
+        cell = (cf.day.astype(np.int64) - first) * k + cf.codes
+        return cls(
+            days=pd.date_range(pd.Timestamp(np.datetime64(first, "D")), periods=n_days, freq="D"),
+            services=pd.Index(cf.services),
+            values=np.bincount(cell, weights=cf.cost, minlength=n_days * k).reshape(n_days, k),
+            counts=np.bincount(cell, minlength=n_days * k).reshape(n_days, k),
+        )
+
+    def slice(self, start: Optional[pd.Timestamp] = None, end: Optional[pd.Timestamp] = None,
+              services: Optional[Sequence[str]] = None) -> "CostCube":
+        lo = 0 if start is None else int(self.days.searchsorted(pd.Timestamp(start), side="left"))
+        hi = len(self.days) if end is None else int(self.days.searchsorted(pd.Timestamp(end), side="right"))
+        cols = slice(None) if services is None else self.services.get_indexer(list(services))
+        if services is not None:
+            cols = cols[cols >= 0]
+        return CostCube(self.days[lo:hi], self.services[cols], self.values[lo:hi][:, cols], self.counts[lo:hi][:, cols])
+
+    @property
+    def present(self) -> np.ndarray:
+        return self.counts.sum(axis=1) > 0
+
+    @property
+    def empty(self) -> bool:
+        return not self.present.any()
+
+    def daily(self) -> pd.Series:
+        keep = self.present
+        return pd.Series(self.values[keep].sum(axis=1), index=self.days[keep], name="daily_cost")
+
+    def by_service(self) -> pd.Series:
+        return pd.Series(self.values.sum(axis=0), index=self.services, name="cost")
+
+    def to_frame(self) -> pd.DataFrame:
+        keep = self.present
+        return pd.DataFrame(self.values[keep], index=self.days[keep], columns=self.services)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "days": self.days.strftime("%Y-%m-%d").tolist(),
+            "services": [str(s) for s in self.services],
+            "values": self.values.tolist(),
+            "counts": self.counts.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "CostCube":
+        shape = (len(d["days"]), len(d["services"]))
+        return cls(
+            pd.DatetimeIndex(d["days"]),
+            pd.Index(d["services"]),
+            np.asarray(d["values"], dtype=np.float64).reshape(shape),
+            np.asarray(d["counts"], dtype=np.int64).reshape(shape),
+        )
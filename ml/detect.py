@@ -1,45 +1,86 @@
 from dataclasses import dataclass
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Union
+import numpy as np
 import pandas as pd
-from sklearn.ensemble import IsolationForest
 
-from .features import add_time_features, add_rolling_features, build_feature_matrix
+from .features import add_features, feature_matrix
+from .frame import CostFrame
+from .instrument import ANOMALIES, ROWS_SCORED, count, span
+from .model import ModelStore, SpikeModel, fingerprint, fit_model, model_key, service_codes
+from .rank import Ranking, rank_anomalies
+from .stats import METHODS, score_statistical
 
 @dataclass
 class DetectConfig:
     contamination: float = 0.05
     random_state: int = 42
+    n_estimators: int = 200
+    # "iforest" fits an IsolationForest; "mad" (rolling robust z-score) and "ewma" (EWMA
+    # residual) are per-service statistical detectors that need no fit
+    method: str = "iforest"
+    z_threshold: float = 3.5
+    ewma_alpha: float = 0.3
+    # large-data mode: inputs with more rows fit on a per-service stratified sample of about
+    # this many rows (None fits on everything); scoring always covers every row
+    max_train_rows: Optional[int] = 1_000_000
 
-def detect_spikes(df: pd.DataFrame, cfg: DetectConfig = DetectConfig()) -> pd.DataFrame:
-    work = add_time_features(df)
-    work = add_rolling_features(work)
-    X = build_feature_matrix(work)
+    def __post_init__(self):
+        if self.method not in METHODS:
+            raise ValueError(f"method must be one of {', '.join(METHODS)}.")
+        if not 0 < self.ewma_alpha <= 1:
+            raise ValueError("ewma_alpha must be in (0, 1].")
+        if self.max_train_rows is not None and self.max_train_rows < 1:
+            raise ValueError("max_train_rows must be positive.")
 
-    model = IsolationForest(
-        n_estimators=200,
-        contamination=cfg.contamination,
-        random_state=cfg.random_state,
-    )
-    model.fit(X)
+def fit(df: pd.DataFrame, cfg: DetectConfig = DetectConfig()) -> SpikeModel:
+    if cfg.method != "iforest":
+        raise ValueError(f"method {cfg.method!r} has no model to fit.")
+    work = add_features(df)
+    X = feature_matrix(work, np.float32)
+    return fit_model(X, cfg, key=model_key(cfg, fingerprint(df)), codes=service_codes(work))
 
-    pred = model.predict(X)              # -1 outlier, 1 inlier
-    score = model.decision_function(X)   # higher = more normal
+def score(df: pd.DataFrame, model: SpikeModel) -> pd.DataFrame:
+    work = add_features(df)
+    return _score_features(work, model)
 
-    work["anomaly"] = (pred == -1)
-    work["anomaly_score"] = (-score)     # higher = more anomalous
+def _score_features(work: pd.DataFrame, model: SpikeModel, X=None) -> pd.DataFrame:
+    anomaly, anomaly_score = model.score(feature_matrix(work, np.float32) if X is None else X)
+    return _apply_scores(work, anomaly, anomaly_score)
 
+def spike_like(work: Union[pd.DataFrame, CostFrame]) -> np.ndarray:
+    # rows above their rolling mean and up on the previous day; anomalies elsewhere are "drops"
+    return (np.asarray(work["cost_vs_rollmean"]) > 0) & (np.asarray(work["cost_pct_change"]) > 0)
+
+def _apply_scores(work, anomaly, anomaly_score):
     # keep only spike-like anomalies (avoid "drops")
-    work["is_spike_like"] = (work["cost_vs_rollmean"] > 0) & (work["cost_pct_change"] > 0)
-    work["anomaly"] = work["anomaly"] & work["is_spike_like"]
+    anomaly = np.asarray(anomaly) & spike_like(work)
 
-    return work.drop(columns=["is_spike_like"])
+    count(ROWS_SCORED, len(work))
+    count(ANOMALIES, int(anomaly.sum()))
+    if isinstance(work, CostFrame):
+        return work.with_columns(anomaly=anomaly, anomaly_score=np.asarray(anomaly_score))
+    work["anomaly"] = anomaly
+    work["anomaly_score"] = anomaly_score
+    return work
 
-def explain_anomalies(df_scored: pd.DataFrame) -> Dict[str, Any]:
-    anomalies = df_scored[df_scored["anomaly"]].copy()
-    if anomalies.empty:
-        return {"top_services": [], "total_anomalous_cost": 0.0}
+def detect_spikes(df: Union[pd.DataFrame, CostFrame], cfg: DetectConfig = DetectConfig(),
+                  model: Optional[SpikeModel] = None,
+                  store: Optional[ModelStore] = None) -> Union[pd.DataFrame, CostFrame]:
+    # a CostFrame in gives a CostFrame out (features and scores as compact columns)
+    work = add_features(df)
+    if cfg.method != "iforest":
+        with span("score"):
+            anomaly, anomaly_score = score_statistical(work, cfg.method, cfg.z_threshold, cfg.ewma_alpha)
+        return _apply_scores(work, anomaly, anomaly_score)
+    X = feature_matrix(work, np.float32)
+    if model is None:
+        codes = service_codes(work)
+        model = store.get_or_fit(df, X, cfg, codes) if store is not None else fit_model(X, cfg, codes=codes)
+    return _score_features(work, model, X)
 
-    by_service = anomalies.groupby("service")["cost"].sum().sort_values(ascending=False).reset_index()
-    total = float(anomalies["cost"].sum())
-    top = [{"service": r["service"], "anomalous_cost": float(r["cost"])} for _, r in by_service.head(5).iterrows()]
-    return {"top_services": top, "total_anomalous_cost": total}
\ No newline at end of file
+def explain_anomalies(df_scored: Union[pd.DataFrame, CostFrame], ranking: Optional[Ranking] = None) -> Dict[str, Any]:
+    # pass the Ranking already built for a query on the same frame to skip re-ranking
+    with span("explain"):
+        if ranking is None:
+            ranking = rank_anomalies(df_scored)
+        return ranking.explain()
@@ -1,33 +1,146 @@
+from typing import Any, Dict, Optional, Union
+import numpy as np
 import pandas as pd
 
+from .frame import CostFrame
+from .instrument import span
+
+WINDOW = 7
+MIN_PERIODS = 3
+
+FEATURE_COLS = [
+    "cost",
+    "dow",
+    "dom",
+    "month",
+    "cost_pct_change",
+    "cost_vs_rollmean",
+    "roll_std_filled",
+]
+
+def _fill0(a: np.ndarray) -> np.ndarray:
+    # same as pandas fillna(0.0): NaN only, +/-inf is left alone
+    return np.where(np.isnan(a), 0.0, a)
+
+def _segment_positions(keys: np.ndarray) -> np.ndarray:
+    # position of each row inside its contiguous run of equal keys
+    n = len(keys)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    lengths = np.diff(np.r_[starts, n])
+    return np.arange(n) - np.repeat(starts, lengths)
+
+def _service_order(service: pd.Series) -> Optional[np.ndarray]:
+    # load_cost_csv output is already grouped by service; only reorder when it is not
+    codes, _ = pd.factorize(service, sort=False)
+    if len(codes) < 2 or (np.diff(codes) >= 0).all():
+        return None
+    return np.argsort(codes, kind="stable")
+
+def rolling_stats(cost: np.ndarray, pos: np.ndarray,
+                  window: int = WINDOW, min_periods: int = MIN_PERIODS):
+    count = np.minimum(pos + 1, window)
+    total = cost.copy()
+    for k in range(1, window):
+        total[k:] += np.where(pos[k:] >= k, cost[:-k], 0.0)
+    mean = total / count
+
+    sq = (cost - mean) ** 2
+    for k in range(1, window):
+        sq[k:] += np.where(pos[k:] >= k, (cost[:-k] - mean[k:]) ** 2, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        std = np.sqrt(sq / (count - 1))
+
+    enough = count >= min_periods
+    mean = np.where(enough, mean, np.nan)
+    std = np.where(enough, std, np.nan)
+    return mean, std
+
+def pct_change(cost: np.ndarray, pos: np.ndarray) -> np.ndarray:
+    out = np.zeros_like(cost)
+    if len(cost) > 1:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[1:] = cost[1:] / cost[:-1] - 1.0
+    out[pos == 0] = 0.0
+    return _fill0(out)
+
+def compute_features(df: Union[pd.DataFrame, CostFrame]) -> Dict[str, np.ndarray]:
+    with span("features"):
+        if isinstance(df, CostFrame):
+            return _frame_features(df)
+        return _compute_features(df)
+
+def _frame_features(cf: CostFrame) -> Dict[str, np.ndarray]:
+    # rows are already in segment order: no factorize, no reorder, compact output dtypes
+    pos = cf.positions()
+    cost = cf.cost.astype(np.float64)
+    mean, std = rolling_stats(cost, pos)
+    day = cf.dates
+    month_start = day.astype("datetime64[M]")
+    return {
+        "dow": ((cf.day + 3) % 7).astype(np.int8),  # 1970-01-01 was a Thursday
+        "dom": ((day - month_start).astype(np.int64) + 1).astype(np.int8),
+        "month": (month_start.astype(np.int64) % 12 + 1).astype(np.int8),
+        "cost_rolling_mean_7": mean.astype(np.float32),
+        "cost_rolling_std_7": std.astype(np.float32),
+        "cost_pct_change": pct_change(cost, pos).astype(np.float32),
+        "cost_vs_rollmean": _fill0(cost - mean).astype(np.float32),
+        "roll_std_filled": _fill0(std).astype(np.float32),
+    }
+
+def _compute_features(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    order = _service_order(df["service"])
+    service = df["service"].to_numpy()
+    cost = df["cost"].to_numpy(dtype=np.float64)
+    date = df["date"]
+    if order is not None:
+        service, cost = service[order], cost[order]
+
+    pos = _segment_positions(pd.factorize(service)[0])
+    mean, std = rolling_stats(cost, pos)
+    pct = pct_change(cost, pos)
+    vs_mean = _fill0(cost - mean)
+
+    if order is not None:
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        mean, std, pct, vs_mean = mean[inverse], std[inverse], pct[inverse], vs_mean[inverse]
+
+    return {
+        "dow": date.dt.dayofweek.to_numpy(),
+        "dom": date.dt.day.to_numpy(),
+        "month": date.dt.month.to_numpy(),
+        "cost_rolling_mean_7": mean,
+        "cost_rolling_std_7": std,
+        "cost_pct_change": pct,
+        "cost_vs_rollmean": vs_mean,
+        "roll_std_filled": _fill0(std),
+    }
+
+def add_features(df: Union[pd.DataFrame, CostFrame]) -> Union[pd.DataFrame, CostFrame]:
+    if isinstance(df, CostFrame):
+        return df.with_columns(**compute_features(df))
+    return df.assign(**compute_features(df))
+
+def feature_matrix(df: Union[pd.DataFrame, CostFrame], dtype: Any = np.float64) -> np.ndarray:
+    # IsolationForest casts its input to float32 itself, so building X as float32 gives the
+    # same trees and scores at half the memory
+    X = np.empty((len(df), len(FEATURE_COLS)), dtype=dtype)
+    for j, c in enumerate(FEATURE_COLS):
+        X[:, j] = _fill0(np.asarray(df[c], dtype=np.float64))
+    return X
+
 def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
-    out = df.copy()
-    out["dow"] = out["date"].dt.dayofweek
-    out["dom"] = out["date"].dt.day
-    out["month"] = out["date"].dt.month
-    return out
+    return df.assign(
+        dow=df["date"].dt.dayofweek,
+        dom=df["date"].dt.day,
+        month=df["date"].dt.month,
+    )
 
 def add_rolling_features(df: pd.DataFrame) -> pd.DataFrame:
-    out = df.copy()
-    out["cost_rolling_mean_7"] = (
-        out.groupby("service")["cost"].transform(lambda s: s.rolling(7, min_periods=3).mean())
-    )
-    out["cost_rolling_std_7"] = (
-        out.groupby("service")["cost"].transform(lambda s: s.rolling(7, min_periods=3).std())
-    )
-    out["cost_pct_change"] = out.groupby("service")["cost"].pct_change().fillna(0.0)
-    out["cost_vs_rollmean"] = (out["cost"] - out["cost_rolling_mean_7"]).fillna(0.0)
-    out["roll_std_filled"] = out["cost_rolling_std_7"].fillna(0.0)
-    return out
+    feats = compute_features(df)
+    return df.assign(**{k: v for k, v in feats.items() if k not in ("dow", "dom", "month")})
 
 def build_feature_matrix(df: pd.DataFrame) -> pd.DataFrame:
-    x = df[[
-        "cost",
-        "dow",
-        "dom",
-        "month",
-        "cost_pct_change",
-        "cost_vs_rollmean",
-        "roll_std_filled"
-    ]].copy()
-    return x.fillna(0.0)
\ No newline at end of file
+    return pd.DataFrame(feature_matrix(df), columns=FEATURE_COLS, index=df.index)
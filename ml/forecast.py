@@ -0,0 +1,158 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from .cube import CostCube
+from .instrument import span
+
+METHODS = ("holt", "seasonal_naive")
+SEASON = 7
+# budget status once the projected month total reaches this share of the budget
+AT_RISK_PCT = 90.0
+
+@dataclass
+class ForecastConfig:
+    # "holt": damped additive trend over the weekly-deseasonalized series; "seasonal_naive":
+    # each weekday repeats its mean over the last n_weeks. Both run on the whole day x service
+    # grid at once, one vector op per day, never a per-service fit
+    method: str = "holt"
+    horizon: int = 30
+    alpha: float = 0.3
+    beta: float = 0.05
+    phi: float = 0.9
+    n_weeks: int = 4
+
+    def __post_init__(self):
+        if self.method not in METHODS:
+            raise ValueError(f"method must be one of {', '.join(METHODS)}.")
+        if self.horizon < 1:
+            raise ValueError("horizon must be at least 1.")
+        if not (0 < self.alpha <= 1 and 0 <= self.beta <= 1 and 0 < self.phi <= 1):
+            raise ValueError("alpha and phi must be in (0, 1], beta in [0, 1].")
+
+@dataclass
+class Forecast:
+    history: CostCube
+    days: pd.DatetimeIndex  # forecast days, starting the day after the history ends
+    values: np.ndarray      # (h, k) forecast daily cost per service
+    horizon: int            # requested days; h can be longer to reach the month end
+
+    @property
+    def as_of(self) -> pd.Timestamp:
+        return self.history.days[-1]
+
+    def month_end(self) -> Dict[str, np.ndarray]:
+        # per service: spend so far this month (of the last history day) and the projected total
+        month_start = self.as_of.to_period("M").start_time
+        to_date = self.history.values[self.history.days >= month_start].sum(axis=0)
+        rest = self.values[self.days.to_period("M") == self.as_of.to_period("M")].sum(axis=0)
+        return {"month_to_date": to_date, "forecast_eom": to_date + rest}
+
+    def over_horizon(self) -> np.ndarray:
+        return self.values[:self.horizon].sum(axis=0)
+
+def weekly_profile(x: np.ndarray, weekday: np.ndarray, n_weeks: int) -> np.ndarray:
+    # (7, k) additive weekday offsets from the last n_weeks full weeks; zero with under two weeks
+    weeks = min(len(x) // SEASON, n_weeks)
+    profile = np.zeros((SEASON, x.shape[1]))
+    if weeks < 2:
+        return profile
+    tail = x[-weeks * SEASON:].reshape(weeks, SEASON, -1)
+    offsets = (tail - tail.mean(axis=1, keepdims=True)).mean(axis=0)
+    profile[weekday[-weeks * SEASON:][:SEASON]] = offsets
+    return profile
+
+def _holt(y: np.ndarray, h: int, alpha: float, beta: float, phi: float) -> np.ndarray:
+    # damped additive Holt, all services per step; returns (h, k)
+    level = y[0].copy()
+    trend = np.zeros(y.shape[1]) if len(y) < 2 else (y[min(len(y), SEASON) - 1] - y[0]) / max(min(len(y), SEASON) - 1, 1)
+    for row in y[1:]:
+        prev = level
+        level = alpha * row + (1 - alpha) * (prev + phi * trend)
+        trend = beta * (level - prev) + (1 - beta) * phi * trend
+    damp = np.cumsum(phi ** np.arange(1, h + 1))
+    return level + damp[:, None] * trend
+
+def forecast_costs(cube: CostCube, cfg: ForecastConfig = ForecastConfig()) -> Forecast:
+    if cube.values.shape[0] == 0:
+        raise ValueError("No cost history to forecast from.")
+    with span("forecast"):
+        x = cube.values
+        as_of = cube.days[-1]
+        # cover the rest of the month even when the horizon is shorter
+        month_left = (as_of + pd.offsets.MonthEnd(0) - as_of).days
+        h = max(cfg.horizon, month_left)
+        days = pd.date_range(as_of + pd.Timedelta(days=1), periods=h, freq="D")
+        weekday = cube.days.dayofweek.to_numpy()
+        if cfg.method == "seasonal_naive":
+            weeks = min(len(x) // SEASON, cfg.n_weeks)
+            if weeks == 0:
+                values = np.broadcast_to(x.mean(axis=0), (h, x.shape[1])).copy()
+            else:
+                by_weekday = np.zeros((SEASON, x.shape[1]))
+                by_weekday[weekday[-weeks * SEASON:][:SEASON]] = x[-weeks * SEASON:].reshape(weeks, SEASON, -1).mean(axis=0)
+                values = by_weekday[days.dayofweek.to_numpy()]
+        else:
+            profile = weekly_profile(x, weekday, cfg.n_weeks)
+            values = _holt(x - profile[weekday], h, cfg.alpha, cfg.beta, cfg.phi) + profile[days.dayofweek.to_numpy()]
+        return Forecast(cube, days, np.maximum(values, 0.0), cfg.horizon)
+
+def budget_risk(forecast: Forecast, monthly_budget: float) -> Dict[str, Any]:
+    # projected month total against a budget, and the first day the cumulative spend crosses it
+    if monthly_budget <= 0:
+        raise ValueError("monthly_budget must be positive.")
+    eom = forecast.month_end()
+    to_date, projected = float(eom["month_to_date"].sum()), float(eom["forecast_eom"].sum())
+    pct = projected / monthly_budget * 100.0
+    # month-to-date actuals followed by the forecast to month end, as one cumulative series
+    month = forecast.as_of.to_period("M")
+    seen = forecast.history.days.to_period("M") == month
+    ahead = forecast.days.to_period("M") == month
+    days = forecast.history.days[seen].append(forecast.days[ahead])
+    spent = np.cumsum(np.r_[forecast.history.values[seen].sum(axis=1), forecast.values[ahead].sum(axis=1)])
+    crossed = np.flatnonzero(spent > monthly_budget)
+    exhausted_on = days[crossed[0]].strftime("%Y-%m-%d") if len(crossed) else None
+    return {
+        "monthly_budget": monthly_budget,
+        "month_to_date": to_date,
+        "forecast_eom": projected,
+        "pct_of_budget": round(pct, 2),
+        "over_by": max(projected - monthly_budget, 0.0),
+        "status": "over" if pct > 100.0 else "at_risk" if pct >= AT_RISK_PCT else "ok",
+        "exhausted_on": exhausted_on,
+    }
+
+def forecast_body(forecast: Forecast, monthly_budget: Optional[float] = None,
+                  top_k: Optional[int] = None) -> Dict[str, Any]:
+    # services are listed by projected month total, largest first
+    eom = forecast.month_end()
+    ahead = forecast.over_horizon()
+    order = np.argsort(-eom["forecast_eom"], kind="stable")
+    if top_k is not None:
+        order = order[:top_k]
+    services = forecast.history.services
+    body: Dict[str, Any] = {
+        "as_of": forecast.as_of.strftime("%Y-%m-%d"),
+        "month_end": (forecast.as_of + pd.offsets.MonthEnd(0)).strftime("%Y-%m-%d"),
+        "horizon": forecast.horizon,
+        "total": {
+            "month_to_date": float(eom["month_to_date"].sum()),
+            "forecast_eom": float(eom["forecast_eom"].sum()),
+            "forecast_horizon": float(ahead.sum()),
+        },
+        "daily": {
+            "days": forecast.days.strftime("%Y-%m-%d").tolist(),
+            "forecast": forecast.values.sum(axis=1).tolist(),
+        },
+        "services": [
+            {"service": str(services[i]), "month_to_date": float(eom["month_to_date"][i]),
+             "forecast_eom": float(eom["forecast_eom"][i]), "forecast_horizon": float(ahead[i])}
+            for i in order
+        ],
+        "total_services": len(services),
+    }
+    if monthly_budget is not None:
+        body["budget"] = budget_risk(forecast, monthly_budget)
+    return body
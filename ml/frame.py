@@ -0,0 +1,107 @@
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+@dataclass
+class CostFrame:
+    # compact columnar cost table: rows sorted by (service, day), service i owns rows
+    # offsets[i]:offsets[i + 1]; derived per-row arrays (features, scores) live in `columns`
+    services: np.ndarray  # (k,) sorted service names; codes index into it
+    codes: np.ndarray     # (n,) int32
+    day: np.ndarray       # (n,) int32 days since 1970-01-01
+    cost: np.ndarray      # (n,) float32 (float64 on the cost store's ingest path)
+    offsets: np.ndarray   # (k + 1,) int64
+    columns: Dict[str, np.ndarray] = field(default_factory=dict)
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_arrays(cls, day: np.ndarray, codes: np.ndarray, services: Sequence[str],
+                    cost: np.ndarray, cost_dtype: Any = np.float32) -> "CostFrame":
+        # cost_dtype=np.float64 keeps cents exact where costs are stored rather than scored
+        services = np.asarray(services, dtype=object)
+        codes = np.asarray(codes, dtype=np.int32)
+        day = np.asarray(day, dtype=np.int32)
+        cost = np.asarray(cost, dtype=cost_dtype)
+        if len(services) and (services[1:] < services[:-1]).any():
+            # keep codes in name order so segments come out like a (service, date) sort
+            rank = np.empty(len(services), dtype=np.int32)
+            order = np.argsort(services, kind="stable")
+            rank[order] = np.arange(len(services), dtype=np.int32)
+            services, codes = services[order], rank[codes]
+        if len(codes) > 1 and ((np.diff(codes) < 0).any() or ((np.diff(codes) == 0) & (np.diff(day) < 0)).any()):
+            order = np.lexsort((day, codes))
+            codes, day, cost = codes[order], day[order], cost[order]
+        offsets = np.zeros(len(services) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(services)), out=offsets[1:])
+        return cls(services, codes, day, cost, offsets)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "CostFrame":
+        # df is validated cost data (load_cost_csv / read_cost_csv output)
+        codes, services = pd.factorize(df["service"].astype(str), sort=True)
+        day = df["date"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+        return cls.from_arrays(day, codes, np.asarray(services, dtype=object), df["cost"].to_numpy())
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name == "cost":
+            return self.cost
+        return self.columns[name]
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.codes, self.day, self.cost, self.offsets, *self.columns.values()]
+        return int(sum(a.nbytes for a in arrays) + sum(len(s) for s in self.services))
+
+    @property
+    def dates(self) -> np.ndarray:
+        return self.day.astype("datetime64[D]")
+
+    def positions(self) -> np.ndarray:
+        # position of each row inside its service segment
+        starts = self.offsets[:-1]
+        return np.arange(len(self)) - np.repeat(starts, np.diff(self.offsets))
+
+    def _code(self, service: str) -> int:
+        i = int(np.searchsorted(self.services, service))
+        if i == len(self.services) or self.services[i] != service:
+            raise KeyError(service)
+        return i
+
+    def segment(self, service: str) -> slice:
+        i = self._code(service)
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def for_service(self, service: str) -> "CostFrame":
+        # view of one service's rows; no copy, no scan
+        i = self._code(service)
+        s = slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+        return CostFrame(
+            self.services[i:i + 1], np.zeros(s.stop - s.start, dtype=np.int32), self.day[s], self.cost[s],
+            np.array([0, s.stop - s.start], dtype=np.int64), {k: v[s] for k, v in self.columns.items()},
+        )
+
+    def take(self, rows: np.ndarray) -> "CostFrame":
+        # keep `rows` (boolean mask or ascending index array); segment order is preserved
+        cf = CostFrame.from_arrays(self.day[rows], self.codes[rows], self.services, self.cost[rows])
+        return replace(cf, columns={k: v[rows] for k, v in self.columns.items()}, attrs=dict(self.attrs))
+
+    def with_columns(self, **columns: np.ndarray) -> "CostFrame":
+        return replace(self, columns={**self.columns, **columns}, attrs=dict(self.attrs))
+
+    def to_frame(self, rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+        # decode (optionally only `rows`, a boolean mask or index array) into the DataFrame layout
+        # read_cost_csv + detect_spikes produce
+        take = slice(None) if rows is None else rows
+        df = pd.DataFrame({
+            "date": self.day[take].astype("datetime64[D]").astype("datetime64[ns]"),
+            "service": pd.Categorical.from_codes(self.codes[take], categories=self.services),
+            "cost": self.cost[take],
+            **{k: v[take] for k, v in self.columns.items()},
+        })
+        df.attrs.update(self.attrs)
+        return df
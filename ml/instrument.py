@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# PIPELINE_METRICS=0 turns every span into a flag check; PIPELINE_TRACE_MEMORY=1 adds
+# tracemalloc peak tracking (noticeably slower, meant for debugging slow requests)
+ENABLED = os.environ.get("PIPELINE_METRICS", "1") != "0"
+TRACE_MEMORY = os.environ.get("PIPELINE_TRACE_MEMORY", "0") == "1"
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = tuple(float(1 << p) for p in range(16, 34, 2))  # 64KiB .. 8GiB
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float], label: str = "stage"):
+        self.name, self.help, self.label = name, help, label
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, List[float]] = {}  # label -> bucket counts + [sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: str, amount: float) -> None:
+        i = bisect_left(self.buckets, amount)
+        with self._lock:
+            s = self._series.setdefault(value, [0.0] * (len(self.buckets) + 2))
+            if i < len(self.buckets):
+                s[i] += 1
+            s[-2] += amount
+            s[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for value, s in sorted(self._series.items()):
+                cumulative = 0.0
+                for bound, c in zip(self.buckets, s):
+                    cumulative += c
+                    lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{bound:g}"}} {cumulative:g}')
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="+Inf"}} {s[-1]:g}')
+                lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {s[-2]:g}')
+                lines.append(f'{self.name}_count{{{self.label}="{value}"}} {s[-1]:g}')
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {self.value:g}"]
+
+STAGE_SECONDS = Histogram("costspike_stage_seconds", "Wall time per pipeline stage.", SECONDS_BUCKETS)
+STAGE_PEAK_BYTES = Histogram("costspike_stage_peak_bytes", "Peak traced allocation per pipeline stage.", BYTES_BUCKETS)
+ROWS_IN = Counter("costspike_rows_in_total", "Cost rows parsed from uploads.")
+ROWS_SCORED = Counter("costspike_rows_scored_total", "Rows scored by a detector.")
+ANOMALIES = Counter("costspike_anomalies_total", "Rows flagged as spike anomalies.")
+METRICS = (STAGE_SECONDS, STAGE_PEAK_BYTES, ROWS_IN, ROWS_SCORED, ANOMALIES)
+
+# per-request (name, seconds) list for Server-Timing; None when nobody asked for it
+_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("stage_timings", default=None)
+# running peak of each open memory span, innermost last
+_peaks: ContextVar[Tuple[List[int], ...]] = ContextVar("stage_peaks", default=())
+
+def observe(stage: str, seconds: float) -> None:
+    if not ENABLED:
+        return
+    STAGE_SECONDS.observe(stage, seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+def count(counter: Counter, amount: float) -> None:
+    if ENABLED:
+        counter.inc(amount)
+
+class span:
+    __slots__ = ("stage", "t0", "mem0", "token")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> "span":
+        if ENABLED:
+            if TRACE_MEMORY:
+                self._enter_memory()
+            self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if ENABLED:
+            observe(self.stage, time.perf_counter() - self.t0)
+            if TRACE_MEMORY:
+                self._exit_memory()
+
+    def _enter_memory(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        current, peak = tracemalloc.get_traced_memory()
+        stack = _peaks.get()
+        if stack:
+            stack[-1][0] = max(stack[-1][0], peak)
+        tracemalloc.reset_peak()
+        self.mem0 = current
+        self.token = _peaks.set(stack + ([current],))
+
+    def _exit_memory(self) -> None:
+        mine = max(tracemalloc.get_traced_memory()[1], _peaks.get()[-1][0])
+        _peaks.reset(self.token)
+        stack = _peaks.get()
+        if stack:
+            stack[-1][0] = max(stack[-1][0], mine)
+        STAGE_PEAK_BYTES.observe(self.stage, float(mine - self.mem0))
+
+def collect_timings() -> List[Tuple[str, float]]:
+    timings: List[Tuple[str, float]] = []
+    _timings.set(timings)
+    return timings
+
+def server_timing(timings: List[Tuple[str, float]]) -> str:
+    totals: Dict[str, float] = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+def render() -> str:
+    lines: List[str] = []
+    for m in METRICS:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
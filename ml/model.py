@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple, Union
+
+import joblib
+import numpy as np
+import pandas as pd
+
+if TYPE_CHECKING:
+    from sklearn.ensemble import IsolationForest
+
+from .frame import CostFrame
+from .instrument import span
+
+DEFAULT_MODEL_DIR = os.path.join(tempfile.gettempdir(), "cost-spike-models")
+DEFAULT_TTL_SECONDS = 24 * 3600
+# every upload with new data fits a model: keep the most recently used MAX_MODELS in memory
+# per worker and the newest MAX_FILES on disk, and sweep expired files on each put
+DEFAULT_MAX_MODELS = 32
+DEFAULT_MAX_FILES = 256
+# scoring runs in chunks of SCORE_CHUNK_ROWS rows on up to SCORE_WORKERS threads (the tree
+# traversal releases the GIL); memory beyond X is bounded by workers x chunk
+SCORE_CHUNK_ROWS = int(os.environ.get("SCORE_CHUNK_ROWS", str(1 << 16)))
+SCORE_WORKERS = int(os.environ.get("SCORE_WORKERS", "0")) or os.cpu_count() or 1
+# large-data mode: services keep at least this many training rows in a sampled fit
+MIN_TRAIN_ROWS_PER_SERVICE = 64
+
+def fingerprint(df: Union[pd.DataFrame, CostFrame]) -> str:
+    h = hashlib.sha256()
+    if isinstance(df, CostFrame):
+        h.update(b"costframe")
+        for a in (df.day, df.codes, df.cost):
+            h.update(a.tobytes())
+        h.update("\x1f".join(df.services).encode("utf-8"))
+        return h.hexdigest()
+    h.update(df["date"].to_numpy(dtype="datetime64[ns]").view(np.int64).tobytes())
+    h.update("\x1f".join(df["service"].astype(str)).encode("utf-8"))
+    h.update(df["cost"].to_numpy(dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+def service_codes(df: Union[pd.DataFrame, CostFrame]) -> np.ndarray:
+    return df.codes if isinstance(df, CostFrame) else pd.factorize(df["service"])[0]
+
+def sample_rows(codes: np.ndarray, n: int, seed: int) -> np.ndarray:
+    # stratified by service: every row is kept with its service's rate, about n rows in total,
+    # and small services keep MIN_TRAIN_ROWS_PER_SERVICE rows (or all of them)
+    sizes = np.bincount(codes)
+    rate = np.minimum(1.0, np.maximum(n / len(codes), MIN_TRAIN_ROWS_PER_SERVICE / np.maximum(sizes, 1)))
+    return np.flatnonzero(np.random.default_rng(seed).random(len(codes)) < rate[codes])
+
+def score_forest(forest: "IsolationForest", X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # one traversal of the trees: decision_function is score_samples - offset_ and predict
+    # flags decision < 0, so both come from the same pass
+    decision = forest.score_samples(X) - forest.offset_
+    return decision < 0, -decision
+
+def model_key(cfg: Any, fp: str) -> str:
+    params = json.dumps(asdict(cfg), sort_keys=True, default=str)
+    return hashlib.sha256(f"{params}|{fp}".encode("utf-8")).hexdigest()[:24]
+
+@dataclass
+class SpikeModel:
+    key: str
+    params: Dict[str, Any]
+    forest: "IsolationForest"
+    n_train: int
+    fitted_at: float = field(default_factory=time.time)
+
+    def score(self, X: np.ndarray, chunk_rows: int = SCORE_CHUNK_ROWS,
+              workers: int = SCORE_WORKERS) -> Tuple[np.ndarray, np.ndarray]:
+        # returns (outlier flag, score); higher score = more anomalous
+        with span("score"):
+            if len(X) <= chunk_rows:
+                return score_forest(self.forest, X)
+            anomaly = np.empty(len(X), dtype=bool)
+            score = np.empty(len(X), dtype=np.float64)
+
+            def run(start: int) -> None:
+                stop = min(start + chunk_rows, len(X))
+                anomaly[start:stop], score[start:stop] = score_forest(self.forest, X[start:stop])
+
+            starts = range(0, len(X), chunk_rows)
+            with ThreadPoolExecutor(min(workers, len(starts)), thread_name_prefix="score") as pool:
+                list(pool.map(run, starts))
+            return anomaly, score
+
+def fit_model(X: np.ndarray, cfg: Any, key: Optional[str] = None,
+              codes: Optional[np.ndarray] = None) -> SpikeModel:
+    # scikit-learn is imported on first fit (or first joblib.load) to keep API cold start short
+    from sklearn.ensemble import IsolationForest
+
+    if codes is not None and cfg.max_train_rows is not None and len(X) > cfg.max_train_rows:
+        with span("sample"):
+            X = X[sample_rows(codes, cfg.max_train_rows, cfg.random_state)]
+    forest = IsolationForest(
+        n_estimators=cfg.n_estimators,
+        contamination=cfg.contamination,
+        random_state=cfg.random_state,
+    )
+    with span("fit"):
+        forest.fit(X)
+    return SpikeModel(key=key or "", params=asdict(cfg), forest=forest, n_train=len(X))
+
+class ModelStore:
+    # in-process cache in front of a directory of joblib artifacts; one per worker
+    def __init__(self, path: Optional[str] = DEFAULT_MODEL_DIR, ttl: Optional[float] = DEFAULT_TTL_SECONDS,
+                 max_models: int = DEFAULT_MAX_MODELS, max_files: int = DEFAULT_MAX_FILES):
+        self.path = path
+        self.ttl = ttl
+        self.max_models = max_models
+        self.max_files = max_files
+        self._models: "OrderedDict[str, SpikeModel]" = OrderedDict()
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "ModelStore":
+        return cls(
+            path=os.environ.get("MODEL_CACHE_DIR", DEFAULT_MODEL_DIR) or None,
+            ttl=float(os.environ.get("MODEL_TTL_SECONDS", DEFAULT_TTL_SECONDS)),
+            max_models=int(os.environ.get("MODEL_CACHE_MAX_MODELS", DEFAULT_MAX_MODELS)),
+            max_files=int(os.environ.get("MODEL_CACHE_MAX_FILES", DEFAULT_MAX_FILES)),
+        )
+
+    def _file(self, key: str) -> Optional[str]:
+        return os.path.join(self.path, f"{key}.joblib") if self.path else None
+
+    def _expired(self, model: SpikeModel) -> bool:
+        return self.ttl is not None and time.time() - model.fitted_at > self.ttl
+
+    def _remember(self, model: SpikeModel) -> None:
+        # caller holds the lock; least recently used models fall out first
+        self._models[model.key] = model
+        self._models.move_to_end(model.key)
+        while len(self._models) > self.max_models:
+            self._models.popitem(last=False)
+
+    def _sweep(self) -> None:
+        # caller holds the lock: drop expired artifacts and all but the newest max_files
+        if not self.path:
+            return
+        files = []
+        for name in os.listdir(self.path):
+            if name.endswith(".joblib"):
+                f = os.path.join(self.path, name)
+                try:
+                    files.append((os.path.getmtime(f), f))
+                except OSError:
+                    continue
+        files.sort(reverse=True)
+        now = time.time()
+        for i, (mtime, f) in enumerate(files):
+            if i >= self.max_files or (self.ttl is not None and now - mtime > self.ttl):
+                try:
+                    os.remove(f)
+                except OSError:
+                    pass
+
+    def get(self, key: str) -> Optional[SpikeModel]:
+        with self._lock:
+            model = self._models.get(key)
+            f = self._file(key)
+            if model is None and f and os.path.exists(f):
+                try:
+                    model = joblib.load(f)
+                except Exception:
+                    model = None
+                # anything else saved next to the models (e.g. an old stream state) is a miss
+                if not isinstance(model, SpikeModel):
+                    model = None
+            if model is None:
+                return None
+            if self._expired(model):
+                self._models.pop(key, None)
+                if f and os.path.exists(f):
+                    try:
+                        os.remove(f)
+                    except OSError:  # swept by another worker meanwhile
+                        pass
+                return None
+            self._remember(model)
+            return model
+
+    def put(self, model: SpikeModel) -> SpikeModel:
+        with self._lock:
+            self._remember(model)
+            f = self._file(model.key)
+            if f:
+                tmp = f"{f}.{os.getpid()}.tmp"
+                joblib.dump(model, tmp)
+                os.replace(tmp, f)
+                self._sweep()
+        return model
+
+    def evict(self, key: str) -> None:
+        with self._lock:
+            self._models.pop(key, None)
+            f = self._file(key)
+            if f and os.path.exists(f):
+                os.remove(f)
+
+    def preload(self, limit: int = 16) -> int:
+        # load the newest persisted models into memory, e.g. in a pre-fork master so every
+        # worker starts with them shared copy-on-write; returns how many were loaded
+        if not self.path or limit <= 0:
+            return 0
+        files = [os.path.join(self.path, f) for f in os.listdir(self.path) if f.endswith(".joblib")]
+        files.sort(key=os.path.getmtime, reverse=True)
+        loaded = 0
+        for f in files[:limit]:
+            if self.get(os.path.basename(f)[: -len(".joblib")]) is not None:
+                loaded += 1
+        return loaded
+
+    def get_or_fit(self, df: Union[pd.DataFrame, CostFrame], X: np.ndarray, cfg: Any,
+                   codes: Optional[np.ndarray] = None) -> SpikeModel:
+        # codes: service code per row of X, enables the sampled fit on large inputs
+        key = model_key(cfg, fingerprint(df))
+        model = self.get(key)
+        if model is None:
+            model = self.put(fit_model(X, cfg, key=key, codes=codes))
+        return model
@@ -0,0 +1,145 @@
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .frame import CostFrame
+from .instrument import span
+
+# anomalies are ordered by the sort column, largest first, ties in row (service, date) order;
+# None keeps row order
+SORT_KEYS = ("impact", "anomaly_score", "cost", "date")
+TOP_SERVICES = 5
+
+def estimated_impact(cost: np.ndarray, baseline: np.ndarray) -> np.ndarray:
+    # spend above the 7-day rolling mean; NaN where there is no baseline yet
+    cost = np.asarray(cost, dtype=np.float64)
+    baseline = np.asarray(baseline, dtype=np.float64)
+    return np.maximum(cost - baseline, 0.0, where=~np.isnan(baseline), out=np.full(len(cost), np.nan))
+
+@dataclass
+class Ranking:
+    # the anomaly rows of a scored frame, with impact computed once; queries and the
+    # explanation both read from it instead of re-scanning the frame
+    rows: np.ndarray      # (m,) int64 positions of anomaly rows in the scored frame
+    services: np.ndarray  # (k,) sorted service names
+    codes: np.ndarray     # (m,) int32 into services
+    day: np.ndarray       # (m,) int32 days since 1970-01-01
+    cost: np.ndarray      # (m,) float64
+    impact: np.ndarray    # (m,) float64, NaN without a baseline
+    score: np.ndarray     # (m,) float64 anomaly_score
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.rows, self.codes, self.day, self.cost, self.impact, self.score)
+        return int(sum(a.nbytes for a in arrays) + sum(len(s) for s in self.services))
+
+    def sort_values(self, sort_by: Optional[str]) -> np.ndarray:
+        # larger sorts first; NaN impact goes last
+        if sort_by is None:
+            return -self.rows.astype(np.float64)
+        if sort_by not in SORT_KEYS:
+            raise ValueError(f"sort_by must be one of {', '.join(SORT_KEYS)}.")
+        values = {"impact": self.impact, "anomaly_score": self.score, "cost": self.cost, "date": self.day}[sort_by]
+        values = values.astype(np.float64, copy=False)
+        missing = np.isnan(values)
+        return np.where(missing, -np.inf, values) if missing.any() else values
+
+    def matching(self, services: Optional[Sequence[str]] = None, start: Optional[Any] = None,
+                 end: Optional[Any] = None) -> np.ndarray:
+        keep = np.ones(len(self), dtype=bool)
+        if services is not None:
+            wanted = np.isin(self.services, np.asarray(list(services), dtype=object))
+            keep &= wanted[self.codes]
+        if start is not None:
+            keep &= self.day >= _day(start)
+        if end is not None:
+            keep &= self.day <= _day(end)
+        return keep
+
+    def explain(self) -> Dict[str, Any]:
+        if not len(self):
+            return {"top_services": [], "total_anomalous_cost": 0.0, "total_estimated_impact": 0.0}
+        k = len(self.services)
+        by_service = np.bincount(self.codes, weights=self.cost, minlength=k)
+        hit = np.flatnonzero(np.bincount(self.codes, minlength=k))
+        top = hit[np.argsort(-by_service[hit], kind="stable")[:TOP_SERVICES]]
+        return {
+            "top_services": [{"service": str(self.services[i]), "anomalous_cost": float(by_service[i])} for i in top],
+            "total_anomalous_cost": float(self.cost.sum()),
+            "total_estimated_impact": float(np.nansum(self.impact)),
+        }
+
+def _day(value: Any) -> int:
+    return int(np.datetime64(pd.Timestamp(value).date(), "D").astype(np.int64))
+
+def rank_anomalies(scored: Union[pd.DataFrame, CostFrame]) -> Ranking:
+    with span("rank"):
+        rows = np.flatnonzero(np.asarray(scored["anomaly"]))
+        baseline = np.asarray(scored["cost_rolling_mean_7"])[rows]
+        if isinstance(scored, CostFrame):
+            services, codes, day = scored.services, scored.codes[rows], scored.day[rows]
+        else:
+            anomalies = scored.iloc[rows]
+            codes, services = pd.factorize(anomalies["service"].astype(str), sort=True)
+            services = np.asarray(services, dtype=object)
+            day = anomalies["date"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+        cost = np.asarray(scored["cost"])[rows].astype(np.float64)
+        return Ranking(
+            rows=rows.astype(np.int64), services=services, codes=np.asarray(codes, dtype=np.int32),
+            day=np.asarray(day, dtype=np.int32), cost=cost, impact=estimated_impact(cost, baseline),
+            score=np.asarray(scored["anomaly_score"])[rows].astype(np.float64),
+        )
+
+def encode_cursor(sort_by: Optional[str], value: float, row: int) -> str:
+    raw = json.dumps({"s": sort_by, "v": value, "r": row}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str, sort_by: Optional[str]) -> Tuple[float, int]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        value, row = float(data["v"]), int(data["r"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError("Malformed cursor.")
+    if data.get("s") != sort_by:
+        raise ValueError("Cursor was issued for a different sort_by.")
+    return value, row
+
+def query(ranking: Ranking, top_k: Optional[int] = None, sort_by: Optional[str] = None,
+          services: Optional[Sequence[str]] = None, start: Optional[Any] = None, end: Optional[Any] = None,
+          cursor: Optional[str] = None) -> Tuple[np.ndarray, int, Optional[str]]:
+    # returns (scored-frame positions of the page in order, matching anomalies, next cursor);
+    # the cursor is the last returned (sort value, row), so pages stay stable and each page
+    # costs one pass plus a partial selection of top_k, never a full sort
+    if top_k is not None and top_k < 1:
+        raise ValueError("top_k must be at least 1.")
+    with span("query"):
+        values = ranking.sort_values(sort_by)
+        if services is None and start is None and end is None and cursor is None:
+            idx = np.arange(len(ranking))
+            matched = len(ranking)
+        else:
+            keep = ranking.matching(services, start, end)
+            matched = int(keep.sum())
+            if cursor is not None:
+                after_value, after_row = decode_cursor(cursor, sort_by)
+                keep &= (values < after_value) | ((values == after_value) & (ranking.rows > after_row))
+            idx = np.flatnonzero(keep)
+        more = top_k is not None and len(idx) > top_k
+        if more:
+            # k-th largest value; everything above it is in, ties at it are taken in row order
+            candidates = values[idx]
+            cut = np.partition(candidates, len(idx) - top_k)[len(idx) - top_k]
+            above = idx[candidates > cut]
+            idx = np.concatenate([above, idx[candidates == cut][: top_k - len(above)]])
+        if sort_by is not None or more:
+            idx = idx[np.lexsort((ranking.rows[idx], -values[idx]))]
+        next_cursor = encode_cursor(sort_by, float(values[idx[-1]]), int(ranking.rows[idx[-1]])) if more else None
+        return ranking.rows[idx], matched, next_cursor
@@ -0,0 +1,193 @@
+from dataclasses import dataclass, field
+from typing import IO, Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from .cost_io import CHUNK_ROWS, COST_DTYPE, _read_chunks
+from .detect import DetectConfig, detect_spikes
+from .frame import CostFrame
+from .instrument import span
+from .model import ModelStore
+from .rank import estimated_impact
+
+DEFAULT_HIERARCHY = ("account", "region", "service")
+TOTAL = "(total)"
+SEP = "/"
+
+@dataclass
+class Rollup:
+    # every level of a hierarchy as segments of one CostFrame: node names are paths such as
+    # "acct-1/us-east-1/EC2"; level and parent are indexed by the frame's service code
+    frame: CostFrame
+    hierarchy: Tuple[str, ...]
+    level: np.ndarray   # (k,) int8 depth: 0 = total, len(hierarchy) = leaf
+    parent: np.ndarray  # (k,) int32 code of the parent node, -1 for the total
+    raw_rows: int = 0
+    levels: List[str] = field(default_factory=list)  # level names by depth
+
+def _parse_hierarchy(hierarchy: Union[str, Sequence[str]]) -> Tuple[str, ...]:
+    names = [h.strip().lower() for h in (hierarchy.split(",") if isinstance(hierarchy, str) else hierarchy)]
+    names = [h for h in names if h]
+    if not names or len(set(names)) != len(names) or {"date", "cost"} & set(names):
+        raise ValueError("hierarchy must be distinct label columns, e.g. account,region,service.")
+    return tuple(names)
+
+def _sum_by(key: np.ndarray, cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # summed cost per distinct key, keys ascending; hashing keeps this linear in the rows
+    ids, uniq = pd.factorize(key, sort=False)
+    sums = np.bincount(ids, weights=cost, minlength=len(uniq))
+    order = np.argsort(uniq, kind="stable")
+    return np.asarray(uniq)[order], sums[order]
+
+def _escape(label: str) -> str:
+    # labels may contain the separator ("team/x"): percent-encode it so every path is unique,
+    # and keep a top-level label from posing as the total
+    label = label.replace("%", "%25").replace(SEP, "%2F")
+    return label.replace("(", "%28") if label == TOTAL else label
+
+def _node_names(radix: np.ndarray, cats: List[pd.Categorical]) -> np.ndarray:
+    # decode mixed-radix label keys back into "a/b/c" paths
+    if not cats:
+        return np.array([TOTAL] * len(radix), dtype=object)
+    parts = []
+    for c in reversed(cats):
+        n = len(c.categories)
+        names = np.array([_escape(str(v)) for v in c.categories], dtype=object)
+        parts.append(names[radix % n])
+        radix = radix // n
+    return np.array([SEP.join(p) for p in zip(*reversed(parts))], dtype=object)
+
+def build_rollup(source: Union[str, IO], hierarchy: Union[str, Sequence[str]] = DEFAULT_HIERARCHY,
+                 chunksize: int = CHUNK_ROWS) -> Rollup:
+    # one pass over the raw rows down to (leaf, day) sums; each parent level is then summed
+    # from its child level's rows, which are far fewer than the raw line items
+    hierarchy = _parse_hierarchy(hierarchy)
+    extra = [h for h in hierarchy if h != "service"]
+    labels: Dict[str, List[pd.Categorical]] = {h: [] for h in hierarchy}
+    days: List[np.ndarray] = []
+    costs: List[np.ndarray] = []
+    with span("rollup_parse"):
+        for chunk in _read_chunks(source, chunksize, extra):
+            for h in hierarchy:
+                labels[h].append(pd.Categorical(chunk[h]))
+            days.append(chunk["date"].to_numpy(dtype="datetime64[D]").astype(np.int64))
+            costs.append(chunk["cost"].to_numpy(dtype=np.float64))
+    with span("rollup_aggregate"):
+        day = np.concatenate(days)
+        first_day = int(day.min())
+        n_days = int(day.max()) - first_day + 1
+        cats = [union_categoricals(labels.pop(h), sort_categories=True) for h in hierarchy]
+        sizes = [len(c.categories) for c in cats]
+        if np.prod([float(n) for n in sizes]) * n_days >= 2.0 ** 62:
+            raise ValueError("Too many distinct labels in the hierarchy.")
+
+        # mixed-radix label key per raw row: a node's parent key is its key // (last level size)
+        radix = np.zeros(len(day), dtype=np.int64)
+        for c, n in zip(cats, sizes):
+            radix = radix * n + c.codes
+        key, cost = _sum_by(radix * n_days + (day - first_day), np.concatenate(costs))
+        raw_rows = len(day)
+        del radix, day, days, costs
+
+        # levels from the leaves up; each sums the (node, day) rows of the level below it
+        L = len(hierarchy)
+        level_keys: List[np.ndarray] = []
+        level_rows: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        for depth in range(L, -1, -1):
+            if depth < L:
+                key, cost = _sum_by(key // n_days // sizes[depth] * n_days + key % n_days, cost)
+            level_keys.append(np.unique(key // n_days))
+            level_rows.append((key // n_days, key % n_days, cost))
+
+        offsets = np.cumsum([0] + [len(k) for k in level_keys])
+        names = np.concatenate([_node_names(k, cats[:L - i]) for i, k in enumerate(level_keys)])
+        level = np.concatenate([np.full(len(k), L - i, dtype=np.int8) for i, k in enumerate(level_keys)])
+        parent = np.full(len(names), -1, dtype=np.int64)
+        for i, k in enumerate(level_keys[:-1]):
+            parent[offsets[i]:offsets[i + 1]] = offsets[i + 1] + np.searchsorted(level_keys[i + 1], k // sizes[L - i - 1])
+        codes = np.concatenate([offsets[i] + np.searchsorted(level_keys[i], node) for i, (node, _, _) in enumerate(level_rows)])
+        # CostFrame orders nodes by name: rank them here and carry codes, level and parent over
+        # by position rather than looking names up
+        order = np.argsort(names, kind="stable")
+        rank = np.empty(len(names), dtype=np.int64)
+        rank[order] = np.arange(len(names))
+        cf = CostFrame.from_arrays(
+            np.concatenate([d for _, d, _ in level_rows]) + first_day, rank[codes], names[order],
+            np.concatenate([c for _, _, c in level_rows]).astype(COST_DTYPE),
+        )
+        new_level = np.empty(len(names), dtype=np.int8)
+        new_level[rank] = level
+        new_parent = np.full(len(names), -1, dtype=np.int32)
+        has_parent = parent >= 0
+        new_parent[rank[has_parent]] = rank[parent[has_parent]]
+    levels = ["total"] + [SEP.join(hierarchy[:d]) for d in range(1, L + 1)]
+    return Rollup(cf, hierarchy, new_level, new_parent, raw_rows, levels)
+
+def attribute_drivers(scored: CostFrame, rollup: Rollup) -> CostFrame:
+    # for each anomalous parent row, the child with the largest rise over its 7-day mean on
+    # the same day, and that rise as a share of the parent's; -1 / NaN for leaves
+    with span("rollup_attribute"):
+        codes, day = scored.codes, scored.day.astype(np.int64)
+        delta = np.nan_to_num(scored.cost.astype(np.float64) - scored["cost_rolling_mean_7"], nan=0.0)
+        first, n_days = int(day.min()), int(day.max()) - int(day.min()) + 1
+        parent = rollup.parent[codes].astype(np.int64)
+        child = np.flatnonzero(parent >= 0)
+        key = parent[child] * n_days + (day[child] - first)
+        order = child[np.lexsort((delta[child], key))]
+        sorted_key = parent[order] * n_days + (day[order] - first)
+        last = np.r_[sorted_key[1:] != sorted_key[:-1], True]
+        group_key, best = sorted_key[last], order[last]
+
+        driver = np.full(len(scored), -1, dtype=np.int32)
+        share = np.full(len(scored), np.nan, dtype=np.float32)
+        rows = np.flatnonzero(np.asarray(scored["anomaly"]))
+        if len(rows) and len(group_key):
+            want = codes[rows].astype(np.int64) * n_days + (day[rows] - first)
+            pos = np.minimum(np.searchsorted(group_key, want), len(group_key) - 1)
+            found = group_key[pos] == want
+            rows, pos = rows[found], pos[found]
+            driver[rows] = codes[best[pos]]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                share[rows] = np.where(delta[rows] > 0, delta[best[pos]] / delta[rows], np.nan)
+        return scored.with_columns(driver=driver, driver_share=share)
+
+def detect_rollup(rollup: Rollup, cfg: DetectConfig = DetectConfig(),
+                  store: Optional[ModelStore] = None) -> CostFrame:
+    # every node of every level is scored in one detect_spikes call over the combined frame
+    scored = detect_spikes(rollup.frame, cfg, store=store)
+    return attribute_drivers(scored, rollup)
+
+def rollup_body(scored: CostFrame, rollup: Rollup, rows: np.ndarray, **extra: Any) -> Dict[str, Any]:
+    # rows: positions of the anomalies to return, in output order
+    level = rollup.level[scored.codes]
+    impact = estimated_impact(scored.cost[rows], scored["cost_rolling_mean_7"][rows])
+    anomaly = np.asarray(scored["anomaly"])
+    driver = scored["driver"][rows]
+    share = scored["driver_share"][rows]
+    return {
+        "hierarchy": list(rollup.hierarchy),
+        "raw_rows": rollup.raw_rows,
+        "nodes": int(len(rollup.frame.services)),
+        "total_rows": int(len(scored)),
+        "total_anomalies": int(anomaly.sum()),
+        "by_level": {
+            rollup.levels[d]: {"nodes": int((rollup.level == d).sum()), "anomalies": int((anomaly & (level == d)).sum())}
+            for d in range(len(rollup.levels))
+        },
+        "anomalies": [
+            {
+                "node": str(scored.services[scored.codes[r]]),
+                "level": rollup.levels[level[r]],
+                "date": str(np.datetime64(int(scored.day[r]), "D")),
+                "cost": float(scored.cost[r]),
+                "anomaly_score": float(scored["anomaly_score"][r]),
+                "estimated_impact": None if np.isnan(i) else float(i),
+                "driver": None if d < 0 else str(scored.services[d]),
+                "driver_share": None if np.isnan(s) else round(float(s), 4),
+            }
+            for r, i, d, s in zip(rows.tolist(), impact, driver.tolist(), share.tolist())
+        ],
+        **extra,
+    }
@@ -0,0 +1,181 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, BrokenExecutor, Future, ProcessPoolExecutor, wait
+from dataclasses import asdict
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .detect import DetectConfig, _apply_scores, detect_spikes
+from .features import add_features, feature_matrix
+from .instrument import span
+from .model import score_forest
+
+# a request leaves shards that miss this deadline unscored rather than waiting on them
+SHARD_TIMEOUT_SECONDS = 60.0
+
+class ShardPool:
+    # one long-lived pool of spawned processes shared by all sharded requests (forking a
+    # multi-threaded server can copy held locks into the child). A process pool cannot lose
+    # one worker without breaking, so shards still running at a deadline are terminated with
+    # the whole pool, which is recreated on next use; other requests resubmit the shards
+    # they had in flight on it (see detect_spikes_sharded)
+    def __init__(self):
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._workers = 0
+        self._lock = threading.Lock()
+
+    def get(self, max_workers: int) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is not None and self._workers != max_workers:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("spawn"))
+                self._workers = max_workers
+            return self._pool
+
+    def terminate(self, pool: ProcessPoolExecutor) -> None:
+        # kill `pool` if it is still the current one (another request may have replaced it)
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        for proc in list((getattr(pool, "_processes", None) or {}).values()):
+            proc.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+SHARD_POOL = ShardPool()
+
+def plan_shards(service: pd.Series, n_shards: Optional[int] = None) -> List[Tuple[int, int]]:
+    # contiguous row ranges over a service-grouped frame; one per service, or
+    # services packed greedily into n_shards groups of similar row counts
+    codes = pd.factorize(service)[0]
+    n = len(codes)
+    if n == 0:
+        return []
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    stops = np.r_[starts[1:], n]
+    if not n_shards or n_shards >= len(starts):
+        return list(zip(starts.tolist(), stops.tolist()))
+
+    target = n / n_shards
+    bounds, begin = [], 0
+    for stop in stops:
+        if stop - begin >= target and len(bounds) < n_shards - 1:
+            bounds.append((begin, int(stop)))
+            begin = int(stop)
+    if begin < n:
+        bounds.append((begin, n))
+    return bounds
+
+def _fit_score_shard(shm_name: str, shape: Tuple[int, int], start: int, stop: int,
+                     params: Dict[str, Any]) -> Tuple[int, int, np.ndarray, np.ndarray]:
+    from sklearn.ensemble import IsolationForest
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        X = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)[start:stop].copy()
+    finally:
+        shm.close()
+    forest = IsolationForest(
+        n_estimators=params["n_estimators"],
+        contamination=params["contamination"],
+        random_state=params["random_state"],
+    )
+    forest.fit(X)
+    return (start, stop, *score_forest(forest, X))
+
+def detect_spikes_sharded(df: pd.DataFrame, cfg: DetectConfig = DetectConfig(),
+                          max_workers: Optional[int] = None, by: str = "group",
+                          shard_timeout: Optional[float] = SHARD_TIMEOUT_SECONDS) -> pd.DataFrame:
+    # one IsolationForest per shard instead of one global model across all services;
+    # by="service" fits every service separately, by="group" packs services into one shard per worker
+    if by not in ("service", "group"):
+        raise ValueError("by must be 'service' or 'group'.")
+    if cfg.method != "iforest":
+        # statistical detectors are already per-service and linear time; nothing to shard
+        return detect_spikes(df, cfg)
+    max_workers = max_workers or os.cpu_count() or 1
+    codes = pd.factorize(df["service"])[0]
+    order = None if len(codes) < 2 or (np.diff(codes) >= 0).all() else np.argsort(codes, kind="stable")
+    work = add_features(df if order is None else df.iloc[order])
+    X = feature_matrix(work, np.float32)
+    shards = plan_shards(work["service"], None if by == "service" else max_workers)
+
+    anomaly = np.zeros(len(work), dtype=bool)
+    score = np.full(len(work), np.nan)
+    unscored: List[str] = []
+
+    if len(work):
+        with span("fit_score_sharded"):
+            shm = shared_memory.SharedMemory(create=True, size=X.nbytes)
+            deadline = None if shard_timeout is None else time.monotonic() + shard_timeout
+            params = asdict(cfg)
+            futures: Dict[Future, Tuple[int, int, ProcessPoolExecutor, int]] = {}
+            failed: List[Tuple[int, int]] = []
+
+            def submit(a: int, b: int, attempt: int) -> Optional[Future]:
+                for _ in range(2):
+                    pool = SHARD_POOL.get(max_workers)
+                    try:
+                        f = pool.submit(_fit_score_shard, shm.name, X.shape, a, b, params)
+                    except (BrokenExecutor, RuntimeError):
+                        # broken or shut down since get(): replace it and try once more
+                        SHARD_POOL.terminate(pool)
+                        continue
+                    futures[f] = (a, b, pool, attempt)
+                    return f
+                failed.append((a, b))
+                return None
+
+            try:
+                np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)[:] = X
+                pending = {f for f in (submit(a, b, 0) for a, b in shards) if f is not None}
+                # a shard that fails or misses the deadline is left unflagged instead of failing the request
+                while pending:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                    for f in done:
+                        a, b, pool, attempt = futures[f]
+                        error = f.exception()
+                        if error is None:
+                            _, _, flag, s = f.result()
+                            anomaly[a:b], score[a:b] = flag, s
+                        elif isinstance(error, BrokenExecutor) and attempt == 0:
+                            # the pool died under this shard (another request's deadline or a
+                            # crashed worker): run it again on a fresh pool
+                            SHARD_POOL.terminate(pool)
+                            retry = submit(a, b, 1)
+                            if retry is not None:
+                                pending.add(retry)
+                        else:
+                            failed.append((a, b))
+                running = [f for f in pending if not f.cancel()]
+                for pool in {futures[f][2] for f in running}:
+                    # past the deadline: stop burning cores on it
+                    SHARD_POOL.terminate(pool)
+                for a, b in failed + [futures[f][:2] for f in pending]:
+                    unscored.extend(str(v) for v in work["service"].iloc[a:b].unique())
+            finally:
+                shm.close()
+                shm.unlink()
+
+    work = _apply_scores(work, anomaly, score)
+    if order is not None:
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        work = work.iloc[inverse]
+    work.attrs["unscored_services"] = sorted(unscored)
+    return work
@@ -0,0 +1,142 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import closing, contextmanager
+from typing import Any, Dict, Iterator, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .detect import DetectConfig, detect_spikes
+from .features import WINDOW
+from .frame import CostFrame
+from .instrument import span
+from .model import ModelStore
+
+DEFAULT_STORE_PATH = os.path.join(tempfile.gettempdir(), "cost-spike-store", "costs.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS services (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+-- one row per (service, day); clustered on the key so a service's date range is one contiguous read
+CREATE TABLE IF NOT EXISTS daily_costs (
+    service_id INTEGER NOT NULL REFERENCES services(id),
+    day INTEGER NOT NULL,
+    cost REAL NOT NULL,
+    PRIMARY KEY (service_id, day)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS daily_costs_day ON daily_costs (day);
+"""
+
+def _day(value: Any) -> int:
+    return int(np.datetime64(pd.Timestamp(value).date(), "D").astype(np.int64))
+
+def _iso(day: Optional[int]) -> Optional[str]:
+    return None if day is None else str(np.datetime64(int(day), "D"))
+
+def daily_totals(cf: CostFrame) -> CostFrame:
+    # collapse repeated (service, day) rows, e.g. several line items, into one daily total;
+    # sums stay float64 (parse with cost_dtype=np.float64 so nothing was rounded before either)
+    if len(cf) < 2:
+        return cf
+    new = np.r_[True, (np.diff(cf.codes) != 0) | (np.diff(cf.day) != 0)]
+    if new.all():
+        return cf
+    starts = np.flatnonzero(new)
+    cost = np.add.reduceat(cf.cost.astype(np.float64), starts)
+    return CostFrame.from_arrays(cf.day[starts], cf.codes[starts], cf.services, cost, cost_dtype=np.float64)
+
+class CostStore:
+    # embedded SQLite store of daily cost per service; loads are append-only unless replace=True
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # ":memory:" (tests) shares one connection behind a lock; files get a connection per call
+        self._memory = sqlite3.connect(path, check_same_thread=False) if path == ":memory:" else None
+        self._lock = threading.Lock()
+        with self._db() as db:
+            db.executescript(SCHEMA)
+
+    @classmethod
+    def from_env(cls) -> "CostStore":
+        return cls(os.environ.get("COST_STORE_PATH", DEFAULT_STORE_PATH))
+
+    @contextmanager
+    def _db(self) -> Iterator[sqlite3.Connection]:
+        if self._memory is not None:
+            with self._lock:
+                yield self._memory
+            return
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")  # readers are not blocked by a load in progress
+            yield db
+        finally:
+            db.close()
+
+    def load(self, cf: CostFrame, replace: bool = False) -> Dict[str, int]:
+        # returns inserted/skipped counts; existing (service, day) rows are kept unless replace.
+        # Costs are stored as given: pass a float64 frame, read() downcasts for scoring
+        cf = daily_totals(cf)
+        with self._db() as db, span("store_load"):
+            with db:
+                db.executemany("INSERT OR IGNORE INTO services (name) VALUES (?)", ((str(s),) for s in cf.services))
+                ids = dict(db.execute("SELECT name, id FROM services"))
+                service_ids = np.array([ids[str(s)] for s in cf.services], dtype=np.int64)
+                verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+                before = db.total_changes
+                db.executemany(
+                    f"{verb} INTO daily_costs (service_id, day, cost) VALUES (?, ?, ?)",
+                    zip(service_ids[cf.codes].tolist(), cf.day.tolist(), cf.cost.astype(np.float64).tolist()),
+                )
+                written = db.total_changes - before
+        return {"rows": len(cf), "inserted": written, "skipped": len(cf) - written}
+
+    def read(self, start: Optional[Any] = None, end: Optional[Any] = None,
+             services: Optional[Sequence[str]] = None) -> CostFrame:
+        # only the requested services and days are read; rows come back in primary-key order
+        sql, params = "SELECT id, name FROM services", []
+        if services is not None:
+            sql += f" WHERE name IN ({', '.join('?' * len(services))})"
+            params.extend(services)
+        rows = np.zeros((0, 3))
+        with self._db() as db, span("store_read"):
+            names = dict(db.execute(sql, params)) if services is None or len(services) else {}
+            if names:
+                where, params = [f"service_id IN ({', '.join('?' * len(names))})"], list(names)
+                if start is not None:
+                    where.append("day >= ?")
+                    params.append(_day(start))
+                if end is not None:
+                    where.append("day <= ?")
+                    params.append(_day(end))
+                sql = f"SELECT service_id, day, cost FROM daily_costs WHERE {' AND '.join(where)} ORDER BY service_id, day"
+                with closing(db.execute(sql, params)) as cur:
+                    rows = np.array(cur.fetchall(), dtype=np.float64).reshape(-1, 3)
+        ids = rows[:, 0].astype(np.int64)
+        used = np.unique(ids)
+        return CostFrame.from_arrays(rows[:, 1], np.searchsorted(used, ids), [names[int(i)] for i in used], rows[:, 2])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._db() as db:
+            rows, first, last = db.execute("SELECT COUNT(*), MIN(day), MAX(day) FROM daily_costs").fetchone()
+            n_services = db.execute("SELECT COUNT(*) FROM services").fetchone()[0]
+        return {"rows": rows, "services": n_services, "first_date": _iso(first), "last_date": _iso(last)}
+
+def detect_range(store: CostStore, start: Optional[Any] = None, end: Optional[Any] = None,
+                 services: Optional[Sequence[str]] = None, cfg: DetectConfig = DetectConfig(),
+                 models: Optional[ModelStore] = None) -> CostFrame:
+    # WINDOW days before `start` are read as warm-up so rolling features at the start of the
+    # range see the same history as a full run; they are scored but not returned
+    lookback = None if start is None else pd.Timestamp(start) - pd.Timedelta(days=WINDOW)
+    history = store.read(lookback, end, services)
+    if len(history) == 0:
+        return history
+    scored = detect_spikes(history, cfg, store=models)
+    if start is None:
+        return scored
+    return scored.take(scored.day >= _day(start))
@@ -0,0 +1,143 @@
+import fcntl
+import math
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterator, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from .detect import DetectConfig, _score_features, fit
+from .features import MIN_PERIODS, WINDOW, add_features, add_time_features, feature_matrix
+from .instrument import span
+from .model import ModelStore, SpikeModel, service_codes
+
+@dataclass
+class ServiceState:
+    window: Deque[float] = field(default_factory=lambda: deque(maxlen=WINDOW))
+    total: float = 0.0
+    prev: Optional[float] = None
+    last_date: Optional[pd.Timestamp] = None
+
+    def push(self, date: pd.Timestamp, cost: float) -> Dict[str, float]:
+        if self.last_date is not None and date <= self.last_date:
+            raise ValueError(f"Rows must arrive in date order per service (got {date.date()} after {self.last_date.date()}).")
+        if len(self.window) == WINDOW:
+            self.total -= self.window[0]
+        self.window.append(cost)
+        self.total += cost
+
+        n = len(self.window)
+        mean = self.total / n if n >= MIN_PERIODS else math.nan
+        if n >= MIN_PERIODS:
+            # two-pass over the (at most 7) window values: O(1) and as stable as the batch path
+            std = math.sqrt(sum((c - mean) ** 2 for c in self.window) / (n - 1))
+        else:
+            std = math.nan
+
+        if self.prev is None:
+            pct = 0.0
+        elif self.prev == 0.0:
+            pct = 0.0 if cost == 0.0 else math.copysign(math.inf, cost)
+        else:
+            pct = cost / self.prev - 1.0
+
+        self.prev = cost
+        self.last_date = date
+        return {
+            "cost_rolling_mean_7": mean,
+            "cost_rolling_std_7": std,
+            "cost_pct_change": pct,
+            "cost_vs_rollmean": 0.0 if math.isnan(mean) else cost - mean,
+            "roll_std_filled": 0.0 if math.isnan(std) else std,
+        }
+
+    @classmethod
+    def from_history(cls, dates: pd.Series, costs: np.ndarray) -> "ServiceState":
+        tail = [float(c) for c in costs[-WINDOW:]]
+        return cls(
+            window=deque(tail, maxlen=WINDOW),
+            total=float(sum(tail)),
+            prev=tail[-1] if tail else None,
+            last_date=dates.iloc[-1] if len(dates) else None,
+        )
+
+class StreamingDetector:
+    # keeps per-service rolling state so new rows are scored without re-featurizing history
+    def __init__(self, model: SpikeModel, states: Optional[Dict[str, ServiceState]] = None):
+        self.model = model
+        self.states: Dict[str, ServiceState] = states or {}
+
+    @classmethod
+    def bootstrap(cls, history: pd.DataFrame, cfg: DetectConfig = DetectConfig(),
+                  store: Optional[ModelStore] = None) -> "StreamingDetector":
+        if store is not None:
+            work = add_features(history)
+            model = store.get_or_fit(history, feature_matrix(work, np.float32), cfg, service_codes(work))
+        else:
+            model = fit(history, cfg)
+        det = cls(model)
+        for service, g in history.groupby("service", sort=False, observed=True):
+            det.states[str(service)] = ServiceState.from_history(g["date"], g["cost"].to_numpy(dtype=np.float64))
+        return det
+
+    def ingest(self, new: pd.DataFrame) -> pd.DataFrame:
+        new = new.sort_values(["service", "date"], kind="stable")
+        if new.duplicated(["service", "date"]).any():
+            raise ValueError("Duplicate (date, service) rows in incremental batch.")
+        for service, first in new.groupby("service", sort=False, observed=True)["date"].min().items():
+            state = self.states.get(str(service))
+            if state is not None and state.last_date is not None and first <= state.last_date:
+                raise ValueError(f"'{service}' already has data up to {state.last_date.date()}; only newer rows can be appended.")
+
+        work = add_time_features(new)
+        with span("features"):
+            rows = [
+                self.states.setdefault(str(s), ServiceState()).push(d, float(c))
+                for s, d, c in zip(work["service"], work["date"], work["cost"])
+            ]
+        feats = pd.DataFrame(rows, index=work.index, columns=[
+            "cost_rolling_mean_7", "cost_rolling_std_7", "cost_pct_change", "cost_vs_rollmean", "roll_std_filled",
+        ])
+        work = pd.concat([work, feats], axis=1)
+        return _score_features(work, self.model)
+
+    def save(self, path: str) -> None:
+        # the model travels with the state: a daily ingest must not depend on the model
+        # cache's TTL still holding it
+        tmp = f"{path}.{os.getpid()}.tmp"
+        joblib.dump({"model_key": self.model.key, "model": self.model, "states": self.states}, tmp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, store: Optional[ModelStore] = None) -> Optional["StreamingDetector"]:
+        if not os.path.exists(path):
+            return None
+        saved = joblib.load(path)
+        model = saved.get("model")
+        if model is None and store is not None:
+            # state files written before the model was stored inline
+            model = store.get(saved["model_key"])
+        if model is None:
+            return None
+        return cls(model, saved["states"])
+
+_state_locks: Dict[str, threading.Lock] = {}
+_state_locks_guard = threading.Lock()
+
+@contextmanager
+def state_lock(path: str) -> Iterator[None]:
+    # serializes load -> ingest -> save on one state file across threads and worker processes,
+    # so concurrent ingests cannot overwrite each other's updates
+    with _state_locks_guard:
+        lock = _state_locks.setdefault(path, threading.Lock())
+    with lock, open(f"{path}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
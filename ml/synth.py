@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+def generate_costs(n_services: int = 20, n_days: int = 90, seed: int = 0,
+                   spike_rate: float = 0.01, start: str = "2025-01-01") -> pd.DataFrame:
+    # N services x M days of daily cost with trend, weekly seasonality, noise and
+    # labeled multiplicative spikes (is_spike); sorted like load_cost_csv output
+    rng = np.random.default_rng(seed)
+    days = np.arange(n_days)
+
+    level = 10 ** rng.uniform(0.5, 4.0, n_services)                 # $3 .. $10k per day
+    trend = rng.normal(0.0005, 0.001, n_services)                    # relative growth per day
+    weekly = rng.uniform(0.0, 0.25, n_services)                      # weekday/weekend swing
+    phase = rng.integers(0, 7, n_services)
+    noise = rng.uniform(0.02, 0.08, n_services)
+
+    season = 1.0 + weekly[:, None] * np.sin(2 * np.pi * (days[None, :] + phase[:, None]) / 7)
+    growth = 1.0 + trend[:, None] * days[None, :]
+    cost = level[:, None] * growth * season * (1.0 + noise[:, None] * rng.standard_normal((n_services, n_days)))
+
+    # spikes only after the first rolling window so they are detectable
+    is_spike = (rng.random((n_services, n_days)) < spike_rate) & (days[None, :] >= 7)
+    cost = np.where(is_spike, cost * rng.uniform(2.5, 6.0, (n_services, n_days)), cost)
+
+    width = len(str(max(n_services - 1, 0)))
+    return pd.DataFrame({
+        "date": np.tile(pd.date_range(start, periods=n_days).values, n_services),
+        "service": np.repeat([f"svc-{i:0{width}d}" for i in range(n_services)], n_days),
+        "cost": np.clip(cost, 0.0, None).round(2).ravel(),
+        "is_spike": is_spike.ravel(),
+    })
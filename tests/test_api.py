@@ -1,4 +1,5 @@
 import pandas as pd
+import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 
@@ -19,4 +20,288 @@ def test_detect_endpoint():
     r = client.post("/detect", files={"file": ("costs.csv", csv_bytes, "text/csv")})
     assert r.status_code == 200
     body = r.json()
-    assert "anomalies" in body
\ No newline at end of file
+    assert "anomalies" in body
+
+def test_fit_then_score_with_model_key():
+    df = pd.DataFrame({
+        "date": ["2025-01-01","2025-01-02","2025-01-03","2025-01-04","2025-01-05","2025-01-06","2025-01-07","2025-01-08"],
+        "service": ["EC2"]*8,
+        "cost": [10,10,10,10,10,10,10,40],
+    })
+    csv_bytes = df.to_csv(index=False).encode("utf-8")
+    r = client.post("/model/fit", files={"file": ("costs.csv", csv_bytes, "text/csv")})
+    assert r.status_code == 200
+    key = r.json()["model_key"]
+
+    r = client.post(f"/detect?model_key={key}", files={"file": ("costs.csv", csv_bytes, "text/csv")})
+    assert r.status_code == 200
+    assert r.json()["total_rows"] == 8
+
+    r = client.post("/detect/summary?model_key=missing", files={"file": ("costs.csv", csv_bytes, "text/csv")})
+    assert r.status_code == 404
+
+
+def test_stream_bootstrap_then_ingest(tmp_path, monkeypatch):
+    import app.main as main
+    monkeypatch.setattr(main, "STREAM_STATE_PATH", str(tmp_path / "state.joblib"))
+    dates = pd.date_range("2025-01-01", periods=12).strftime("%Y-%m-%d").tolist()
+    df = pd.DataFrame({"date": dates, "service": ["EC2"] * 12, "cost": [10.0] * 11 + [50.0]})
+
+    r = client.post("/stream/ingest", files={"file": ("new.csv", df.tail(1).to_csv(index=False).encode(), "text/csv")})
+    assert r.status_code == 409
+
+    r = client.post("/stream/bootstrap", files={"file": ("hist.csv", df.head(11).to_csv(index=False).encode(), "text/csv")})
+    assert r.status_code == 200
+    r = client.post("/stream/ingest", files={"file": ("new.csv", df.tail(1).to_csv(index=False).encode(), "text/csv")})
+    assert r.status_code == 200
+    assert r.json()["total_rows"] == 1
+
+
+def test_detect_content_negotiation():
+    import io
+    import json
+    df = pd.DataFrame({
+        "date": pd.date_range("2025-01-01", periods=30).strftime("%Y-%m-%d").tolist(),
+        "service": ["EC2"] * 30,
+        "cost": [10.1] * 20 + [55.5] + [10.1] * 9,
+    })
+    files = {"file": ("costs.csv", df.to_csv(index=False).encode("utf-8"), "text/csv")}
+    default = client.post("/detect", files=files).json()
+    assert default["total_anomalies"] == len(default["anomalies"]) > 0
+    assert {a["cost"] for a in default["anomalies"]} <= {10.1, 55.5}
+
+    r = client.post("/detect", files=files, headers={"Accept": "application/x-ndjson"})
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in r.text.splitlines()] == default["anomalies"]
+
+    r = client.post("/detect", files=files, headers={"Accept": "application/vnd.costspike.columnar+json"})
+    cols = r.json()["columns"]
+    assert cols["service"] == [a["service"] for a in default["anomalies"]]
+
+    r = client.post("/detect", files=files, headers={"Accept": "text/html"})
+    assert r.status_code == 406
+
+    pa = pytest.importorskip("pyarrow")
+    r = client.post("/detect", files=files, headers={"Accept": "application/vnd.apache.arrow.stream"})
+    table = pa.ipc.open_stream(io.BytesIO(r.content)).read_all()
+    assert table.num_rows == default["total_anomalies"]
+
+
+def test_job_lifecycle():
+    import time
+    csv_bytes = pd.DataFrame({
+        "date": pd.date_range("2025-01-01", periods=10).strftime("%Y-%m-%d").tolist(),
+        "service": ["EC2"] * 10,
+        "cost": [10] * 9 + [40],
+    }).to_csv(index=False).encode("utf-8")
+    r = client.post("/jobs", files={"file": ("costs.csv", csv_bytes, "text/csv")})
+    assert r.status_code == 202
+    job_id = r.json()["job_id"]
+
+    for _ in range(600):
+        body = client.get(f"/jobs/{job_id}").json()
+        if body["status"] in ("done", "failed"):
+            break
+        time.sleep(0.1)
+    assert body["status"] == "done", body
+    assert body["result"]["total_rows"] == 10
+    assert client.get("/jobs/nope").status_code == 404
+
+
+def test_detect_and_summary_share_cached_result():
+    import app.main as main
+    csv_bytes = pd.DataFrame({
+        "date": pd.date_range("2025-02-01", periods=9).strftime("%Y-%m-%d").tolist(),
+        "service": ["RDS"] * 9,
+        "cost": [5] * 8 + [30],
+    }).to_csv(index=False).encode("utf-8")
+    files = {"file": ("costs.csv", csv_bytes, "text/csv")}
+    before = main.RESULTS.stats()
+    assert client.post("/detect", files=files).status_code == 200
+    assert client.post("/detect/summary", files=files).status_code == 200
+    full = client.post("/detect/full", files=files).json()
+    after = client.get("/cache/stats").json()
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 2
+    assert full["total_rows"] == 9 and "explanation" in full
+
+    r = client.post("/detect/summary", params={"method": "mad"}, files=files)
+    assert r.status_code == 200 and r.json()["total_anomalies"] == 1
+    assert client.get("/cache/stats").json()["misses"] - after["misses"] == 1
+    assert client.post("/detect", params={"method": "nope"}, files=files).status_code == 422
+
+
+def test_partial_sharded_results_are_not_cached(monkeypatch):
+    import app.main as main
+    real_score = main._score
+
+    def partial(df, model_key, shard_by=None, cfg=None):
+        scored = real_score(df, model_key, None, cfg)
+        scored.attrs["unscored_services"] = ["EC2"]
+        return scored
+
+    monkeypatch.setattr(main, "_score", partial)
+    csv_bytes = b"date,service,cost\n" + b"".join(b"2025-03-%02d,EC2,%d\n" % (d, 7 + d % 2) for d in range(1, 11))
+    files = {"file": ("costs.csv", csv_bytes, "text/csv")}
+    before = main.RESULTS.stats()
+    for _ in range(2):
+        assert client.post("/detect/summary", params={"shard_by": "group"}, files=files).status_code == 200
+    after = main.RESULTS.stats()
+    assert after["entries"] == before["entries"] and after["hits"] == before["hits"]
+
+
+def test_detect_top_k_pages_by_impact():
+    costs = {"EC2": [10] * 9 + [60, 10, 10, 35], "S3": [4] * 9 + [20, 4, 4, 50]}
+    csv_bytes = pd.concat([
+        pd.DataFrame({"date": pd.date_range("2025-03-01", periods=13).strftime("%Y-%m-%d"), "service": s, "cost": c})
+        for s, c in costs.items()
+    ]).to_csv(index=False).encode("utf-8")
+    files = {"file": ("costs.csv", csv_bytes, "text/csv")}
+    params = {"method": "mad", "sort_by": "impact", "top_k": 2}
+    first = client.post("/detect", params=params, files=files)
+    body = first.json()
+    n = body["total_anomalies"]
+    assert first.status_code == 200 and n == body["total_matched"] >= 3
+    impacts = [a["estimated_impact"] for a in body["anomalies"]]
+    assert impacts == sorted(impacts, reverse=True) and first.headers["x-next-cursor"] == body["next_cursor"]
+
+    rest = client.post("/detect", params={**params, "cursor": body["next_cursor"]}, files=files).json()
+    assert len(rest["anomalies"]) == n - 2 and rest["next_cursor"] is None
+    assert rest["anomalies"][0]["estimated_impact"] <= impacts[-1]
+
+    only_s3 = client.post("/detect", params={**params, "services": "S3", "top_k": 10}, files=files).json()
+    assert {a["service"] for a in only_s3["anomalies"]} == {"S3"} and only_s3["total_matched"] >= 1
+    bad = client.post("/detect", params={**params, "cursor": "not-a-cursor"}, files=files)
+    assert bad.status_code == 400
+
+
+def test_metrics_and_server_timing(monkeypatch):
+    import app.main as main
+    from ml.model import ModelStore
+    monkeypatch.setattr(main, "MODEL_STORE", ModelStore(path=None))
+    csv_bytes = pd.DataFrame({
+        "date": pd.date_range("2025-03-01", periods=9).strftime("%Y-%m-%d").tolist(),
+        "service": ["S3"] * 9,
+        "cost": [3] * 8 + [12],
+    }).to_csv(index=False).encode("utf-8")
+    r = client.post("/detect", files={"file": ("costs.csv", csv_bytes, "text/csv")}, headers={"X-Server-Timing": "1"})
+    assert r.status_code == 200
+    stages = {part.split(";")[0].strip() for part in r.headers["server-timing"].split(",")}
+    assert {"csv_parse", "validate", "features", "fit", "score", "serialize"} <= stages
+
+    text = client.get("/metrics").text
+    assert 'costspike_stage_seconds_count{stage="fit"}' in text
+    assert "costspike_rows_scored_total" in text
+    assert "server-timing" not in client.get("/health").headers
+
+
+def test_dataset_registration_and_detect_by_id():
+    csv_bytes = pd.DataFrame({
+        "date": pd.date_range("2025-04-01", periods=9).strftime("%Y-%m-%d").tolist(),
+        "service": ["EC2"] * 9,
+        "cost": [7] * 8 + [35],
+    }).to_csv(index=False).encode("utf-8")
+    r = client.post("/datasets", files={"file": ("costs.csv", csv_bytes, "text/csv")})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["rows"] == 9 and body["services"] == 1 and "cube" not in body
+    cube = client.get(f"/datasets/{body['dataset_id']}/cube").json()
+    assert cube["services"] == ["EC2"]
+    assert sum(sum(row) for row in cube["values"]) == 91
+    assert client.get("/datasets/nope/cube").status_code == 404
+
+    r = client.post("/detect", params={"dataset_id": body["dataset_id"]})
+    assert r.status_code == 200 and r.json()["total_rows"] == 9
+    assert client.post("/detect/summary", params={"dataset_id": "nope"}).status_code == 404
+    assert client.post("/detect/summary").status_code == 422
+
+
+def test_batch_detect_streams_per_tenant(monkeypatch):
+    import json
+    import app.main as main
+    from app.batch import BatchRunner
+    monkeypatch.setattr(main, "BATCH", BatchRunner(max_workers=2, executor="thread"))
+    frame = pd.DataFrame({
+        "date": pd.date_range("2025-01-01", periods=10).strftime("%Y-%m-%d").tolist(),
+        "service": ["EC2"] * 10,
+        "cost": [10] * 9 + [40],
+    })
+    files = [
+        ("files", ("acme.csv", frame.to_csv(index=False).encode(), "text/csv")),
+        ("files", ("globex.csv", b"day,cost\n2025-01-01,1\n", "text/csv")),
+    ]
+    r = client.post("/batch/detect", params={"method": "mad"}, files=files)
+    assert r.status_code == 200 and r.headers["x-total-tenants"] == "2"
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    status = {line["tenant"]: line["status"] for line in lines[:-1]}
+    assert status == {"acme": "done", "globex": "failed"}
+    assert lines[-1]["batch"]["done"] == 1
+
+    both = pd.concat([frame.assign(account="a"), frame.assign(account="b")]).to_csv(index=False).encode()
+    r = client.post("/batch/detect", params={"tenant_column": "account"}, files=[("files", ("all.csv", both, "text/csv"))])
+    assert sorted(json.loads(line)["tenant"] for line in r.text.splitlines()[:-1]) == ["a", "b"]
+    assert client.post("/batch/detect", params={"tenant_column": "nope"},
+                       files=[("files", ("all.csv", both, "text/csv"))]).status_code == 400
+
+
+def test_store_load_then_detect_range(monkeypatch):
+    import app.main as main
+    from ml.store import CostStore
+    monkeypatch.setattr(main, "STORE", CostStore(":memory:"))
+    dates = pd.date_range("2025-03-01", periods=20).strftime("%Y-%m-%d").tolist()
+    df = pd.DataFrame({"date": dates * 2, "service": ["EC2"] * 20 + ["S3"] * 20,
+                       "cost": [10.0 + i % 2 for i in range(19)] + [80.0] + [5.0] * 20})
+    csv_bytes = df.to_csv(index=False).encode("utf-8")
+
+    r = client.post("/store/costs", files={"file": ("costs.csv", csv_bytes, "text/csv")})
+    assert r.status_code == 200 and r.json()["inserted"] == 40
+    r = client.post("/store/costs", files={"file": ("costs.csv", csv_bytes, "text/csv")})
+    assert r.json()["skipped"] == 40 and r.json()["store"]["rows"] == 40
+
+    params = {"start": "2025-03-15", "services": ["EC2"], "method": "mad"}
+    body = client.get("/store/detect", params=params).json()
+    assert body["total_rows"] == 6
+    assert [(a["service"], a["date"]) for a in body["anomalies"]] == [("EC2", "2025-03-20")]
+    assert client.get("/store/detect/summary", params=params).json()["total_anomalies"] == 1
+    assert client.get("/store/detect", params={"services": ["nope"]}).status_code == 404
+
+
+def test_forecast_with_budget_risk():
+    csv_bytes = pd.DataFrame({
+        "date": list(pd.date_range("2025-04-01", periods=20).strftime("%Y-%m-%d")) * 2,
+        "service": ["EC2"] * 20 + ["S3"] * 20,
+        "cost": [10.0] * 20 + [2.0] * 20,
+    }).to_csv(index=False).encode("utf-8")
+    files = {"file": ("costs.csv", csv_bytes, "text/csv")}
+    r = client.post("/forecast", params={"budget": 300, "horizon": 14}, files=files)
+    assert r.status_code == 200
+    body = r.json()
+    assert body["as_of"] == "2025-04-20" and body["month_end"] == "2025-04-30"
+    assert [s["service"] for s in body["services"]] == ["EC2", "S3"]
+    assert body["total"]["month_to_date"] == pytest.approx(240.0)
+    assert body["total"]["forecast_eom"] == pytest.approx(360.0, rel=0.05)
+    assert body["budget"]["status"] == "over" and body["budget"]["exhausted_on"] is not None
+
+    only = client.post("/forecast", params={"services": "S3", "method": "seasonal_naive"}, files=files).json()
+    assert only["total_services"] == 1 and only["total"]["forecast_horizon"] == pytest.approx(60.0)
+    assert client.post("/forecast", params={"services": "nope"}, files=files).status_code == 404
+    assert client.post("/forecast", params={"budget": 0}, files=files).status_code == 422
+
+
+def test_rollup_detect_attributes_parent_spikes():
+    days = list(pd.date_range("2025-01-01", periods=30).strftime("%Y-%m-%d"))
+    rows = []
+    for account, region, service, base in [("a1", "us", "EC2", 20.0), ("a1", "us", "S3", 5.0), ("a2", "eu", "EC2", 12.0)]:
+        for i, day in enumerate(days):
+            rows.append((day, account, region, service, base * (6 if (account, i) == ("a2", 25) else 1) + i % 3 * 0.1))
+    csv_bytes = pd.DataFrame(rows, columns=["date", "account", "region", "service", "cost"]).to_csv(index=False).encode("utf-8")
+    r = client.post("/rollup/detect", params={"method": "mad", "top_k": 50},
+                    files={"file": ("cur.csv", csv_bytes, "text/csv")})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["raw_rows"] == 90 and body["nodes"] == 1 + 2 + 2 + 3
+    assert body["by_level"]["total"]["anomalies"] >= 1
+    total = [a for a in body["anomalies"] if a["node"] == "(total)" and a["date"] == "2025-01-26"]
+    assert total and total[0]["driver"] == "a2"
+    assert client.post("/rollup/detect", params={"hierarchy": "team"},
+                       files={"file": ("cur.csv", csv_bytes, "text/csv")}).status_code == 400
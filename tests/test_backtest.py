@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+from ml.backtest import ReplayConfig, run_backtest
+from ml.detect import DetectConfig, detect_spikes
+from ml.synth import generate_costs
+
+def test_daily_refit_replay_matches_detect_on_every_prefix():
+    df = generate_costs(n_services=6, n_days=30, seed=3)
+    configs = [DetectConfig(contamination=c, n_estimators=30) for c in (0.02, 0.1)] + [
+        DetectConfig(method="mad"), DetectConfig(method="mad", z_threshold=5.0),
+    ]
+    bt = run_backtest(df, configs, ReplayConfig(refit_every=1, min_history=20), workers=2)
+    assert bt.refits == 10  # one forest per day, shared by both contaminations
+    cf = bt.frame
+    for t in range(bt.start, int(cf.day.max()) + 1):
+        prefix = cf.take(cf.day <= t)
+        today = prefix.day == t
+        for i, cfg in enumerate(configs):
+            expected = detect_spikes(prefix, cfg)
+            assert (np.asarray(expected["anomaly"])[today] == bt.anomaly[i, cf.day == t]).all()
+            np.testing.assert_allclose(bt.score[i, cf.day == t], np.asarray(expected["anomaly_score"])[today], rtol=1e-5, atol=1e-6)
+    assert not bt.anomaly[:, cf.day < bt.start].any()
+    assert (bt.daily_alerts().sum().to_numpy() == bt.anomaly.sum(axis=1)).all()
+
+def test_latency_and_summary():
+    days = pd.date_range("2025-01-01", periods=40)
+    cost = np.full(40, 100.0) + np.arange(40) % 3
+    cost[[25, 33]] = [500.0, 101.0]  # a spike caught on the day and one too small to flag
+    df = pd.DataFrame({"date": days, "service": "EC2", "cost": cost, "is_spike": np.isin(np.arange(40), [25, 33])})
+    bt = run_backtest(df, [DetectConfig(method="mad")], ReplayConfig(min_history=14))
+    assert bt.latency(0).tolist() == [0, -1]
+    summary = bt.summary().iloc[0]
+    assert summary["spikes"] == 2 and summary["recall"] == 0.5 and summary["alerts"] == 1
+    assert bt.alerts(0)["date"].tolist() == [days[25]]
+
+    with pytest.raises(ValueError, match="history"):
+        run_backtest(df, replay=ReplayConfig(min_history=60))
+    with pytest.raises(ValueError):
+        ReplayConfig(refit_every=0)
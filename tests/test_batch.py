@@ -0,0 +1,40 @@
+import io
+import threading
+import pandas as pd
+from app.batch import DONE, FAILED, TIMEOUT, BatchRunner, save_uploads, split_by_tenant
+
+def _frame(service: str, spike: float) -> pd.DataFrame:
+    return pd.DataFrame({
+        "date": pd.date_range("2025-01-01", periods=10).strftime("%Y-%m-%d").tolist(),
+        "service": [service] * 10,
+        "cost": [10] * 9 + [spike],
+    })
+
+def test_tenant_column_split_and_failures_are_isolated(tmp_path):
+    both = pd.concat([_frame("EC2", 40).assign(account="a"), _frame("S3", 90).assign(account="b")])
+    bad = pd.DataFrame({"date": ["not-a-date"], "service": ["EC2"], "cost": ["1"], "account": ["c"]})
+    raw = pd.concat([both, bad]).to_csv(index=False).encode("utf-8")
+    tenants = split_by_tenant(io.BytesIO(raw), "Account", str(tmp_path), chunksize=7)
+    assert sorted(tenants) == ["a", "b", "c"]
+
+    lines = list(BatchRunner(max_workers=2, executor="thread").run(tenants, work_dir=str(tmp_path)))
+    by_tenant = {line["tenant"]: line for line in lines[:-1]}
+    assert by_tenant["a"]["status"] == DONE and by_tenant["a"]["result"]["total_rows"] == 10
+    assert by_tenant["b"]["result"]["explanation"]["top_services"][0]["service"] == "S3"
+    assert by_tenant["c"]["status"] == FAILED and "date" in by_tenant["c"]["error"]
+    assert lines[-1]["batch"]["tenants"] == 3 and lines[-1]["batch"][FAILED] == 1
+    assert not tmp_path.exists()
+
+def test_slow_tenant_does_not_block_others(tmp_path):
+    gate = threading.Event()
+
+    def runner(path, cfg):
+        if path == paths["slow"]:
+            gate.wait(10)
+        return {"path": path}
+
+    paths = save_uploads([("slow.csv", io.BytesIO(b"x")), ("fast.csv", io.BytesIO(b"y"))], str(tmp_path))
+    lines = list(BatchRunner(max_workers=2, executor="thread", timeout=0.5, runner=runner).run(paths))
+    gate.set()
+    assert [(line["tenant"], line["status"]) for line in lines[:-1]] == [("fast", DONE), ("slow", TIMEOUT)]
+    assert lines[-1]["batch"][TIMEOUT] == 1
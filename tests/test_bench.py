@@ -0,0 +1,24 @@
+from bench.run import check, run_size
+
+def _result(seconds=1.0, peak_mb=10.0, precision=0.5, recall=0.5):
+    return {"rows": 100, "stages": {"fit": {"seconds": seconds, "peak_mb": peak_mb}},
+            "precision": precision, "recall": recall}
+
+def test_check_flags_regressions_only():
+    base = {"small": _result()}
+    assert check({"small": _result(seconds=1.5, precision=0.48)}, base) == []
+    failures = check({"small": _result(seconds=5.0, peak_mb=30.0, recall=0.2)}, base)
+    assert len(failures) == 3
+    assert check({"other": _result(seconds=100.0)}, base) == []
+    # millisecond stages get absolute slack; timing can be left out entirely
+    fast = {"tiny": _result(seconds=0.008)}
+    assert check({"tiny": _result(seconds=0.021)}, fast) == []
+    assert check({"small": _result(seconds=5.0, peak_mb=30.0, recall=0.2)}, base, timing=False) == [
+        "small/recall: 0.200 < baseline 0.500 - 0.05",
+    ]
+
+def test_run_size_tiny():
+    out = run_size("tiny", memory=False)
+    assert out["rows"] == 300
+    assert {"parse", "features", "fit", "score", "explain", "api_detect"} <= set(out["stages"])
+    assert 0.0 <= out["precision"] <= 1.0 and 0.0 <= out["recall"] <= 1.0
@@ -0,0 +1,33 @@
+import io
+import time
+import pandas as pd
+from app.cache import ResultCache, content_digest, result_key
+from ml.detect import DetectConfig
+
+def _frame(n: int) -> pd.DataFrame:
+    return pd.DataFrame({"cost": [1.0] * n})
+
+def test_result_key_depends_on_bytes_and_config():
+    a = io.BytesIO(b"date,service,cost\n2025-01-01,EC2,1\n")
+    key = result_key(content_digest(a), DetectConfig())
+    assert a.tell() == 0
+    assert key == result_key(content_digest(io.BytesIO(a.getvalue())), DetectConfig())
+    assert key != result_key(content_digest(a), DetectConfig(contamination=0.1))
+    assert key != result_key(content_digest(io.BytesIO(a.getvalue() + b"2025-01-02,EC2,2\n")), DetectConfig())
+
+def test_lru_budget_ttl_and_counters():
+    size = int(_frame(100).memory_usage(deep=True).sum())
+    cache = ResultCache(max_bytes=2 * size, ttl=None)
+    cache.put("a", _frame(100))
+    cache.put("b", _frame(100))
+    assert cache.get("a") is not None      # a is now most recently used
+    cache.put("c", _frame(100))
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["evictions"]) == (2, 2, 1, 1)
+    assert stats["bytes"] <= stats["max_bytes"]
+
+    cache.ttl = 0.01
+    time.sleep(0.02)
+    assert cache.get("a") is None
@@ -0,0 +1,34 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+from ml.cost_io import load_cost_csv, read_cost_csv
+
+def _csv(rows) -> io.BytesIO:
+    return io.BytesIO(pd.DataFrame(rows).to_csv(index=False).encode("utf-8"))
+
+def test_chunked_read_matches_load_cost_csv():
+    dates = pd.date_range("2025-01-01", periods=10).strftime("%Y-%m-%d").tolist()
+    rows = {"Date": dates * 3, "Service": ["S3 "] * 10 + ["EC2"] * 10 + ["Lambda"] * 10, "Cost": np.arange(30) * 1.5, "extra": "x"}
+
+    got = read_cost_csv(_csv(rows), chunksize=7)
+    expected = load_cost_csv(pd.DataFrame(rows))
+
+    assert isinstance(got["service"].dtype, pd.CategoricalDtype)
+    assert got["cost"].dtype == np.float32
+    assert list(got.columns) == ["date", "service", "cost"]
+    assert got["service"].astype(str).tolist() == expected["service"].tolist()
+    assert (got["date"] == expected["date"]).all()
+    np.testing.assert_allclose(got["cost"], expected["cost"], rtol=1e-6)
+
+def test_chunked_read_reports_bad_rows():
+    rows = {"date": ["2025-01-01"] * 6, "service": ["EC2"] * 6, "cost": [1, 2, 3, 4, "oops", 6]}
+    with pytest.raises(ValueError, match=r"rows 5\)"):
+        read_cost_csv(_csv(rows), chunksize=2)
+
+    with pytest.raises(ValueError, match="date, service, cost"):
+        read_cost_csv(_csv({"day": ["2025-01-01"], "cost": [1]}))
+    with pytest.raises(ValueError, match="no data rows"):
+        read_cost_csv(io.BytesIO(b"Date,Service,Cost\n"))
+    with pytest.raises(ValueError, match="date, service, cost"):
+        read_cost_csv(io.BytesIO(b"day,cost\n"))
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+from ml.cube import CostCube
+
+def _costs() -> pd.DataFrame:
+    return pd.DataFrame({
+        "date": pd.to_datetime(["2025-01-01", "2025-01-01", "2025-01-02", "2025-01-04", "2025-01-04"]),
+        "service": ["EC2", "S3", "EC2", "S3", "S3"],
+        "cost": [10.0, 1.0, 12.0, 2.0, 3.0],
+    })
+
+def test_cube_matches_groupby_and_pivot():
+    df = _costs()
+    cube = CostCube.from_costs(df)
+    assert list(cube.days.strftime("%d")) == ["01", "02", "03", "04"]
+
+    daily = df.groupby("date")["cost"].sum()
+    pd.testing.assert_series_equal(cube.daily(), daily.rename("daily_cost"), check_names=False, check_freq=False)
+
+    pivot = df.pivot_table(index="date", columns="service", values="cost", aggfunc="sum", fill_value=0.0)
+    np.testing.assert_allclose(cube.to_frame().to_numpy(), pivot.to_numpy())
+
+def test_cube_slices_and_roundtrips():
+    cube = CostCube.from_costs(_costs())
+    part = cube.slice(pd.Timestamp("2025-01-02"), pd.Timestamp("2025-01-04"), ["S3", "missing"])
+    assert list(part.services) == ["S3"]
+    assert part.by_service().to_dict() == {"S3": 5.0}
+    assert len(part.daily()) == 1
+
+    again = CostCube.from_dict(cube.to_dict())
+    np.testing.assert_allclose(again.values, cube.values)
+    assert (again.counts == cube.counts).all()
+    assert CostCube.from_costs(_costs().iloc[:0]).empty
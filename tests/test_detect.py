@@ -11,4 +11,74 @@ def test_detect_runs():
     df = load_cost_csv(df)
     scored = detect_spikes(df)
     assert "anomaly" in scored.columns
-    assert len(scored) == 8
\ No newline at end of file
+    assert len(scored) == 8
+
+def test_fit_once_score_many(tmp_path):
+    from ml.detect import DetectConfig, fit, score
+    from ml.model import ModelStore
+
+    df = load_cost_csv(pd.DataFrame({
+        "date": pd.date_range("2025-01-01", periods=30).strftime("%Y-%m-%d").tolist() * 2,
+        "service": ["EC2"] * 30 + ["S3"] * 30,
+        "cost": [10.0] * 29 + [60.0] + [2.0 + (i % 3) for i in range(30)],
+    }))
+    cfg = DetectConfig()
+    expected = detect_spikes(df, cfg)
+
+    model = fit(df, cfg)
+    store = ModelStore(path=str(tmp_path), ttl=60)
+    store.put(model)
+    assert (tmp_path / f"{model.key}.joblib").exists()
+
+    fresh = ModelStore(path=str(tmp_path), ttl=60)
+    loaded = fresh.get(model.key)
+    assert loaded is not None
+    scored = score(df, loaded)
+    assert (scored["anomaly"] == expected["anomaly"]).all()
+
+    assert detect_spikes(df, cfg, store=fresh)["anomaly"].equals(expected["anomaly"])
+    assert ModelStore(path=str(tmp_path), ttl=0).get(model.key) is None
+
+def test_model_store_is_bounded(tmp_path):
+    import os
+    import numpy as np
+    from dataclasses import replace
+    from ml.detect import DetectConfig
+    from ml.model import ModelStore, fit_model
+
+    model = fit_model(np.random.default_rng(0).normal(size=(50, 3)), DetectConfig(n_estimators=5))
+    store = ModelStore(path=str(tmp_path), ttl=None, max_models=2, max_files=3)
+    for i in range(5):
+        store.put(replace(model, key=f"k{i}"))
+        os.utime(tmp_path / f"k{i}.joblib", (1e9 + i, 1e9 + i))
+    assert list(store._models) == ["k3", "k4"]
+    store.get("k3")
+    store.put(replace(model, key="k5"))
+    assert list(store._models) == ["k3", "k5"]  # least recently used goes first
+    assert sorted(p.name for p in tmp_path.glob("*.joblib")) == ["k3.joblib", "k4.joblib", "k5.joblib"]
+
+    # with a TTL, files older than it are swept on the next put
+    ModelStore(path=str(tmp_path), ttl=60).put(replace(model, key="k6"))
+    assert sorted(p.name for p in tmp_path.glob("*.joblib")) == ["k5.joblib", "k6.joblib"]
+
+def test_single_pass_chunked_scoring_and_sampled_fit():
+    import numpy as np
+    from ml.detect import DetectConfig, fit
+    from ml.features import add_features, feature_matrix
+    from ml.frame import CostFrame
+    from ml.model import MIN_TRAIN_ROWS_PER_SERVICE, sample_rows
+    from ml.synth import generate_costs
+
+    cf = CostFrame.from_frame(generate_costs(n_services=12, n_days=200, seed=1))
+    model = fit(cf, DetectConfig(n_estimators=20))
+    X = feature_matrix(add_features(cf), np.float32)
+    anomaly, score = model.score(X, chunk_rows=257, workers=3)
+    assert np.array_equal(anomaly, model.forest.predict(X) == -1)
+    assert np.array_equal(score, -model.forest.decision_function(X))
+
+    codes = np.repeat([0, 1], [2000, 40])
+    rows = sample_rows(codes, 200, seed=0)
+    assert 100 < len(rows) < 400 and (np.diff(rows) > 0).all()
+    assert (codes[rows] == 1).sum() == 40  # a small service keeps all of its rows
+    sampled = fit(cf, DetectConfig(n_estimators=20, max_train_rows=600))
+    assert 12 * MIN_TRAIN_ROWS_PER_SERVICE * 0.8 < sampled.n_train < len(cf)
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+from ml.cost_io import load_cost_csv
+from ml.features import add_features, build_feature_matrix
+
+def _reference(df: pd.DataFrame) -> pd.DataFrame:
+    out = df.copy()
+    g = out.groupby("service")["cost"]
+    out["cost_rolling_mean_7"] = g.transform(lambda s: s.rolling(7, min_periods=3).mean())
+    out["cost_rolling_std_7"] = g.transform(lambda s: s.rolling(7, min_periods=3).std())
+    out["cost_pct_change"] = g.pct_change().fillna(0.0)
+    out["cost_vs_rollmean"] = (out["cost"] - out["cost_rolling_mean_7"]).fillna(0.0)
+    out["roll_std_filled"] = out["cost_rolling_std_7"].fillna(0.0)
+    return out
+
+def test_vectorized_features_match_groupby_rolling():
+    rng = np.random.default_rng(0)
+    days = pd.date_range("2025-01-01", periods=20).strftime("%Y-%m-%d")
+    df = pd.DataFrame({
+        "date": list(days) * 3 + list(days[:2]),
+        "service": ["EC2"] * 20 + ["S3"] * 20 + ["RDS"] * 20 + ["Lambda"] * 2,
+        "cost": rng.gamma(2.0, 10.0, 62),
+    })
+    df.loc[[5, 25], "cost"] = 0.0
+    df = load_cost_csv(df)
+
+    for frame in (df, df.sample(frac=1.0, random_state=3)):
+        ref = _reference(frame)
+        got = add_features(frame)
+        for c in ["cost_rolling_mean_7", "cost_rolling_std_7", "cost_pct_change", "cost_vs_rollmean", "roll_std_filled"]:
+            np.testing.assert_allclose(got[c].to_numpy(), ref[c].to_numpy(), rtol=1e-9, atol=1e-9)
+        assert (got["dow"] == frame["date"].dt.dayofweek).all()
+
+    X = build_feature_matrix(add_features(df))
+    assert list(X.columns) == ["cost", "dow", "dom", "month", "cost_pct_change", "cost_vs_rollmean", "roll_std_filled"]
+    assert not X.isna().any().any()
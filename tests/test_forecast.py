@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+from ml.cube import CostCube
+from ml.forecast import ForecastConfig, budget_risk, forecast_costs, weekly_profile
+
+def _cube(values, start="2025-03-01"):
+    values = np.asarray(values, dtype=np.float64)
+    days = pd.date_range(start, periods=len(values), freq="D")
+    return CostCube(days, pd.Index([f"svc-{i}" for i in range(values.shape[1])]), values, np.ones(values.shape, dtype=np.int64))
+
+def _holt_loop(y, h, alpha, beta, phi):
+    level, trend = y[0], (y[min(len(y), 7) - 1] - y[0]) / max(min(len(y), 7) - 1, 1)
+    for v in y[1:]:
+        prev = level
+        level = alpha * v + (1 - alpha) * (prev + phi * trend)
+        trend = beta * (level - prev) + (1 - beta) * phi * trend
+    return [level + sum(phi ** i for i in range(1, j + 1)) * trend for j in range(1, h + 1)]
+
+def test_batched_holt_matches_per_service_loop():
+    rng = np.random.default_rng(0)
+    t = np.arange(60)
+    values = 50 + np.outer(t, [0.5, -0.2, 0.0]) + 5 * np.sin(2 * np.pi * t / 7)[:, None] + rng.normal(0, 1, (60, 3))
+    cube = _cube(values)
+    cfg = ForecastConfig(horizon=10)
+    fc = forecast_costs(cube, cfg)
+    profile = weekly_profile(values, cube.days.dayofweek.to_numpy(), cfg.n_weeks)
+    deseasoned = values - profile[cube.days.dayofweek.to_numpy()]
+    for j in range(3):
+        expected = np.array(_holt_loop(deseasoned[:, j], len(fc.days), cfg.alpha, cfg.beta, cfg.phi))
+        expected += profile[fc.days.dayofweek.to_numpy(), j]
+        np.testing.assert_allclose(fc.values[:, j], np.maximum(expected, 0), rtol=1e-10)
+    assert fc.days[0] == cube.days[-1] + pd.Timedelta(days=1) and fc.days[-1] >= pd.Timestamp("2025-04-30")
+
+def test_seasonal_naive_month_end_and_budget_risk():
+    week = np.array([10, 10, 10, 10, 10, 2, 2], dtype=np.float64)
+    values = np.tile(week, 4)[:, None] * [1, 3]  # 2025-03-01..28, two services
+    fc = forecast_costs(_cube(values), ForecastConfig(method="seasonal_naive", horizon=7))
+    np.testing.assert_allclose(fc.values[:7], values[:7])
+    eom = fc.month_end()
+    np.testing.assert_allclose(eom["month_to_date"], values.sum(axis=0))
+    np.testing.assert_allclose(eom["forecast_eom"], values.sum(axis=0) + values[:3].sum(axis=0))
+    assert fc.over_horizon().tolist() == values[:7].sum(axis=0).tolist()
+
+    risk = budget_risk(fc, monthly_budget=eom["forecast_eom"].sum() - 1)
+    assert risk["status"] == "over" and risk["exhausted_on"] == "2025-03-31"
+    assert budget_risk(fc, monthly_budget=1e9)["status"] == "ok"
+    with pytest.raises(ValueError):
+        ForecastConfig(method="arima")
@@ -0,0 +1,49 @@
+import io
+import numpy as np
+import pandas as pd
+from ml.cost_io import load_cost_csv, load_cost_frame, read_cost_csv, read_cost_frame
+from ml.cube import CostCube
+from ml.detect import DetectConfig, detect_spikes, explain_anomalies
+from ml.frame import CostFrame
+from ml.synth import generate_costs
+
+def test_round_trip_segments_and_memory():
+    raw = pd.DataFrame({
+        "date": ["2025-01-03", "2025-01-01", "2025-01-02", "2025-01-01", "2025-01-02"],
+        "service": ["S3", "S3", "EC2", "EC2", "S3"],
+        "cost": [3.0, 1.0, 20.0, 10.0, 2.0],
+    })
+    cf = load_cost_frame(raw)
+    assert list(cf.services) == ["EC2", "S3"]
+    assert cf.offsets.tolist() == [0, 2, 5]
+    assert cf.codes.dtype == np.int32 and cf.day.dtype == np.int32 and cf.cost.dtype == np.float32
+    assert cf.segment("S3") == slice(2, 5)
+    assert cf.for_service("S3").cost.tolist() == [1.0, 2.0, 3.0]
+
+    df = cf.to_frame()
+    expected = load_cost_csv(raw)
+    assert df["date"].equals(expected["date"])
+    assert df["service"].astype(str).tolist() == expected["service"].tolist()
+    assert np.allclose(df["cost"], expected["cost"])
+
+def test_frame_pipeline_matches_dataframe_pipeline():
+    csv_bytes = generate_costs(12, 60, seed=3).drop(columns=["is_spike"]).to_csv(index=False).encode()
+    df = read_cost_csv(io.BytesIO(csv_bytes))
+    cf = read_cost_frame(io.BytesIO(csv_bytes))
+    assert cf.nbytes < df.memory_usage(deep=True).sum()
+
+    for cfg in (DetectConfig(), DetectConfig(method="mad")):
+        a, b = detect_spikes(df, cfg), detect_spikes(cf, cfg)
+        assert isinstance(b, CostFrame)
+        assert np.array_equal(a["anomaly"].to_numpy(), b["anomaly"])
+        assert np.allclose(a["anomaly_score"].to_numpy(), b["anomaly_score"])
+        decoded = b.to_frame()
+        for col in ("dow", "dom", "month"):
+            assert np.array_equal(decoded[col].to_numpy(), a[col].to_numpy())
+        ea, eb = explain_anomalies(a), explain_anomalies(b)
+        assert [s["service"] for s in ea["top_services"]] == [s["service"] for s in eb["top_services"]]
+        assert np.isclose(ea["total_anomalous_cost"], eb["total_anomalous_cost"])
+
+    cube_a, cube_b = CostCube.from_costs(df), CostCube.from_frame(cf)
+    assert cube_a.days.equals(cube_b.days) and list(cube_a.services) == list(cube_b.services)
+    assert np.allclose(cube_a.values, cube_b.values) and np.array_equal(cube_a.counts, cube_b.counts)
@@ -0,0 +1,36 @@
+import tracemalloc
+from ml import instrument
+
+def test_span_records_histogram_and_timings(monkeypatch):
+    monkeypatch.setattr(instrument, "ENABLED", True)
+    hist = instrument.Histogram("t_seconds", "test", (0.1, 1.0))
+    monkeypatch.setattr(instrument, "STAGE_SECONDS", hist)
+    timings = instrument.collect_timings()
+    with instrument.span("outer"):
+        with instrument.span("inner"):
+            pass
+    assert [name for name, _ in timings] == ["inner", "outer"]
+    text = "\n".join(hist.render())
+    assert 't_seconds_bucket{stage="inner",le="0.1"} 1' in text
+    assert 't_seconds_count{stage="outer"} 1' in text
+    assert instrument.server_timing([("a", 0.5), ("a", 0.25)]) == "a;dur=750.0"
+
+def test_span_memory_tracking(monkeypatch):
+    monkeypatch.setattr(instrument, "TRACE_MEMORY", True)
+    peaks = instrument.Histogram("p_bytes", "test", instrument.BYTES_BUCKETS)
+    monkeypatch.setattr(instrument, "STAGE_PEAK_BYTES", peaks)
+    try:
+        with instrument.span("alloc"):
+            blob = bytearray(4 << 20)
+            del blob
+    finally:
+        tracemalloc.stop()
+    assert peaks._series["alloc"][-2] >= 4 << 20
+
+def test_disabled_spans_record_nothing(monkeypatch):
+    monkeypatch.setattr(instrument, "ENABLED", False)
+    timings = instrument.collect_timings()
+    with instrument.span("x"):
+        pass
+    instrument.count(instrument.ROWS_IN, 5)
+    assert timings == []
@@ -0,0 +1,56 @@
+import io
+import threading
+import time
+import pandas as pd
+import pytest
+from app.jobs import CANCELLED, DONE, FAILED, JobManager, JobQueueFull, run_detection
+
+def _csv() -> bytes:
+    return pd.DataFrame({
+        "date": pd.date_range("2025-01-01", periods=10).strftime("%Y-%m-%d").tolist(),
+        "service": ["EC2"] * 10,
+        "cost": [10] * 9 + [40],
+    }).to_csv(index=False).encode("utf-8")
+
+def _wait(manager, job_id, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job.finished_at is not None:
+            return job
+        time.sleep(0.02)
+    raise AssertionError("job did not finish")
+
+def test_job_runs_pipeline(tmp_path):
+    manager = JobManager(max_workers=1, executor="thread", work_dir=str(tmp_path))
+    job = _wait(manager, manager.submit(io.BytesIO(_csv())).id)
+    assert job.status == DONE
+    assert job.result["total_rows"] == 10
+    assert "explanation" in job.result
+    assert not list(tmp_path.iterdir())
+
+    bad = _wait(manager, manager.submit(io.BytesIO(b"day,cost\n2025-01-01,1\n")).id)
+    assert bad.status == FAILED and "date, service, cost" in bad.error
+    manager.shutdown()
+
+def test_backpressure_and_cancel(tmp_path):
+    gate = threading.Event()
+    manager = JobManager(max_workers=1, max_pending=2, executor="thread",
+                         runner=lambda path: gate.wait(10) and {}, work_dir=str(tmp_path))
+    running = manager.submit(io.BytesIO(_csv()))
+    queued = manager.submit(io.BytesIO(_csv()))
+    with pytest.raises(JobQueueFull):
+        manager.submit(io.BytesIO(_csv()))
+
+    assert manager.cancel(queued.id).status == CANCELLED
+    manager.submit(io.BytesIO(_csv()))
+    gate.set()
+    assert _wait(manager, running.id).status == DONE
+    assert manager.get(queued.id).status == CANCELLED
+    manager.shutdown()
+
+def test_run_detection_matches_detect_endpoint(tmp_path):
+    path = tmp_path / "costs.csv"
+    path.write_bytes(_csv())
+    out = run_detection(str(path))
+    assert out["total_anomalies"] == len(out["anomalies"])
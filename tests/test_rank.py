@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+from ml.detect import DetectConfig, detect_spikes, explain_anomalies
+from ml.frame import CostFrame
+from ml.rank import query, rank_anomalies
+from ml.synth import generate_costs
+
+def _scored():
+    cf = CostFrame.from_frame(generate_costs(n_services=20, n_days=120, seed=3))
+    return detect_spikes(cf, DetectConfig(method="mad", z_threshold=2.0))
+
+def test_top_k_and_pages_match_a_full_sort():
+    scored = _scored()
+    ranking = rank_anomalies(scored)
+    ranking.impact[::7] = ranking.impact[0]  # force ties across the page boundaries
+    impact = np.nan_to_num(ranking.impact, nan=-np.inf)
+    expected = ranking.rows[np.lexsort((ranking.rows, -impact))]
+    assert len(expected) > 50
+
+    rows, matched, cursor = query(ranking, top_k=10, sort_by="impact")
+    assert matched == len(expected) and list(rows) == list(expected[:10])
+
+    pages, cursor = [], None
+    while True:
+        rows, _, cursor = query(ranking, top_k=13, sort_by="impact", cursor=cursor)
+        pages.extend(rows)
+        if cursor is None:
+            break
+    assert pages == list(expected)
+
+    with pytest.raises(ValueError):
+        query(ranking, top_k=5, sort_by="cost", cursor=query(ranking, top_k=5, sort_by="impact")[2])
+
+def test_filters_and_explain_reuse_the_ranking():
+    scored = _scored()
+    ranking = rank_anomalies(scored)
+    df = scored.to_frame()
+    service = str(df.loc[df["anomaly"], "service"].iloc[0])
+    rows, matched, _ = query(ranking, services=[service], start="2025-02-01", end="2025-03-31")
+    picked = df.iloc[rows]
+    assert 0 < matched == len(rows) and (picked["service"] == service).all() and picked["anomaly"].all()
+    assert picked["date"].between(pd.Timestamp("2025-02-01"), pd.Timestamp("2025-03-31")).all()
+
+    explained = explain_anomalies(scored, ranking)
+    assert explained == explain_anomalies(df)
+    assert np.isclose(explained["total_anomalous_cost"], df.loc[df["anomaly"], "cost"].sum())
+    impact = (df["cost"] - df["cost_rolling_mean_7"]).clip(lower=0)[df["anomaly"]].sum()
+    assert np.isclose(explained["total_estimated_impact"], impact)
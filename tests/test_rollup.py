@@ -0,0 +1,62 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+from ml.detect import DetectConfig
+from ml.rollup import build_rollup, detect_rollup
+
+def _line_items(spike_day: int = 45) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    days = pd.date_range("2025-01-01", periods=60).strftime("%Y-%m-%d")
+    rows = []
+    for account in ("a1", "a2"):
+        for region in ("us", "eu"):
+            for service in ("EC2", "S3"):
+                base = rng.uniform(5, 50)
+                for i, day in enumerate(days):
+                    spike = 8 if (account, region, service, i) == ("a2", "eu", "EC2", spike_day) else 1
+                    for _ in range(2):  # two line items per day
+                        rows.append((day, account, region, service, base / 2 * spike * (1 + 0.02 * rng.standard_normal())))
+    return pd.DataFrame(rows, columns=["date", "Account", "region", "service", "cost"])
+
+def test_levels_are_rolled_up_from_children():
+    df = _line_items()
+    rollup = build_rollup(io.BytesIO(df.to_csv(index=False).encode("utf-8")), "account,region,service", chunksize=500)
+    cf = rollup.frame
+    assert rollup.raw_rows == len(df) and rollup.levels == ["total", "account", "account/region", "account/region/service"]
+    assert len(cf.services) == 1 + 2 + 4 + 8 and (np.bincount(rollup.level) == [1, 2, 4, 8]).all()
+    assert cf.services[rollup.parent[cf._code("a2/eu/EC2")]] == "a2/eu"
+
+    daily = df.assign(date=pd.to_datetime(df["date"])).groupby(["Account", "date"])["cost"].sum()
+    np.testing.assert_allclose(cf.cost[cf.segment("a1")], daily["a1"].to_numpy(), rtol=1e-6)
+    np.testing.assert_allclose(cf.cost[cf.segment("(total)")].sum(), df["cost"].sum(), rtol=1e-6)
+    with pytest.raises(ValueError, match="team"):
+        build_rollup(io.BytesIO(df.to_csv(index=False).encode("utf-8")), "account,team,service")
+
+def test_parent_spikes_name_the_driving_child():
+    df = _line_items()
+    rollup = build_rollup(io.BytesIO(df.to_csv(index=False).encode("utf-8")))
+    scored = detect_rollup(rollup, DetectConfig(method="mad"))
+    spike = int(np.datetime64("2025-02-15", "D").astype(np.int64))
+    drivers = {}
+    for node in ("(total)", "a2", "a2/eu"):
+        seg = scored.segment(node)
+        row = seg.start + int(np.flatnonzero(scored.day[seg] == spike)[0])
+        assert scored["anomaly"][row]
+        drivers[node] = str(scored.services[scored["driver"][row]])
+        assert scored["driver_share"][row] == pytest.approx(1.0, abs=0.1)
+    assert drivers == {"(total)": "a2", "a2": "a2/eu", "a2/eu": "a2/eu/EC2"}
+    assert (scored["driver"][rollup.level[scored.codes] == 3] == -1).all()
+
+def test_labels_containing_the_separator_stay_distinct():
+    rows = []
+    for day in pd.date_range("2025-01-01", periods=5).strftime("%Y-%m-%d"):
+        rows += [(day, "a/b", "x", "EC2", 1.0), (day, "a", "b/x", "EC2", 2.0), (day, "(total)", "r", "S3", 3.0)]
+    df = pd.DataFrame(rows, columns=["date", "account", "region", "service", "cost"])
+    rollup = build_rollup(io.BytesIO(df.to_csv(index=False).encode("utf-8")))
+    cf = rollup.frame
+    assert len(set(cf.services)) == len(cf.services) == 1 + 3 + 3 + 3
+    assert cf.cost[cf.segment("a%2Fb/x/EC2")].tolist() == [1.0] * 5
+    assert cf.cost[cf.segment("a/b%2Fx/EC2")].tolist() == [2.0] * 5
+    assert cf.services[rollup.parent[cf._code("%28total)")]] == "(total)"
+    assert cf.cost[cf.segment("(total)")].tolist() == [6.0] * 5
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+from ml.cost_io import load_cost_csv
+from ml.shard import SHARD_POOL, detect_spikes_sharded, plan_shards
+
+def _costs() -> pd.DataFrame:
+    rng = np.random.default_rng(3)
+    dates = pd.date_range("2025-01-01", periods=30).strftime("%Y-%m-%d").tolist()
+    return load_cost_csv(pd.DataFrame({
+        "date": dates * 3,
+        "service": ["EC2"] * 30 + ["S3"] * 30 + ["RDS"] * 30,
+        "cost": np.r_[rng.normal(50000, 500, 30), rng.normal(10, 0.5, 30), rng.normal(300, 10, 30)],
+    }))
+
+def test_plan_shards_keeps_services_contiguous():
+    df = _costs()
+    assert plan_shards(df["service"]) == [(0, 30), (30, 60), (60, 90)]
+    assert plan_shards(df["service"], 2) == [(0, 60), (60, 90)]
+
+def test_sharded_detection_restores_input_order():
+    df = _costs().sample(frac=1.0, random_state=0)
+    df = df.sort_values("date", kind="stable")
+    scored = detect_spikes_sharded(df, max_workers=2, by="service")
+    assert (scored.index == df.index).all()
+    assert scored["anomaly_score"].notna().all()
+    assert scored.attrs["unscored_services"] == []
+
+def test_slow_shards_do_not_block():
+    scored = detect_spikes_sharded(_costs(), max_workers=1, by="service", shard_timeout=1e-6)
+    assert scored.attrs["unscored_services"]
+    assert not scored.loc[scored["service"].isin(scored.attrs["unscored_services"]), "anomaly"].any()
+
+def test_timed_out_shards_are_terminated_and_the_pool_recovers():
+    import time
+    pool = SHARD_POOL.get(1)
+    pool.submit(time.sleep, 0).result()  # worker up, so the shard below is running at the deadline
+    workers = list(pool._processes.values())
+    detect_spikes_sharded(_costs(), max_workers=1, by="group", shard_timeout=0.01)
+    for proc in workers:
+        proc.join(timeout=5)
+        assert not proc.is_alive()
+    scored = detect_spikes_sharded(_costs(), max_workers=1, by="group")
+    assert scored.attrs["unscored_services"] == []
+
+def test_shards_on_a_pool_killed_by_another_request_are_resubmitted():
+    import threading
+    import time
+    from ml.detect import DetectConfig
+    detect_spikes_sharded(_costs(), max_workers=2, by="group")  # workers up with sklearn imported
+    out = {}
+    slow = DetectConfig(n_estimators=800)
+    t = threading.Thread(target=lambda: out.update(scored=detect_spikes_sharded(
+        _costs(), cfg=slow, max_workers=2, by="group", shard_timeout=None)))
+    t.start()
+    time.sleep(0.3)
+    SHARD_POOL.terminate(SHARD_POOL.get(2))  # as another request past its deadline would
+    t.join()
+    assert out["scored"].attrs["unscored_services"] == []
+    assert out["scored"]["anomaly_score"].notna().all()
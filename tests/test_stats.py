@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml.cost_io import load_cost_csv
+from ml.detect import DetectConfig, detect_spikes, explain_anomalies
+from ml.features import _segment_positions
+from ml.stats import ewma_zscore, robust_zscore
+
+def _reference(x, alpha=0.3, window=7):
+    # straightforward per-point loops the vectorized versions must reproduce
+    mad_z, ewma_z, mean, var = [], [], x[0], 0.0
+    for t in range(len(x)):
+        prev = x[max(0, t - window):t]
+        if len(prev) >= 3:
+            med = np.median(prev)
+            dev = np.abs(prev - med)
+            spread = np.median(dev) * 1.4826 or dev.mean() * 1.2533
+            mad_z.append((x[t] - med) / max(spread, abs(med) * 0.01, 1e-9))
+        else:
+            mad_z.append(0.0)
+        if t == 0:
+            ewma_z.append(0.0)
+            continue
+        resid, std = x[t] - mean, np.sqrt(var)
+        ewma_z.append(resid / max(std, abs(mean) * 0.01, 1e-9) if t >= 3 else 0.0)
+        mean, var = mean + alpha * resid, (1 - alpha) * (var + alpha * resid ** 2)
+    return mad_z, ewma_z
+
+def test_vectorized_scores_match_reference():
+    rng = np.random.default_rng(0)
+    codes = np.repeat(np.arange(4), [1, 3, 12, 40])
+    cost = rng.gamma(2.0, 50.0, len(codes))
+    cost[16:24] = 7.0  # flat stretch: MAD is 0
+    cost[30:38:2] = 7.5
+    pos = _segment_positions(codes)
+
+    mad_z, ewma_z = [], []
+    for c in range(4):
+        m, e = _reference(cost[codes == c])
+        mad_z += m
+        ewma_z += e
+    np.testing.assert_allclose(robust_zscore(cost, pos), mad_z, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(ewma_zscore(cost, pos), ewma_z, rtol=1e-9, atol=1e-6)
+
+@pytest.mark.parametrize("method", ["mad", "ewma"])
+def test_statistical_methods_flag_spikes(method):
+    days = pd.date_range("2025-01-01", periods=30).strftime("%Y-%m-%d").tolist()
+    raw = pd.DataFrame({
+        "date": days * 2,
+        "service": ["EC2"] * 30 + ["S3"] * 30,
+        "cost": [10.0 + (i % 3) for i in range(29)] + [60.0] + [2.0 + (i % 2) for i in range(30)],
+    })
+    df = load_cost_csv(raw.iloc[::-1])
+    scored = detect_spikes(df, DetectConfig(method=method))
+
+    assert list(scored.columns) == list(detect_spikes(df).columns)
+    flagged = scored[scored["anomaly"]]
+    assert list(zip(flagged["service"], flagged["date"])) == [("EC2", pd.Timestamp("2025-01-30"))]
+    assert explain_anomalies(scored)["top_services"] == [{"service": "EC2", "anomalous_cost": 60.0}]
+
+def test_ewma_variance_never_goes_negative():
+    # a large series before a tiny one leaves rounding residue from the carry-over subtraction
+    rng = np.random.default_rng(0)
+    codes = np.repeat(np.arange(200), 100)
+    cost = np.where(codes % 2 == 0, 1e6 * (1 + rng.random(len(codes))), rng.random(len(codes)) * 1e-3)
+    with np.errstate(invalid="raise"):
+        z = ewma_zscore(cost, _segment_positions(codes))
+    assert np.isfinite(z).all()
+
+def test_config_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        DetectConfig(method="prophet")
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+from ml.cost_io import load_cost_frame
+from ml.detect import DetectConfig, detect_spikes
+from ml.store import CostStore, detect_range
+from ml.synth import generate_costs
+
+def test_append_only_loads_dedupe_on_date_and_service(tmp_path):
+    store = CostStore(str(tmp_path / "costs.sqlite"))
+    first = pd.DataFrame({
+        "date": ["2025-01-01", "2025-01-01", "2025-01-02", "2025-01-01"],
+        "service": ["S3", "S3", "S3", "EC2"],
+        "cost": [1.0, 2.0, 4.0, 10.0],
+    })
+    assert store.load(load_cost_frame(first)) == {"rows": 3, "inserted": 3, "skipped": 0}
+    more = pd.DataFrame({"date": ["2025-01-02", "2025-01-03"], "service": ["S3", "S3"], "cost": [99.0, 8.0]})
+    assert store.load(load_cost_frame(more)) == {"rows": 2, "inserted": 1, "skipped": 1}
+
+    s3 = CostStore(str(tmp_path / "costs.sqlite")).read(start="2025-01-01", services=["S3"])
+    assert list(s3.services) == ["S3"]
+    assert s3.cost.tolist() == [3.0, 4.0, 8.0]
+    assert store.read(end="2025-01-01").to_frame()["service"].astype(str).tolist() == ["EC2", "S3"]
+    assert len(store.read(services=["nope"])) == 0
+    assert store.stats() == {"rows": 4, "services": 2, "first_date": "2025-01-01", "last_date": "2025-01-03"}
+
+    store.load(load_cost_frame(more), replace=True)
+    assert store.read(start="2025-01-02", end="2025-01-02", services=["S3"]).cost.tolist() == [99.0]
+
+def test_detect_range_matches_full_history():
+    store = CostStore(":memory:")
+    cf = load_cost_frame(generate_costs(6, 60, seed=2).drop(columns=["is_spike"]))
+    store.load(cf)
+    cfg = DetectConfig(method="mad")
+    full = detect_spikes(cf, cfg)
+    ranged = detect_range(store, "2025-02-01", "2025-02-15", ["svc-1", "svc-4"], cfg)
+
+    keep = np.isin(full.codes, [1, 4]) & (full.day >= ranged.day.min()) & (full.day <= ranged.day.max())
+    assert len(ranged) == 2 * 15 == keep.sum()
+    assert np.array_equal(ranged["anomaly"], full["anomaly"][keep])
+    assert np.allclose(ranged["anomaly_score"], full["anomaly_score"][keep])
+
+def test_store_keeps_exact_cents(tmp_path):
+    import io
+    import sqlite3
+    from ml.cost_io import read_cost_frame
+    csv = b"date,service,cost\n2025-01-01,EC2,1234567.89\n2025-01-01,EC2,0.01\n2025-01-01,S3,50000.12\n"
+    store = CostStore(str(tmp_path / "costs.sqlite"))
+    store.load(read_cost_frame(io.BytesIO(csv), cost_dtype=np.float64))
+    with sqlite3.connect(str(tmp_path / "costs.sqlite")) as db:
+        stored = dict(db.execute("SELECT name, cost FROM daily_costs JOIN services ON id = service_id"))
+    assert stored == {"EC2": 1234567.89 + 0.01, "S3": 50000.12}
+    assert store.read().cost.dtype == np.float32  # downcast only when read for scoring
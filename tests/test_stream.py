@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+from ml.cost_io import load_cost_csv
+from ml.detect import score
+from ml.stream import StreamingDetector, state_lock
+
+def _history(days: int) -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    dates = pd.date_range("2025-01-01", periods=days).strftime("%Y-%m-%d").tolist()
+    cost = np.r_[rng.normal(100, 5, days), rng.normal(3, 0.5, days)]
+    cost[days - 2] = 400.0
+    return load_cost_csv(pd.DataFrame({"date": dates * 2, "service": ["EC2"] * days + ["S3"] * days, "cost": cost}))
+
+def test_incremental_matches_batch(tmp_path):
+    full = _history(40)
+    head = full[full["date"] < "2025-02-05"]
+    tail = full[full["date"] >= "2025-02-05"]
+
+    det = StreamingDetector.bootstrap(head)
+    got = pd.concat([det.ingest(tail[tail["date"] == d]) for d in sorted(tail["date"].unique())])
+
+    expected = score(full, det.model).loc[got.index]
+    for c in ["cost_rolling_mean_7", "cost_rolling_std_7", "cost_pct_change", "cost_vs_rollmean", "anomaly_score"]:
+        np.testing.assert_allclose(got[c].to_numpy(), expected[c].to_numpy(), rtol=1e-9, atol=1e-9)
+    assert (got["anomaly"] == expected["anomaly"]).all()
+
+    with pytest.raises(ValueError):
+        det.ingest(tail.head(1))
+
+def test_state_roundtrip(tmp_path):
+    from ml.model import ModelStore
+    full = _history(20)
+    store = ModelStore(path=str(tmp_path), ttl=None)
+    det = StreamingDetector.bootstrap(full, store=store)
+    path = str(tmp_path / "stream.joblib")
+    det.save(path)
+
+    again = StreamingDetector.load(path, ModelStore(path=str(tmp_path), ttl=None))
+    assert again is not None
+    assert list(again.states["EC2"].window) == list(det.states["EC2"].window)
+    # the model is saved with the state, so an expired model cache does not lose the stream
+    assert ModelStore(path=str(tmp_path), ttl=0).get(det.model.key) is None
+    assert StreamingDetector.load(path).model.key == det.model.key
+
+def test_state_lock_serializes_updates(tmp_path):
+    import threading
+    path = str(tmp_path / "stream.joblib")
+    entered = threading.Event()
+    order = []
+
+    def second():
+        entered.wait()
+        with state_lock(path):
+            order.append("second")
+
+    t = threading.Thread(target=second)
+    t.start()
+    with state_lock(path):
+        entered.set()
+        t.join(timeout=0.2)
+        order.append("first")
+    t.join()
+    assert order == ["first", "second"]
@@ -0,0 +1,15 @@
+import pandas as pd
+from ml.cost_io import load_cost_csv
+from ml.synth import generate_costs
+
+def test_generator_is_seeded_and_labeled():
+    a = generate_costs(n_services=12, n_days=60, seed=5, spike_rate=0.05)
+    b = generate_costs(n_services=12, n_days=60, seed=5, spike_rate=0.05)
+    pd.testing.assert_frame_equal(a, b)
+    assert len(a) == 12 * 60
+    assert a["is_spike"].any()
+    assert not a.loc[a["date"] < "2025-01-08", "is_spike"].any()
+    assert (a["cost"] >= 0).all()
+
+    loaded = load_cost_csv(a.drop(columns=["is_spike"]))
+    assert (loaded["service"].to_numpy() == a["service"].to_numpy()).all()
@@ -0,0 +1,34 @@
+import subprocess
+import sys
+import joblib
+import numpy as np
+from fastapi.testclient import TestClient
+from app import warmup
+from app.jobs import JobManager
+from app.main import app
+from ml.detect import DetectConfig
+from ml.model import ModelStore, fit_model
+
+def test_api_import_defers_heavy_libraries():
+    code = "import sys, app.main; print('sklearn' in sys.modules, 'scipy.signal' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.split() == ["False", "False"]
+
+def test_warm_up_preloads_models_and_reports_ready(tmp_path):
+    store = ModelStore(path=str(tmp_path))
+    store.put(fit_model(np.random.default_rng(0).normal(size=(50, 3)), DetectConfig(n_estimators=5), key="k1"))
+    joblib.dump({"model_key": "k1", "states": {}}, tmp_path / "stream_state.joblib")  # not a model
+    fresh = ModelStore(path=str(tmp_path))
+    assert fresh.preload(limit=4) == 1 and fresh.preload(limit=0) == 0
+
+    state = warmup.warm_up(fresh)
+    assert state["status"] == warmup.READY and state["seconds"] is not None
+    assert warmup.warm_up_in_background(fresh) is None  # once per process
+    r = TestClient(app).get("/health/ready")
+    assert r.status_code == 200 and r.json()["status"] == warmup.READY
+
+def test_job_pool_is_created_on_first_use():
+    jobs = JobManager(max_workers=1, executor="thread")
+    assert jobs._pool is None
+    assert jobs.pool() is jobs.pool()
+    jobs.shutdown()
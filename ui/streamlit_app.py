@@ -1,9 +1,15 @@
+import hashlib
 import io
+import os
+import sys
+
 import pandas as pd
-import numpy as np
 import requests
 import streamlit as st
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml.cube import CostCube  # noqa: E402
+
 # ✅ MUST be first Streamlit command
 st.set_page_config(page_title="Cloud Cost Spike Detector (FinOps ML)", layout="wide")
 
@@ -91,6 +97,7 @@ monthly_budget = st.sidebar.number_input("Monthly Budget (optional)", min_value=
 st.sidebar.subheader("View Controls")
 show_service_breakdown = st.sidebar.checkbox("Show service breakdown charts", value=True)
 show_anomaly_tables = st.sidebar.checkbox("Show anomaly tables", value=True)
+top_k = int(st.sidebar.number_input("Top anomalies to show", min_value=1, max_value=5000, value=50, step=10))
 
 # ----------------------------
 # Upload CSV
@@ -106,72 +113,113 @@ if not content or len(content) == 0:
     st.error("Uploaded file is empty. Please upload a valid CSV.")
     st.stop()
 
+digest = hashlib.sha256(content).hexdigest()
+
+# Parsed rows (shared, read-only) and the day x service cube are built once per upload,
+# keyed on the content hash; every widget change below only slices the cached cube.
+@st.cache_resource(max_entries=4, show_spinner="Parsing CSV...")
+def load_costs(digest: str, _content: bytes) -> pd.DataFrame:
+    df = pd.read_csv(io.BytesIO(_content))
+    missing = {"date", "service", "cost"} - set(df.columns)
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {', '.join(sorted(missing))}")
+    df = df[["date", "service", "cost"]].copy()
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    df["service"] = df["service"].astype(str)
+    df["cost"] = pd.to_numeric(df["cost"], errors="coerce")
+    return df.dropna(subset=["date", "service", "cost"]).sort_values("date").reset_index(drop=True)
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_cube(digest: str, _df: pd.DataFrame) -> CostCube:
+    return CostCube.from_costs(_df)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def raw_preview(digest: str, start, end, services: tuple, _df: pd.DataFrame, rows: int = 200) -> pd.DataFrame:
+    mask = (_df["date"] >= start) & (_df["date"] <= end) & _df["service"].isin(services)
+    return _df[mask].head(rows)
+
 try:
-    df = pd.read_csv(io.BytesIO(content))
+    df = load_costs(digest, content)
 except Exception as e:
     st.error(f"Could not read CSV: {e}")
     st.stop()
 
-required_cols = {"date", "service", "cost"}
-missing = required_cols - set(df.columns)
-if missing:
-    st.error(f"CSV is missing required columns: {', '.join(sorted(missing))}")
-    st.stop()
-
-# Normalize types
-df = df.copy()
-df["date"] = pd.to_datetime(df["date"], errors="coerce")
-df["service"] = df["service"].astype(str)
-df["cost"] = pd.to_numeric(df["cost"], errors="coerce")
-
-df = df.dropna(subset=["date", "service", "cost"])
 if df.empty:
     st.error("No valid rows found after parsing. Ensure date/service/cost are valid.")
     st.stop()
 
+full_cube = load_cube(digest, df)
+
 # Optional filters
-min_d, max_d = df["date"].min(), df["date"].max()
+min_d, max_d = full_cube.days.min(), full_cube.days.max()
 date_range = st.sidebar.date_input("Date range", value=(min_d.date(), max_d.date()))
+start, end = min_d, max_d
 if isinstance(date_range, tuple) and len(date_range) == 2:
     start, end = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
-    df = df[(df["date"] >= start) & (df["date"] <= end)]
+dated = full_cube.slice(start, end)
 
-services = sorted(df["service"].unique().tolist())
-selected_services = st.sidebar.multiselect("Services", services, default=services)
-df = df[df["service"].isin(selected_services)]
+all_services = [str(s) for s, n in zip(dated.services, dated.counts.sum(axis=0)) if n > 0]
+selected_services = st.sidebar.multiselect("Services", all_services, default=all_services)
+cube = dated.slice(services=selected_services)
 
-if df.empty:
+if cube.empty:
     st.warning("No data after filters. Adjust date range/services.")
     st.stop()
 
+# ----------------------------
+# API helpers
+# ----------------------------
+def dataset_id() -> str:
+    # register the upload with the API once per content hash; later clicks send only the id
+    key = f"dataset:{api_url}:{digest}"
+    if key not in st.session_state:
+        files = {"file": ("costs.csv", content, "text/csv")}
+        r = requests.post(f"{api_url}/datasets", files=files, timeout=60)
+        r.raise_for_status()
+        st.session_state[key] = r.json()["dataset_id"]
+    return st.session_state[key]
+
+def post_dataset(path: str, **params) -> requests.Response:
+    r = requests.post(f"{api_url}{path}", params={"dataset_id": dataset_id(), **params}, timeout=30)
+    if r.status_code == 404:  # expired on the API side: register again
+        st.session_state.pop(f"dataset:{api_url}:{digest}", None)
+        r = requests.post(f"{api_url}{path}", params={"dataset_id": dataset_id(), **params}, timeout=30)
+    return r
+
+def fetch_forecast(services: tuple, as_of: pd.Timestamp) -> dict:
+    # per-service forecast from the API, memoized per filter and budget for this session
+    key = f"forecast:{api_url}:{digest}:{hash(services)}:{as_of.date()}:{monthly_budget}"
+    if key not in st.session_state:
+        params = {"end": str(as_of.date()), "horizon": 30}
+        if monthly_budget and monthly_budget > 0:
+            params["budget"] = monthly_budget
+        if len(services) < len(all_services):
+            params["services"] = list(services)
+        r = post_dataset("/forecast", **params)
+        r.raise_for_status()
+        st.session_state[key] = r.json()
+    return st.session_state[key]
+
 # ----------------------------
 # Executive summary calculations
 # ----------------------------
 # Daily aggregation (total across services)
-tmp = df.copy()
-tmp["day"] = pd.to_datetime(tmp["date"]).dt.date
+daily = cube.daily()
 
-daily = (
-    tmp.groupby("day", as_index=False)["cost"]
-    .sum()
-    .rename(columns={"cost": "daily_cost"})
-)
-
-daily["day"] = pd.to_datetime(daily["day"])
-
-total_spend = float(daily["daily_cost"].sum())
-days = int(daily["day"].nunique())
-service_count = int(df["service"].nunique())
+total_spend = float(daily.sum())
+days = int(len(daily))
+service_count = int((cube.counts.sum(axis=0) > 0).sum())
 
-avg_daily = float(daily["daily_cost"].mean()) if days else 0.0
-latest_day = daily["day"].max()
-latest_spend = float(daily.loc[daily["day"] == latest_day, "daily_cost"].sum())
+avg_daily = float(daily.mean()) if days else 0.0
+latest_day = daily.index.max()
+latest_spend = float(daily.iloc[-1])
 
-# Forecast (simple burn-rate forecast)
-# If data spans within a month, forecast to month end. If not, still show projected monthly burn.
-month_end = (latest_day + pd.offsets.MonthEnd(0)).normalize()
-days_left = max((month_end - latest_day).days, 0)
-forecast_eom = total_spend + (avg_daily * days_left)
+# Forecast: per-service month-end projection and budget risk computed by the API
+try:
+    forecast = fetch_forecast(tuple(selected_services), latest_day)
+except Exception as e:
+    forecast = None
+    st.sidebar.warning(f"Forecast unavailable: {e}")
 
 def money(x: float) -> str:
     return f"{symbol}{x:,.2f}"
@@ -185,10 +233,11 @@ k1.metric("Total Spend (Selected)", money(total_spend))
 k2.metric("Services", f"{service_count}")
 k3.metric("Days", f"{days}")
 k4.metric("Avg Daily Burn", money(avg_daily))
-k5.metric("Forecast (EOM)", money(forecast_eom))
-if monthly_budget and monthly_budget > 0:
-    pct = (forecast_eom / monthly_budget) * 100.0
-    k6.metric("Budget Risk", f"{pct:.0f}%", delta=f"{money(forecast_eom - monthly_budget)} vs budget")
+k5.metric("Forecast (EOM)", money(forecast["total"]["forecast_eom"]) if forecast else "n/a")
+if forecast and "budget" in forecast:
+    budget = forecast["budget"]
+    k6.metric("Budget Risk", f"{budget['pct_of_budget']:.0f}%",
+              delta=f"{money(budget['forecast_eom'] - budget['monthly_budget'])} vs budget")
 else:
     k6.metric("Latest Day Spend", money(latest_spend))
 
@@ -198,31 +247,29 @@ st.divider()
 # Trend charts (VP-friendly)
 # ----------------------------
 st.subheader("Spend Trend")
-trend_df = daily.set_index("day")[["daily_cost"]].rename(columns={"daily_cost": "Daily Spend"})
+trend_df = daily.to_frame().rename(columns={"daily_cost": "Daily Spend"})
+if forecast:
+    ahead = pd.Series(forecast["daily"]["forecast"], index=pd.to_datetime(forecast["daily"]["days"]), name="Forecast")
+    trend_df = trend_df.join(ahead, how="outer")
 st.line_chart(trend_df)
 
 if show_service_breakdown:
     st.subheader("Service Spend Breakdown")
-    by_day_service = df.copy()
-    by_day_service["day"] = by_day_service["date"].dt.date
-    pivot = by_day_service.pivot_table(index="day", columns="service", values="cost", aggfunc="sum", fill_value=0.0)
-    pivot.index = pd.to_datetime(pivot.index)
-    st.area_chart(pivot)
+    st.area_chart(cube.to_frame())
 
 # ----------------------------
 # Top services table
 # ----------------------------
 st.subheader("Top Services by Spend")
-svc = df.groupby("service", as_index=False)["cost"].sum().sort_values("cost", ascending=False)
-svc["share_pct"] = (svc["cost"] / max(total_spend, 1e-9)) * 100.0
-
-# Add a bit more business context
-last_day = df[df["date"].dt.date == latest_day.date()]
-last_day_svc = last_day.groupby("service", as_index=False)["cost"].sum().rename(columns={"cost": "last_day_cost"})
-
-svc = svc.merge(last_day_svc, on="service", how="left").fillna({"last_day_cost": 0.0})
-svc["avg_daily_cost"] = svc["cost"] / max(days, 1)
-svc = svc.rename(columns={"cost": "total_cost"})
+present = cube.counts.sum(axis=0) > 0
+svc = pd.DataFrame({
+    "service": [str(s) for s in cube.services[present]],
+    "total_cost": cube.values.sum(axis=0)[present],
+    "last_day_cost": cube.values[cube.days.get_loc(latest_day)][present],
+}).sort_values("total_cost", ascending=False)
+svc["share_pct"] = (svc["total_cost"] / max(total_spend, 1e-9)) * 100.0
+svc["avg_daily_cost"] = svc["total_cost"] / max(days, 1)
+svc = svc[["service", "total_cost", "share_pct", "last_day_cost", "avg_daily_cost"]]
 
 svc_display = svc.copy()
 svc_display["total_cost"] = svc_display["total_cost"].map(money)
@@ -243,52 +290,34 @@ with col1:
     st.subheader("Spike Detection (API)")
     if st.button("Detect anomalies"):
         try:
-            files = {"file": ("costs.csv", content, "text/csv")}
-            r = requests.post(f"{api_url}/detect", files=files, timeout=30)
+            # the API ranks by estimated impact and returns only the top rows
+            r = post_dataset("/detect", top_k=top_k, sort_by="impact")
             if r.status_code != 200:
                 st.error(r.text)
             else:
                 data = r.json()
                 anomalies = pd.DataFrame(data.get("anomalies", []))
-                st.success(f"Detected {data.get('total_anomalies', 0)} anomalies across {data.get('total_rows', 0)} rows.")
+                st.success(
+                    f"Detected {data.get('total_anomalies', 0)} anomalies across {data.get('total_rows', 0)} rows"
+                    f" (showing the top {len(anomalies)} by estimated impact)."
+                )
 
                 if not anomalies.empty and show_anomaly_tables:
-                    # Make it business-friendly
-                    # Expected columns from your pipeline: date, service, cost, anomaly_score, cost_pct_change, cost_rolling_mean_7
-                    for c in ["cost", "cost_rolling_mean_7", "cost_pct_change"]:
-                        if c in anomalies.columns:
-                            anomalies[c] = pd.to_numeric(anomalies[c], errors="coerce")
-
-                    if "date" in anomalies.columns:
-                        anomalies["date"] = pd.to_datetime(anomalies["date"], errors="coerce")
-
-                    # Add impact estimate (how much above baseline)
-                    if "cost_rolling_mean_7" in anomalies.columns and "cost" in anomalies.columns:
-                        anomalies["estimated_impact"] = (anomalies["cost"] - anomalies["cost_rolling_mean_7"]).clip(lower=0)
-                    else:
-                        anomalies["estimated_impact"] = np.nan
-
-                    # Sort: most expensive spikes first
-                    sort_col = "estimated_impact" if "estimated_impact" in anomalies.columns else "cost"
-                    anomalies = anomalies.sort_values(sort_col, ascending=False)
-
                     # Pretty display
                     disp = anomalies.copy()
-                    if "cost" in disp.columns:
-                        disp["cost"] = disp["cost"].map(lambda x: money(float(x)) if pd.notna(x) else "")
-                    if "cost_rolling_mean_7" in disp.columns:
-                        disp["cost_rolling_mean_7"] = disp["cost_rolling_mean_7"].map(lambda x: money(float(x)) if pd.notna(x) else "")
-                    if "estimated_impact" in disp.columns:
-                        disp["estimated_impact"] = disp["estimated_impact"].map(lambda x: money(float(x)) if pd.notna(x) else "")
+                    for c in ["cost", "cost_rolling_mean_7", "estimated_impact"]:
+                        if c in disp.columns:
+                            disp[c] = disp[c].map(lambda x: money(float(x)) if pd.notna(x) else "")
                     if "cost_pct_change" in disp.columns:
                         disp["cost_pct_change"] = disp["cost_pct_change"].map(lambda x: f"{float(x):.1f}%" if pd.notna(x) else "")
 
                     keep = [c for c in ["date", "service", "cost", "cost_rolling_mean_7", "cost_pct_change", "anomaly_score", "estimated_impact"] if c in disp.columns]
                     st.dataframe(disp[keep], use_container_width=True, hide_index=True)
 
-                    # Executive takeaway
-                    if "estimated_impact" in anomalies.columns:
-                        impact_total = float(pd.to_numeric(anomalies["estimated_impact"], errors="coerce").fillna(0).sum())
+                    # Executive takeaway: impact over all anomalies, not only the rows shown
+                    summary = post_dataset("/detect/summary")
+                    if summary.status_code == 200:
+                        impact_total = float(summary.json()["explanation"].get("total_estimated_impact", 0.0))
                         st.info(f"Estimated anomaly impact (above baseline): **{money(impact_total)}**")
 
                     # Recommended actions (simple but VP-friendly)
@@ -319,8 +348,7 @@ with col2:
     st.subheader("Executive Summary (API)")
     if st.button("Summary"):
         try:
-            files = {"file": ("costs.csv", content, "text/csv")}
-            r = requests.post(f"{api_url}/detect/summary", files=files, timeout=30)
+            r = post_dataset("/detect/summary")
             if r.status_code != 200:
                 st.error(r.text)
             else:
@@ -333,7 +361,6 @@ with col2:
 # Raw preview (still useful)
 # ----------------------------
 with st.expander("Raw Data Preview", expanded=False):
-    preview = df.copy()
-    preview = preview.sort_values("date")
+    preview = raw_preview(digest, start, end, tuple(selected_services), df).copy()
     preview["cost"] = preview["cost"].map(lambda x: money(float(x)))
-    st.dataframe(preview.head(200), use_container_width=True, hide_index=True)
\ No newline at end of file
+    st.dataframe(preview, use_container_width=True, hide_index=True)
\ No newline at end of file